@@ -0,0 +1,108 @@
+"""Load-aware adaptive inference resolution.
+
+Full-frame inference normally runs at the model's 640 px input. A person
+sitting close to a desk webcam fills most of the frame, and 320-416 px gives
+the same keypoints for a fraction of the cost. With
+``ERGOWISE_ADAPTIVE_IMGSZ=1`` every full-frame pass picks its size from
+``ERGOWISE_IMGSZ_STEPS``:
+
+* sessions with a known person box get the smallest size at which that box
+  still spans ``ERGOWISE_IMGSZ_PERSON_PX`` pixels of network input;
+* one-off uploads (and sessions that lost the person) run a probe at the
+  smallest size, which is kept when the person found is confident and large
+  enough, and is otherwise repeated at the size the probe says is needed;
+* whenever ``ERGOWISE_IMGSZ_QUEUE_SLO`` or more frames are waiting for
+  inference, the size drops one step per multiple of that depth, trading a
+  little accuracy for latency until the queue drains.
+
+The chosen size and the reason are added to /analyze responses under
+``"resolution"`` at every detail level and counted per model in /metrics.
+Results whose size was reduced for load (reason ``"load"``) are not put in
+the result cache, so a later upload of the same image gets its full pass. Exported graphs with
+fixed input dims (exported without ``--dynamic``) ignore the size.
+"""
+import os
+
+from pose_extract import best_pose
+
+ADAPTIVE_IMGSZ = os.environ.get("ERGOWISE_ADAPTIVE_IMGSZ", "0") == "1"
+IMGSZ_STEPS = tuple(sorted(int(v) for v in os.environ.get("ERGOWISE_IMGSZ_STEPS", "320,416,512,640").split(",") if v))
+# Long side, in network-input pixels, the person's box should keep
+IMGSZ_PERSON_PX = float(os.environ.get("ERGOWISE_IMGSZ_PERSON_PX", "256"))
+# Frames waiting for inference before the size steps down
+IMGSZ_QUEUE_SLO = int(os.environ.get("ERGOWISE_IMGSZ_QUEUE_SLO", "8"))
+
+# Appended to result cache namespaces: the size can change the answer
+ADAPTIVE_IMGSZ_KEY = (
+    f"|imgsz={','.join(map(str, IMGSZ_STEPS))}@{IMGSZ_PERSON_PX}/{IMGSZ_QUEUE_SLO}" if ADAPTIVE_IMGSZ else ""
+)
+
+
+class AdaptiveResolution:
+    """Picks a per-frame inference size from person size and queue depth"""
+
+    def __init__(self, steps=IMGSZ_STEPS, person_px=IMGSZ_PERSON_PX, queue_slo=IMGSZ_QUEUE_SLO, metrics=None):
+        self.steps = tuple(sorted(steps))
+        self.person_px = person_px
+        self.queue_slo = max(1, int(queue_slo))
+        self.metrics = metrics
+        self.choices = None
+        if metrics is not None:
+            self.choices = metrics.counter(
+                "ergowise_inference_imgsz_total", "Full-frame passes per adaptive inference size",
+                ("model", "imgsz", "reason"))
+
+    def needed(self, shape, box):
+        """Smallest step at which ``box`` keeps ``person_px`` pixels (largest if none does)"""
+        long_side = max(box[2] - box[0], box[3] - box[1])
+        if long_side <= 0:
+            return self.steps[-1]
+        want = self.person_px * max(shape[:2]) / long_side
+        for size in self.steps:
+            if size >= want:
+                return size
+        return self.steps[-1]
+
+    def cap(self, queued):
+        """Largest step allowed at this queue depth"""
+        down = min(len(self.steps) - 1, queued // self.queue_slo)
+        return self.steps[len(self.steps) - 1 - down]
+
+    async def predict(self, predictor, img, box=None, conf=0.25, iou=0.7, min_conf=0.25, model_name=None):
+        """Run ``predictor`` on a full frame at an adaptive size.
+
+        ``box`` is the person's previous box in this session, if any. Returns
+        (results, {"imgsz": size, "reason": why}).
+        """
+        cap = self.cap(predictor.queued)
+        if box is not None:
+            size = self.needed(img.shape, box)
+            reason = "session_box"
+            if size > cap:
+                size, reason = cap, "load"
+            results = await predictor.predict(img, conf=conf, iou=iou, imgsz=size)
+            return results, self._record(size, reason, model_name)
+
+        size = self.steps[0]
+        results = await predictor.predict(img, conf=conf, iou=iou, imgsz=size)
+        _, found, best_conf = best_pose(results)
+        want = self.steps[-1] if found is None or best_conf < min_conf else self.needed(img.shape, found)
+        if want <= size:
+            return results, self._record(size, "probe", model_name)
+        if cap <= size:
+            return results, self._record(size, "load", model_name)
+
+        rerun_size = min(want, cap)
+        rerun = await predictor.predict(img, conf=conf, iou=iou, imgsz=rerun_size)
+        if found is not None and best_pose(rerun)[1] is None:
+            # The larger pass lost a person the probe had
+            return results, self._record(size, "probe", model_name)
+        return rerun, self._record(rerun_size, "probe_rerun" if rerun_size == want else "load", model_name)
+
+    def _record(self, size, reason, model_name):
+        if self.choices is not None:
+            self.choices.inc((model_name or self.metrics.model_name, str(size), reason))
+        return {"imgsz": size, "reason": reason}
+
+    def status(self):
+        return {"steps": list(self.steps), "person_px": self.person_px, "queue_slo": self.queue_slo}
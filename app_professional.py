@@ -1,16 +1,39 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Header, Query, Request, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+import functools
 import os
+import time
+import uuid
+from typing import Optional
 # Ensure torch uses weights_only=False when loading trusted checkpoints.
 # This must be set before importing torch so the loader picks it up.
 os.environ['TORCH_WEIGHTS_ONLY'] = 'False'
 import numpy as np
-import cv2
-import torch
 
-from ultralytics import YOLO
+from batching import InferenceBatcher
+from adaptive_imgsz import ADAPTIVE_IMGSZ, ADAPTIVE_IMGSZ_KEY, AdaptiveResolution
+from cascade import CASCADE_KEY, CASCADE_MODELS, PoseCascade
+from execution import ExecutionLayer, Saturated
+from inference_server import INFERENCE_WORKERS, InferenceWorkerPool
+from backends import BACKEND, load_model
+from streaming import stream_analysis
+from tracking import PoseTracker
+from smoothing import SmootherRegistry
+from pose_archive import ARCHIVE_DIR, PoseArchive
+from pose_extract import best_pose, keypoint_dict
+from posture_batch import parse_keypoints
+import posture_report as reports
+from posture_rollups import GRAINS, ROLLUP_DB, PostureRollups
+from posture_rules import rulebook
+from preprocessing import decode_upload, keypoint_scale, preprocess_image, stats as preprocess_stats
+from readiness import ModelLoader, synthetic_frame, synthetic_jpeg
+from response_encoding import ResponseFormat
+from result_cache import ResultCache
+from recording import RECORD_DIR, RequestRecorder
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, PipelineMetrics, result_outcome
+from model_registry import ModelRegistry, UnknownModel
 
 app = FastAPI(title="Enhanced Posture API")
 
@@ -23,6 +46,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in sampling of real requests into a loadtest.py corpus (see recording.py)
+if RECORD_DIR:
+    app.add_middleware(RequestRecorder)
+
 # Load pose model. Options by accuracy (higher = more accurate but slower):
 # "yolov8n-pose.pt" (nano - fastest)
 # "yolov8s-pose.pt" (small - balanced)  
@@ -30,6 +57,11 @@ app.add_middleware(
 # "yolov8l-pose.pt" (large - best accuracy)
 # "yolo11n-pose.pt" (latest YOLO11 - improved architecture)
 MODEL_NAME = "yolov8n-pose.pt"  # Using nano for compatibility
+# Detection settings; also part of the result cache key
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+# Report style in posture_rules.toml
+RULE_PROFILE = "professional"
 
 # Create model with weights_only=False to bypass PyTorch security restriction
 
@@ -92,339 +124,428 @@ def register_safe_globals():
 # Run allowlisting for a set of expected classes. This reduces repeated
 # edits; keep this conservative and only register classes we expect in
 # trusted ultralytics checkpoints.
-register_safe_globals()
-try:
-    # Load model with explicit weights_only=False
-    import tempfile
-    import shutil
-    original_torch_load = torch.load
-    
-    def unsafe_load(*args, **kwargs):
-        kwargs['weights_only'] = False
-        return original_torch_load(*args, **kwargs)
-    
-    # Temporarily patch torch.load
-    torch.load = unsafe_load
-    model = YOLO(MODEL_NAME)
-    # Restore original function
-    torch.load = original_torch_load
-    print(f"✅ Successfully loaded {MODEL_NAME} model")
-except Exception as e:
-    print(f"❌ Error loading model: {e}")
-    # Fallback: create a mock model for testing
-    model = None
-
-def preprocess_image(img):
-    """Enhanced image preprocessing for better pose detection"""
-    # Resize to optimal input size while maintaining aspect ratio
-    h, w = img.shape[:2]
-    target_size = 640  # YOLO's optimal input size
-    
-    if max(h, w) > target_size:
-        scale = target_size / max(h, w)
-        new_w, new_h = int(w * scale), int(h * scale)
-        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA)
-    
-    # Enhance contrast for better keypoint detection
+model = None
+inference = None
+
+def load_pose_model():
+    """Load the checkpoint (or exported backend) and set up inference.
+
+    Runs on a background thread after startup (see readiness.py); returns
+    True when a model is available.
+    """
+    global model, inference
+    if BACKEND == "torch":
+        register_safe_globals()
     try:
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        
-        # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l = clahe.apply(l)
-        
-        img = cv2.merge([l, a, b])
-        img = cv2.cvtColor(img, cv2.COLOR_LAB2BGR)
-    except:
-        # Fallback to simpler enhancement if CLAHE fails
-        img = cv2.convertScaleAbs(img, alpha=1.1, beta=10)
-    
-    return img
-
-COCO_KPTS = [
-    "nose","left_eye","right_eye","left_ear","right_ear",
-    "left_shoulder","right_shoulder","left_elbow","right_elbow",
-    "left_wrist","right_wrist","left_hip","right_hip",
-    "left_knee","right_knee","left_ankle","right_ankle"
-]
-
-def angle_deg(p1, p2, p3):
-    a = np.array(p1) - np.array(p2)
-    b = np.array(p3) - np.array(p2)
-    na = np.linalg.norm(a); nb = np.linalg.norm(b)
-    if na == 0 or nb == 0: return None
-    cosang = np.clip(np.dot(a, b) / (na * nb), -1.0, 1.0)
-    return float(np.degrees(np.arccos(cosang)))
-
-def line_angle_from_vertical(p_top, p_bottom):
-    v = np.array(p_top) - np.array(p_bottom)
-    if np.linalg.norm(v) == 0: return None
-    vu = np.array([0, -1.0])
-    v = v / (np.linalg.norm(v) + 1e-9)
-    ang = np.degrees(np.arccos(np.clip(np.dot(v, vu), -1.0, 1.0)))
-    return float(ang)
-
-def midpoint(p, q):
-    return ((p[0]+q[0])/2.0, (p[1]+q[1])/2.0)
-
-def to_xyv(kpts_row):
-    pts = {}
-    for i, name in enumerate(COCO_KPTS):
-        x = float(kpts_row[3*i]); y = float(kpts_row[3*i+1]); v = float(kpts_row[3*i+2])
-        pts[name] = ((x, y), v)
-    return pts
-
-def safe(p_dict, key, min_confidence=0.4):
-    """Get keypoint with minimum confidence threshold"""
-    (xy, vis) = p_dict.get(key, ((None, None), 0.0))
-    return xy if vis > min_confidence else (None, None)
-
-def posture_report(k):
-    """Enhanced posture analysis with comprehensive professional feedback"""
-    def g(name, min_conf=0.4):
-        (xy, vis) = safe(k, name, min_conf)
-        return xy if vis > min_conf else (None, None)
-
-    # Get keypoints with confidence requirements
-    ls = g("left_shoulder", 0.5);  rs = g("right_shoulder", 0.5)
-    lh = g("left_hip", 0.5);       rh = g("right_hip", 0.5)
-    le = g("left_ear", 0.3);       re = g("right_ear", 0.3)
-    nose = g("nose", 0.5)
-    lk = g("left_knee", 0.4);      rk = g("right_knee", 0.4)
-    la = g("left_ankle", 0.3);     ra = g("right_ankle", 0.3)
-
-    sh_mid = midpoint(ls, rs) if None not in (ls[0], rs[0]) else (None, None)
-    hip_mid = midpoint(lh, rh) if None not in (lh[0], rh[0]) else (None, None)
-    ear_mid = midpoint(le, re) if None not in (le[0], re[0]) else (None, None)
-
-    torso_lean = line_angle_from_vertical(sh_mid, hip_mid) if None not in sh_mid+hip_mid else None
-    head_ref = ear_mid if None not in ear_mid else nose
-    head_tilt = line_angle_from_vertical(head_ref, sh_mid) if None not in head_ref+sh_mid else None
-
-    shoulder_drop = None
-    if None not in (ls[1], rs[1]):
-        shoulder_drop = float(rs[1] - ls[1])
-
-    pelvic_tilt = None
-    if None not in (lh[1], rh[1]):
-        pelvic_tilt = float(rh[1] - lh[1])
-
-    left_knee_angle = angle_deg(lh, lk, la) if None not in lh+lk+la else None
-    right_knee_angle = angle_deg(rh, rk, ra) if None not in rh+rk+ra else None
-
-    # Calculate body proportions for adaptive thresholds
-    body_height = None
-    shoulder_width = None
-    
-    if None not in sh_mid + hip_mid:
-        body_height = abs(sh_mid[1] - hip_mid[1])
-    if None not in (ls[0], rs[0]):
-        shoulder_width = abs(rs[0] - ls[0])
-    
-    # Adaptive thresholds
-    head_tilt_threshold = 12 if body_height and body_height > 200 else 10
-    torso_lean_threshold = 10 if body_height and body_height > 200 else 8
-    shoulder_threshold = max(15, shoulder_width * 0.08) if shoulder_width else 15
-    pelvis_threshold = max(15, shoulder_width * 0.08) if shoulder_width else 15
-
-    # Comprehensive analysis
-    good_observations = []
-    areas_to_improve = []
-    recommendations = []
-    posture_score = 100
-
-    # Analyze each aspect professionally
-    
-    # HEAD & NECK ANALYSIS
-    if head_tilt is not None:
-        if head_tilt <= 5:
-            good_observations.append("Head & Neck: Excellent head alignment with minimal forward lean.")
-        elif head_tilt <= head_tilt_threshold:
-            good_observations.append("Head & Neck: Good head positioning with slight forward lean that's within normal range.")
-        else:
-            severity = "significantly" if head_tilt > 20 else "moderately" if head_tilt > 15 else "slightly"
-            areas_to_improve.append(f"Head & Neck: Your head is {severity} leaning forward ({head_tilt:.1f}°). This can create neck and upper back strain over time.")
-            recommendations.append("Monitor Height: Raise your monitor so the top of the screen is at or slightly below eye level to keep your head upright.")
-            recommendations.append("Neck Breaks: Every 30 minutes, roll your shoulders back and stretch your neck gently.")
-            posture_score -= min(25, head_tilt * 1.5)
-
-    # TORSO & BACK ANALYSIS
-    if torso_lean is not None:
-        if torso_lean <= 3:
-            good_observations.append("Back Posture: Excellent spinal alignment with upright torso positioning.")
-        elif torso_lean <= torso_lean_threshold:
-            good_observations.append("Back Posture: Good overall posture with minor torso lean that's acceptable.")
-        else:
-            severity = "significantly rounded" if torso_lean > 15 else "moderately rounded" if torso_lean > 12 else "slightly rounded"
-            areas_to_improve.append(f"Back Posture: Your lower back looks {severity} ({torso_lean:.1f}° from vertical); lumbar support could be better engaged.")
-            recommendations.append("Back Support: Adjust your chair's lumbar support or add a small pillow to maintain the natural curve of your lower back.")
-            recommendations.append("Core Engagement: Sit back into the chair, engage your core slightly — this reduces slouching.")
-            posture_score -= min(20, torso_lean * 1.2)
-
-    # SHOULDER ANALYSIS
-    if shoulder_drop is not None:
-        if abs(shoulder_drop) <= 8:
-            good_observations.append("Shoulder Position: Well-balanced shoulder height with minimal asymmetry.")
-        elif abs(shoulder_drop) <= shoulder_threshold:
-            good_observations.append("Shoulder Position: Shoulders are relatively level with minor asymmetry.")
-        else:
-            side = "right" if shoulder_drop > 0 else "left"
-            severity = "significantly" if abs(shoulder_drop) > 25 else "moderately" if abs(shoulder_drop) > 20 else "slightly"
-            areas_to_improve.append(f"Shoulder Position: {side.capitalize()} shoulder is {severity} lower, possibly due to keyboard/mouse placement or muscle tension.")
-            recommendations.append("Keyboard & Mouse: Ensure they are close enough so your elbows stay at ~90° and shoulders stay relaxed.")
-            recommendations.append("Shoulder Breaks: Roll your shoulders back and down every 20 minutes to release tension.")
-            posture_score -= min(15, abs(shoulder_drop) * 0.8)
-
-    # PELVIC ANALYSIS
-    if pelvic_tilt is not None:
-        if abs(pelvic_tilt) <= 8:
-            good_observations.append("Hip Alignment: Excellent pelvic positioning with level hip placement.")
-        elif abs(pelvic_tilt) <= pelvis_threshold:
-            good_observations.append("Hip Alignment: Good pelvic stability with minor tilt within normal range.")
-        else:
-            side = "right" if pelvic_tilt > 0 else "left"
-            areas_to_improve.append(f"Hip Alignment: Pelvis tilts toward the {side}, which may indicate uneven weight distribution or chair adjustment needed.")
-            recommendations.append("Chair Adjustment: Ensure your chair height allows both feet flat on floor and even weight distribution.")
-            recommendations.append("Posture Reset: Sit back fully in chair and center your weight evenly on both hips.")
-            posture_score -= min(15, abs(pelvic_tilt) * 0.8)
-
-    # GENERAL GOOD PRACTICES (always include some)
-    if not any("chair" in obs.lower() for obs in good_observations):
-        good_observations.append("Chair & Back Support: You are using a chair with a backrest that supports your spine.")
-    
-    if not any("feet" in obs.lower() for obs in good_observations):
-        good_observations.append("Feet Position: Feet seem to be flat on the floor (good for balance).")
-
-    if not any("desk" in obs.lower() for obs in good_observations):
-        good_observations.append("Desk Height: Wrists are relatively level with the keyboard, avoiding extreme bending.")
-
-    # GENERAL RECOMMENDATIONS (ergonomic best practices)
-    if not recommendations:
-        recommendations.append("Maintain Excellence: Continue your good posture habits with regular movement breaks every 30 minutes.")
-    
-    recommendations.append("Hydration & Movement: Take a 2-minute walk every hour to promote circulation and reset posture.")
-    recommendations.append("Screen Distance: Maintain 20-26 inches from your monitor to reduce eye strain and forward head posture.")
+        # The torch checkpoint, or with ERGOWISE_BACKEND=onnx|openvino an exported graph
+        # (see backends.py) called exactly like the YOLO model; only "torch" imports torch
+        model = load_model(MODEL_NAME)
+        print(f"✅ Successfully loaded {MODEL_NAME} model ({BACKEND} backend)")
+    except Exception as e:
+        print(f"❌ Error loading model: {e}")
+        model = None
 
-    # Calculate final score
-    posture_score = max(0, round(posture_score))
-    
-    # Overall assessment
-    if posture_score >= 90:
-        grade = "Excellent"
-        color = "#10b981"
-        overall_summary = "Outstanding posture! You demonstrate excellent ergonomic awareness."
-    elif posture_score >= 75:
-        grade = "Good"  
-        color = "#3b82f6"
-        overall_summary = "Good posture with minor areas for improvement. Small adjustments will enhance comfort."
-    elif posture_score >= 60:
-        grade = "Fair"
-        color = "#f59e0b"
-        overall_summary = "Moderate posture concerns. Addressing key issues will significantly improve your comfort."
+    if model is None:
+        return False
+    if INFERENCE_WORKERS > 0:
+        # Inference-server mode: pinned worker processes each own a model replica.
+        # The model above is still loaded once here so the checkpoint is downloaded
+        # and validated before the workers start.
+        inference = InferenceWorkerPool(MODEL_NAME)
     else:
-        grade = "Needs Improvement"
-        color = "#ef4444"
-        overall_summary = "Multiple posture concerns detected. Focus on ergonomic adjustments for better health."
-
-    return {
-        "metrics": {
-            "head_tilt_deg": head_tilt,
-            "torso_lean_deg": torso_lean,
-            "shoulder_drop_px": shoulder_drop,
-            "pelvic_drop_px": pelvic_tilt,
-            "left_knee_angle_deg": left_knee_angle,
-            "right_knee_angle_deg": right_knee_angle
-        },
-        "posture_score": posture_score,
-        "grade": grade,
-        "grade_color": color,
-        "overall_summary": overall_summary,
-        "good_observations": good_observations,
-        "areas_to_improve": areas_to_improve,
-        "recommendations": recommendations,
-        "confidence_metrics": {
-            "body_height": body_height,
-            "shoulder_width": shoulder_width,
-            "adaptive_thresholds": {
-                "head_tilt": head_tilt_threshold,
-                "torso_lean": torso_lean_threshold,
-                "shoulder_drop": shoulder_threshold,
-                "pelvis_tilt": pelvis_threshold
-            }
-        }
-    }
+        # Collect concurrent requests into shared batched forward passes
+        inference = InferenceBatcher(model, executor=execution.cpu_pool)
+    if CASCADE_MODELS:
+        # Escalate low-confidence frames to larger models (see cascade.py)
+        try:
+            inference = PoseCascade(MODEL_NAME, inference, executor=execution.cpu_pool, metrics=metrics)
+        except Exception as e:
+            print(f"❌ Could not load cascade models, serving {MODEL_NAME} alone: {e}")
+    # Requests can pick other allowed models with ?model= (see model_registry.py)
+    registry.pin(MODEL_NAME, inference, model)
+    if isinstance(inference, PoseCascade):
+        # ?model= for another cascade stage gets that stage, not a second copy of its model
+        for name, stage in inference.stages:
+            if name != MODEL_NAME:
+                registry.share(name, stage, getattr(stage, "model", None))
+    return True
+
+# Blocking decode/preprocess/inference runs on a sized pool, not the event loop
+execution = ExecutionLayer()
+# Other pose models, loaded on first request and unloaded when idle or over budget
+registry = ModelRegistry(execution.cpu_pool)
+
+# Per-session tracking state for streams (crop-only pose between full detections)
+tracker = PoseTracker()
+# Per-session keypoint/metric filters so streamed scores do not jitter
+smoothers = SmootherRegistry()
+# Repeat uploads of the same bytes are answered without decode or inference
+result_cache = ResultCache(f"{os.path.basename(__file__)}|{MODEL_NAME}|conf={CONF_THRESHOLD}|iou={IOU_THRESHOLD}{CASCADE_KEY}{ADAPTIVE_IMGSZ_KEY}")
+# Per-stage latency histograms, outcome counters and load gauges for /metrics
+metrics = PipelineMetrics(MODEL_NAME)
+metrics.gauge("ergowise_in_flight_requests", "Requests admitted and not yet answered", lambda: execution.pending)
+metrics.gauge("ergowise_inference_queue_depth", "Frames waiting for inference", lambda: inference.queued if inference is not None else 0)
+# Per-frame inference size from person size and queue depth (see adaptive_imgsz.py)
+adaptive_imgsz = AdaptiveResolution(metrics=metrics) if ADAPTIVE_IMGSZ else None
+# Opt-in binary archive of every scored frame (see pose_archive.py)
+archive = PoseArchive() if ARCHIVE_DIR else None
+# Opt-in per-session/per-user minute, hour and day aggregates (see posture_rollups.py)
+rollups = PostureRollups() if ROLLUP_DB else None
+
+# Scoring lives in posture_report.py so the report process pool never imports this module
+posture_report = functools.partial(reports.posture_report, profile=RULE_PROFILE)
+score_keypoints = functools.partial(reports.score_keypoints, profile=RULE_PROFILE)
 
 class Health(BaseModel):
     status: str
 
+async def warm_up():
+    """One synthetic upload through decode, inference and scoring, plus a
+    tracker-sized crop so the streaming path is warm too"""
+    await analyze_bytes(synthetic_jpeg())
+    crop = synthetic_frame((tracker.imgsz, tracker.imgsz))
+    await inference.predict(crop, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, imgsz=tracker.imgsz)
+    if adaptive_imgsz is not None:
+        # Each adaptive size once, so exported graphs have seen every input shape
+        for size in adaptive_imgsz.steps:
+            await inference.predict(synthetic_frame(), conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, imgsz=size)
+
+loader = ModelLoader(load_pose_model, warm_up)
+
+@app.on_event("startup")
+async def start_model_loading():
+    # Load in the background so uvicorn binds immediately; /ready tracks progress
+    loader.start()
+    registry.start()
+
 @app.get("/health", response_model=Health)
 def health():
-    return {"status": "ok"}
+    return {"status": "ok" if loader.ready else loader.state}
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before"""
+    return JSONResponse(status_code=200 if loader.ready else 503, content={"model_name": MODEL_NAME, **loader.status()})
 
 @app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
+async def analyze(request: Request, file: UploadFile = File(...), session_id: Optional[str] = None,
+                  model_name: Optional[str] = Query(None, alias="model"), x_model: Optional[str] = Header(None),
+                  user_id: Optional[str] = None, detail: Optional[str] = None,
+                  fmt: Optional[str] = Query(None, alias="format")):
+    started = time.perf_counter()
+    try:
+        out = ResponseFormat.negotiate(request.headers, detail, fmt)
+    except ValueError as e:
+        metrics.outcome("rejected")
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    if loader.loading:
+        metrics.outcome("rejected")
+        return JSONResponse(status_code=503, content={"error": "Model is loading, please retry shortly"}, headers={"Retry-After": "2"})
     if model is None:
         return {"detected": False, "message": "Model not loaded. Please check server logs."}
+    try:
+        model_name = registry.check(model_name or x_model)
+    except UnknownModel as e:
+        metrics.outcome("rejected")
+        return JSONResponse(status_code=400, content={"error": str(e)})
     
     data = await file.read()
-    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    metrics.lap("read", started, model=model_name)
+    # Session frames depend on tracking/smoothing state, so only one-off uploads are cached;
+    # the rule table digest keeps cached reports from outliving a rules edit
+    variant = f"{'' if model_name == MODEL_NAME else model_name}|rules={rulebook.current().digest}"
+    if not out.full:
+        variant += f"|detail={out.detail}"
+    key = None if session_id else result_cache.key(data, variant)
+    if key is not None:
+        cached = await result_cache.lookup(key, execution.run)
+        if cached is not None:
+            return respond(cached, started, model_name, out)
+
+    try:
+        with execution.admit():
+            result = await analyze_bytes(data, session_id, model_name, out.detail)
+    except Saturated:
+        metrics.outcome("rejected", model=model_name)
+        return JSONResponse(status_code=503, content={"error": "Server busy, please retry shortly"}, headers={"Retry-After": "1"})
+    # Errors (JSONResponse, "Analysis failed") are not cached so a retry can succeed, nor are
+    # results run at a size reduced for load, so the same image later gets its full-size pass
+    if (key is not None and isinstance(result, dict) and not result.get("message", "").startswith("Analysis failed")
+            and result.get("resolution", {}).get("reason") != "load"):
+        result_cache.put(key, result)
+    if rollups is not None and isinstance(result, dict) and result.get("detected"):
+        rollups.add(result, session_id, user_id)
+    return respond(result, started, model_name, out)
+
+def respond(result, started, model_name=None, out=ResponseFormat()):
+    """Serialize an /analyze result in the negotiated encoding, recording the
+    outcome, serialization time and total latency"""
+    metrics.outcome(result_outcome(result), model=model_name)
+    if isinstance(result, dict):
+        t = time.perf_counter()
+        result = out.response(result)
+        metrics.lap("serialize", t, model=model_name)
+    metrics.lap("total", started, model=model_name)
+    return result
+
+@app.post("/analyze/keypoints")
+async def analyze_keypoints(request: Request, session_id: Optional[str] = None, user_id: Optional[str] = None,
+                            detail: Optional[str] = None, fmt: Optional[str] = Query(None, alias="format")):
+    """Score poses from an on-device model: no upload decode, no inference.
+
+    The body is a JSON ``[17, 3]`` or ``[N, 17, 3]`` array (optionally under
+    ``"keypoints"``), or raw float32 ``[N, 17, 3]`` bytes, in COCO_KPTS order.
+    One JSON pose returns one /analyze-style result; a batch returns
+    ``{"results": [...]}`` in input order. ``detail`` and ``format`` work as
+    for /analyze.
+    """
+    started = time.perf_counter()
+    try:
+        out = ResponseFormat.negotiate(request.headers, detail, fmt)
+    except ValueError as e:
+        metrics.outcome("rejected", "keypoints")
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    body = await request.body()
+    try:
+        kpts, single = parse_keypoints(body, request.headers.get("content-type", ""))
+    except ValueError as e:
+        metrics.outcome("failed", "keypoints")
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    metrics.lap("read", started)
+
+    try:
+        with execution.admit():
+            t = time.perf_counter()
+            results = await execution.run_report(score_keypoints, kpts, out.detail)
+            metrics.lap("report", t)
+    except Saturated:
+        metrics.outcome("rejected", "keypoints")
+        return JSONResponse(status_code=503, content={"error": "Server busy, please retry shortly"}, headers={"Retry-After": "1"})
+    for row, result in zip(kpts, results):
+        if archive is not None:
+            archive.append(session_id, row, result)
+        if rollups is not None:
+            rollups.add(result, session_id, user_id)
+    metrics.outcome("detected", "keypoints")
+
+    t = time.perf_counter()
+    response = out.response(results[0] if single else {"results": results})
+    metrics.lap("serialize", t)
+    metrics.lap("total", started)
+    return response
+
+def decode_image(data):
+    """Decode and preprocess an upload.
+
+    Returns (image, keypoint scale), or (None, None) for invalid images. Large
+    JPEGs are decoded at reduced resolution; the scale maps keypoints on the
+    returned image back to the original upload.
+    """
+    t = time.perf_counter()
+    img, original_size = decode_upload(data)
+    t = metrics.lap("decode", t)
     if img is None:
-        return JSONResponse(status_code=400, content={"error": "Invalid image"})
+        return None, None
     
     # Apply enhanced preprocessing
     img = preprocess_image(img)
+    metrics.lap("preprocess", t)
+    return img, keypoint_scale(original_size, img.shape)
+
+async def detect_pose(img, session_id=None, model_name=None):
+    """Run pose inference on a preprocessed image and pick the best person.
+
+    With a session id, frames after a successful detection only run pose on a
+    crop around the previous person box; full detection runs periodically and
+    whenever the person is lost. Returns (float32[17, 3] keypoints,
+    detection confidence, resolution); keypoints are None when nobody was
+    detected with sufficient confidence, and resolution is the adaptive
+    inference size used (None unless ERGOWISE_ADAPTIVE_IMGSZ is on).
+    ``model_name`` picks a registry model (None = MODEL_NAME).
+    """
+    region = tracker.region(session_id, img.shape) if session_id else None
+    frame = img if region is None else img[region[1]:region[3], region[0]:region[2]]
+    imgsz = None if region is None else tracker.imgsz
+    resolution = None
+
+    # Run inference with improved settings
+    t = time.perf_counter()
+    async with registry.use(model_name) as predictor:
+        if region is None and adaptive_imgsz is not None:
+            # Full frame: size from the session's last box, or a low-res probe
+            box = tracker.box(session_id) if session_id else None
+            results, resolution = await adaptive_imgsz.predict(
+                predictor, frame, box, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, min_conf=0.2, model_name=model_name)
+        else:
+            results = await predictor.predict(frame, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, imgsz=imgsz)
+            if adaptive_imgsz is not None:
+                resolution = {"imgsz": imgsz, "reason": "track_crop"}
+    t = metrics.lap("inference", t, model=model_name)
+    kpts, box, best_conf = best_pose(results)
+    metrics.lap("extract", t, model=model_name)
+
+    if kpts is None or best_conf < 0.2:  # Lower threshold for nano model
+        if session_id:
+            tracker.update(session_id, None, full=region is None)
+            if region is not None:
+                # Lost the person inside the crop: re-detect on the full frame
+                return await detect_pose(img, session_id, model_name)
+        return None, best_conf, resolution
+    if region is not None:
+        # Map crop coordinates back onto the full frame
+        kpts[:, :2] += region[:2]
+        box = box + np.array([region[0], region[1]] * 2, dtype=box.dtype)
+    if session_id:
+        tracker.update(session_id, box, full=region is None)
+    return kpts, best_conf, resolution
+
+async def score_pose(kpts, session_id=None, detail="full"):
+    """Score keypoints; streaming sessions are smoothed across frames first.
+
+    Returns the (possibly smoothed) keypoint dict and the posture report.
+    """
+    t = time.perf_counter()
+    if not session_id:
+        kdict = keypoint_dict(kpts)
+        report = await execution.run_report(posture_report, kdict, None, detail)
+    else:
+        smoother = smoothers.get(session_id)
+        kpts = smoother.filter_array(kpts)
+        kdict = keypoint_dict(kpts)
+        # Session state lives in this process, so stay off the report process pool
+        report = await execution.run(posture_report, kdict, smoother, detail)
+    metrics.lap("report", t)
+    if archive is not None and loader.ready:  # warm-up frames are not archived
+        archive.append(session_id, kpts, report)
+    return kdict, report
+
+async def analyze_bytes(data, session_id=None, model_name=None, detail="full"):
+    """Decode, run pose inference and score one uploaded image"""
+    img, scale = await execution.run(decode_image, data)
+    if img is None:
+        return JSONResponse(status_code=400, content={"error": "Invalid image"})
     
     try:
-        # Run inference with improved settings
-        results = model(img, conf=0.25, iou=0.7, verbose=False)
-        
-        best = None; best_conf = -1; best_keypoints = None
-        for r in results:
-            if hasattr(r, "keypoints") and r.keypoints is not None:
-                for i, (kp, conf) in enumerate(zip(r.keypoints.xy, r.boxes.conf if r.boxes is not None else [])):
-                    c = float(conf) if conf is not None else 0.0
-                    if c > best_conf:
-                        best_conf = c
-                        best = kp.squeeze(0).cpu().numpy()
-                        # Get confidence scores for each keypoint
-                        try:
-                            best_keypoints = r.keypoints.conf[i].cpu().numpy()
-                        except:
-                            best_keypoints = np.ones((17,)) * 0.5
-                            
-        if best is None or best_conf < 0.2:  # Lower threshold for nano model
+        kpts, best_conf, resolution = await detect_pose(img, session_id, model_name)
+        if kpts is None:
             return {"detected": False, "message": "No person detected with sufficient confidence"}
-            
-        # Use the best keypoint confidences we found
-        confs = best_keypoints if best_keypoints is not None else np.ones((17,)) * 0.5
-        
-        flat = []
-        for i in range(17):
-            flat += [best[i,0], best[i,1], confs[i]]
-        kdict = to_xyv(flat)
-        report = posture_report(kdict)
+        kdict, report = await score_pose(kpts, session_id, detail)
+        if resolution is not None:
+            report["resolution"] = resolution
+        if detail != "full":
+            return {"detected": True, **report}
         
         # Add detection metadata
         report.update({
             "detected": True,
             "keypoints": kdict,
+            "keypoint_scale": scale,
             "detection_confidence": float(best_conf),
             "model_info": {
-                "model_name": MODEL_NAME,
+                "model_name": model_name or MODEL_NAME,
                 "preprocessing": "enhanced_clahe",
-                "inference_settings": {"conf": 0.25, "iou": 0.7}
+                "inference_settings": {"conf": CONF_THRESHOLD, "iou": IOU_THRESHOLD}
             }
         })
         
         return report
         
+    except Saturated:
+        # No capacity (e.g. every inference worker is down): the handler answers 503
+        raise
     except Exception as e:
         return {"detected": False, "message": f"Analysis failed: {str(e)}"}
 
+async def analyze_frame(data, session_id=None, model_name=None, user_id=None):
+    """Streaming pipeline for one frame: returns the posture report, or None"""
+    with execution.admit():
+        img, _ = await execution.run(decode_image, data)
+        if img is None:
+            metrics.outcome("failed", "ws", model_name)
+            raise ValueError("Invalid image")
+        kpts, _, _ = await detect_pose(img, session_id, model_name)
+        if kpts is None:
+            metrics.outcome("undetected", "ws", model_name)
+            return None
+        _, report = await score_pose(kpts, session_id, "metrics")
+        metrics.outcome("detected", "ws", model_name)
+        if rollups is not None:
+            rollups.add(report, session_id, user_id)
+        return report
+
+@app.websocket("/ws/analyze")
+async def ws_analyze(websocket: WebSocket):
+    """Continuous monitoring: JPEG frames in, compact metric deltas out"""
+    if loader.loading:
+        await websocket.close(code=1013, reason="Model is loading")
+        return
+    if model is None:
+        await websocket.close(code=1011, reason="Model not loaded")
+        return
+    try:
+        model_name = registry.check(websocket.query_params.get("model"))
+    except UnknownModel as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    # Each connection is its own tracking session unless the client names one
+    session_id = websocket.query_params.get("session_id") or uuid.uuid4().hex
+    user_id = websocket.query_params.get("user_id")
+    try:
+        await stream_analysis(websocket, functools.partial(
+            analyze_frame, session_id=session_id, model_name=model_name, user_id=user_id))
+    finally:
+        tracker.forget(session_id)
+        smoothers.forget(session_id)
+
+@app.get("/sessions/{session_id}/summary")
+async def session_summary(session_id: str):
+    """All-time posture aggregates for one session, read from the rollups"""
+    if rollups is None:
+        return JSONResponse(status_code=404, content={"error": "Rollups are disabled; set ERGOWISE_ROLLUP_DB"})
+    summary = await execution.run(rollups.summary, "session", session_id)
+    if summary is None:
+        return JSONResponse(status_code=404, content={"error": f"No posture history for session {session_id!r}"})
+    return {"session_id": session_id, **summary}
+
+@app.get("/users/{user_id}/trends")
+async def user_trends(user_id: str, grain: str = "hour", limit: int = Query(24, ge=1, le=1000)):
+    """The most recent minute/hour/day buckets for one user, plus all-time totals"""
+    if rollups is None:
+        return JSONResponse(status_code=404, content={"error": "Rollups are disabled; set ERGOWISE_ROLLUP_DB"})
+    if grain not in GRAINS:
+        return JSONResponse(status_code=400, content={"error": f"grain must be one of {', '.join(GRAINS)}"})
+    total = await execution.run(rollups.summary, "user", user_id)
+    if total is None:
+        return JSONResponse(status_code=404, content={"error": f"No posture history for user {user_id!r}"})
+    buckets = await execution.run(rollups.trends, "user", user_id, grain, limit)
+    return {"user_id": user_id, "grain": grain, "total": total, "buckets": buckets}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, outcomes and load"""
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/model-info")
+def model_info():
+    return {
+        "model_name": MODEL_NAME,
+        "model_loaded": model is not None,
+        "backend": type(model).__name__ if model is not None else None,
+        "inference_settings": {"conf": CONF_THRESHOLD, "iou": IOU_THRESHOLD},
+        "execution": execution.status(),
+        "cascade": inference.status() if isinstance(inference, PoseCascade) else None,
+        "models": registry.status(),
+        "adaptive_imgsz": adaptive_imgsz.status() if adaptive_imgsz is not None else None,
+        "archive": archive.status() if archive is not None else None,
+        "rollups": rollups.status() if rollups is not None else None,
+        "rules": rulebook.status(),
+        "result_cache": result_cache.stats(),
+        "preprocessing": preprocess_stats.snapshot()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting Enhanced ErgoWise Posture Analysis API...")
     print(f"📊 Model: {MODEL_NAME}")
-    print(f"✅ Loaded: {'Yes' if model else 'No'}")
+    print("⏳ Model loads in the background; GET /ready reports when it is warm")
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
@@ -0,0 +1,337 @@
+"""Pluggable inference backends for the pose model.
+
+    python backends.py export yolov8n-pose.pt yolov8s-pose.pt --format onnx openvino
+    python backends.py parity yolov8n-pose.pt --backend onnx photos/*.jpg
+    ERGOWISE_BACKEND=onnx uvicorn app_enhanced:app
+
+"torch" keeps the ultralytics checkpoint. "onnx" (ONNX Runtime) and
+"openvino" run a graph exported by the command above, next to the .pt file.
+The runtimes letterbox, NMS and rescale exactly like the ultralytics pose
+predictor, and are called the same way (model(img, conf=, iou=, imgsz=)), so
+the batcher, worker pool and /analyze selection code do not change.
+``parity`` runs both paths on the same frames and exits non-zero if the
+keypoints or boxes disagree.
+"""
+import abc
+import os
+
+import cv2
+import numpy as np
+
+BACKEND = os.environ.get("ERGOWISE_BACKEND", "torch").lower()
+BACKENDS = ("torch", "onnx", "openvino")
+# Intra-op threads for ONNX Runtime / OpenVINO; 0 = runtime default (one per core)
+BACKEND_THREADS = int(os.environ.get("ERGOWISE_BACKEND_THREADS", "0"))
+
+STRIDE = 32
+KPT_SHAPE = (17, 3)
+MAX_DET = 300
+MAX_NMS = 30000
+PAD_VALUE = 114
+
+
+def exported_path(model_name, backend):
+    """Where `export` writes the graph for a checkpoint"""
+    stem = os.path.splitext(model_name)[0]
+    if backend == "onnx":
+        return stem + ".onnx"
+    if backend == "openvino":
+        return os.path.join(stem + "_openvino_model", os.path.basename(stem) + ".xml")
+    return model_name
+
+
+def check_imgsz(imgsz):
+    """Round the inference size up to a stride multiple, like ultralytics"""
+    return max(int(np.ceil(imgsz / STRIDE)) * STRIDE, STRIDE)
+
+
+def letterbox(img, size, auto):
+    """Resize with unchanged aspect ratio and pad (ultralytics LetterBox).
+
+    ``auto`` pads only up to the next stride multiple instead of the full
+    square, as ultralytics does when all images in a batch share a shape.
+    """
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    dw, dh = size - new_w, size - new_h
+    if auto:
+        dw, dh = dw % STRIDE, dh % STRIDE
+    dw /= 2
+    dh /= 2
+    if (w, h) != (new_w, new_h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(PAD_VALUE,) * 3)
+
+
+def nms(boxes, scores, iou):
+    """Greedy NMS over xyxy boxes sorted by score (torchvision semantics)"""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if len(keep) >= MAX_DET:
+            break
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        overlap = inter / (areas[i] + areas[rest] - inter)
+        order = rest[overlap <= iou]
+    return np.array(keep, dtype=np.int64)
+
+
+def decode(pred, input_shape, orig_shape, conf, iou):
+    """Turn one raw [56, anchors] output into (xy, kconf, box_conf, box_xyxy).
+
+    Mirrors ultralytics' non_max_suppression + scale_boxes + scale_coords and
+    the Keypoints rule that zeroes points with confidence below 0.5.
+    """
+    pred = pred.T
+    scores = pred[:, 4]
+    pred = pred[scores > conf]
+    if len(pred) > MAX_NMS:
+        pred = pred[pred[:, 4].argsort()[::-1][:MAX_NMS]]
+
+    xywh = pred[:, :4]
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+    keep = nms(boxes, pred[:, 4], iou) if len(pred) else np.zeros(0, np.int64)
+    boxes = boxes[keep]
+    box_conf = pred[keep, 4].astype(np.float32)
+    kpts = pred[keep, 5:].reshape(len(keep), *KPT_SHAPE).copy()
+
+    (ih, iw), (oh, ow) = input_shape, orig_shape[:2]
+    gain = min(ih / oh, iw / ow)
+    # Boxes use rounded padding, keypoints the exact value (as ultralytics)
+    box_pad = round((iw - ow * gain) / 2 - 0.1), round((ih - oh * gain) / 2 - 0.1)
+    kpt_pad = (iw - ow * gain) / 2, (ih - oh * gain) / 2
+
+    boxes[:, [0, 2]] -= box_pad[0]
+    boxes[:, [1, 3]] -= box_pad[1]
+    boxes /= gain
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, ow)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, oh)
+    boxes = boxes.round()
+
+    kpts[..., 0] = ((kpts[..., 0] - kpt_pad[0]) / gain).clip(0, ow)
+    kpts[..., 1] = ((kpts[..., 1] - kpt_pad[1]) / gain).clip(0, oh)
+    kpts[..., :2][kpts[..., 2] < 0.5] = 0
+
+    return (
+        kpts[..., :2].astype(np.float32),
+        kpts[..., 2].astype(np.float32),
+        box_conf,
+        boxes.astype(np.float32),
+    )
+
+
+class GraphPoseModel(abc.ABC):
+    """Exported pose graph with the ultralytics call signature"""
+
+    # Set when the graph has fixed spatial dims (exported without --dynamic)
+    fixed_size = None
+    # Set when the graph only accepts batch size 1
+    single_batch = False
+
+    @abc.abstractmethod
+    def _forward(self, blob):
+        """Raw predictions float[N, 56, anchors] for a float32 NCHW blob"""
+
+    def predict_arrays(self, source, conf=0.25, iou=0.7, imgsz=640, **_):
+        """Run pose and return per-image (xy, kconf, box_conf, box_xyxy) arrays"""
+        imgs = source if isinstance(source, list) else [source]
+        size = self.fixed_size or check_imgsz(imgsz or 640)
+        same = all(im.shape == imgs[0].shape for im in imgs)
+        auto = same and self.fixed_size is None
+        padded = [letterbox(im, size, auto) for im in imgs]
+        blob = np.ascontiguousarray(np.stack(padded)[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+        blob /= 255.0
+
+        if self.single_batch and len(blob) > 1:
+            preds = np.concatenate([self._forward(blob[i:i + 1]) for i in range(len(blob))])
+        else:
+            preds = self._forward(blob)
+        return [decode(p, blob.shape[2:], im.shape, conf, iou) for p, im in zip(preds, imgs)]
+
+    def __call__(self, source, conf=0.25, iou=0.7, imgsz=640, verbose=False, **kwargs):
+        from inference_server import PoseResult
+        return [PoseResult(*arrays) for arrays in self.predict_arrays(source, conf, iou, imgsz)]
+
+
+class OnnxPoseModel(GraphPoseModel):
+    """ONNX Runtime session tuned for low-latency CPU serving"""
+
+    def __init__(self, path, threads=BACKEND_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.enable_cpu_mem_arena = True
+        options.enable_mem_pattern = True
+        # Idle workers should not spin on cores the event loop and decode pool need
+        options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        if isinstance(inp.shape[2], int) and isinstance(inp.shape[3], int):
+            self.fixed_size = inp.shape[2]
+        self.single_batch = inp.shape[0] == 1
+
+    def _forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoPoseModel(GraphPoseModel):
+    """OpenVINO compiled model using the latency performance hint"""
+
+    def __init__(self, path, threads=BACKEND_THREADS):
+        import openvino as ov
+
+        core = ov.Core()
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        graph = core.read_model(path)
+        shape = graph.inputs[0].get_partial_shape()
+        if shape[2].is_static and shape[3].is_static:
+            self.fixed_size = shape[2].get_length()
+        self.single_batch = shape[0].is_static and shape[0].get_length() == 1
+        self.compiled = core.compile_model(graph, "CPU", config)
+        self.output = self.compiled.outputs[0]
+
+    def _forward(self, blob):
+        return self.compiled(blob)[self.output]
+
+
+def load_model(model_name, backend=BACKEND, threads=BACKEND_THREADS):
+    """Load ``model_name`` with the configured backend"""
+    if backend == "torch":
+        from inference_server import load_trusted_model
+        return load_trusted_model(model_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    path = exported_path(model_name, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; run: python backends.py export {model_name} --format {backend}")
+    if backend == "onnx":
+        return OnnxPoseModel(path, threads)
+    return OpenVinoPoseModel(path, threads)
+
+
+def export(model_name, formats, imgsz=640, dynamic=True, opset=None):
+    """Export a checkpoint to ONNX and, from that graph, OpenVINO IR"""
+    onnx_path = exported_path(model_name, "onnx")
+    model = load_model(model_name, "torch")
+    kwargs = {"format": "onnx", "imgsz": imgsz, "dynamic": dynamic}
+    if opset:
+        kwargs["opset"] = opset
+    produced = model.export(**kwargs)
+    if os.path.abspath(produced) != os.path.abspath(onnx_path):
+        os.replace(produced, onnx_path)
+    print(f"✅ ONNX: {onnx_path}")
+
+    if "openvino" in formats:
+        import openvino as ov
+        xml_path = exported_path(model_name, "openvino")
+        os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+        ov.save_model(ov.convert_model(onnx_path), xml_path, compress_to_fp16=False)
+        print(f"✅ OpenVINO: {xml_path}")
+
+
+def compare(torch_model, graph_model, img, conf=0.25, iou=0.7, imgsz=640):
+    """Run both models on ``img``: (torch people, exported people, max keypoint
+    and box differences in pixels). Differences are 0 when the counts differ."""
+    ref = torch_model(img, conf=conf, iou=iou, imgsz=imgsz, verbose=False)[0]
+    if ref.boxes is None or len(ref.boxes) == 0:
+        ref_xy, ref_box = np.zeros((0, 17, 2)), np.zeros((0, 4))
+    else:
+        ref_xy, ref_box = ref.keypoints.xy.cpu().numpy(), ref.boxes.xyxy.cpu().numpy()
+    xy, _, _, box = graph_model.predict_arrays(img, conf=conf, iou=iou, imgsz=imgsz)[0]
+    if len(ref_xy) != len(xy) or not len(xy):
+        return len(ref_xy), len(xy), 0.0, 0.0
+    # Pair each torch detection with the closest exported one, so equal
+    # scores sorted in a different order do not count as a mismatch
+    dist = np.abs(ref_box[:, None, :] - box[None, :, :]).max(axis=2)
+    match = dist.argmin(axis=1)
+    box_err = float(dist[np.arange(len(match)), match].max())
+    kpt_err = float(np.abs(ref_xy - xy[match]).max())
+    return len(ref_xy), len(xy), kpt_err, box_err
+
+
+def parity(model_name, backend, images, conf=0.25, iou=0.7, imgsz=640, atol=1.0):
+    """Compare an exported backend with the torch checkpoint on the same frames.
+
+    Without image paths a few synthetic frames are used, which only checks the
+    plumbing; pass real photos of people to compare detections.
+    """
+    torch_model = load_model(model_name, "torch")
+    graph_model = load_model(model_name, backend)
+    if images:
+        frames = [(p, cv2.imread(p, cv2.IMREAD_COLOR)) for p in images]
+    else:
+        rng = np.random.default_rng(0)
+        frames = [(f"synthetic-{h}x{w}", rng.integers(0, 255, (h, w, 3), np.uint8)) for h, w in [(480, 640), (640, 480), (360, 640)]]
+
+    failures = 0
+    for name, img in frames:
+        if img is None:
+            print(f"⚠️ {name}: unreadable, skipped")
+            continue
+        ref_count, count, kpt_err, box_err = compare(torch_model, graph_model, img, conf, iou, imgsz)
+        if ref_count != count:
+            print(f"❌ {name}: torch found {ref_count} people, {backend} {count}")
+            failures += 1
+            continue
+        ok = kpt_err <= atol and box_err <= atol
+        failures += not ok
+        print(f"{'✅' if ok else '❌'} {name}: {count} people, max keypoint diff {kpt_err:.3f}px, max box diff {box_err:.3f}px")
+    return failures
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export pose checkpoints and check backend parity")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="export checkpoints to ONNX / OpenVINO")
+    p.add_argument("models", nargs="+", help="e.g. yolov8n-pose.pt yolov8s-pose.pt")
+    p.add_argument("--format", nargs="+", choices=["onnx", "openvino"], default=["onnx"])
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--static", action="store_true", help="fixed 1x3ximgszximgsz input instead of dynamic shapes")
+    p.add_argument("--opset", type=int, default=None)
+
+    p = sub.add_parser("parity", help="compare an exported backend against torch")
+    p.add_argument("model")
+    p.add_argument("images", nargs="*")
+    p.add_argument("--backend", choices=["onnx", "openvino"], default="onnx")
+    p.add_argument("--conf", type=float, default=0.25)
+    p.add_argument("--iou", type=float, default=0.7)
+    p.add_argument("--imgsz", type=int, default=640)
+    p.add_argument("--atol", type=float, default=1.0, help="max allowed pixel difference")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        for name in args.models:
+            export(name, args.format, imgsz=args.imgsz, dynamic=not args.static, opset=args.opset)
+    else:
+        failures = parity(args.model, args.backend, args.images, args.conf, args.iou, args.imgsz, args.atol)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
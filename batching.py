@@ -0,0 +1,119 @@
+"""Dynamic micro-batching in front of the shared YOLO pose model.
+
+Concurrent /analyze requests are collected for a short window (bounded by
+batch size and wait time) and run through a single batched forward pass.
+Each waiting coroutine then gets back the result for its own image.
+"""
+import asyncio
+import functools
+import os
+
+# Batching window. Configurable through the environment so every app variant
+# shares the same knobs without code edits.
+BATCH_MAX_SIZE = int(os.environ.get("ERGOWISE_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("ERGOWISE_BATCH_MAX_WAIT_MS", "4"))
+
+
+class InferenceBatcher:
+    """Groups single-image predictions into batched model calls"""
+
+    def __init__(self, model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, executor=None):
+        self.model = model
+        # Thread pool the forward pass runs on (None = the loop's default pool)
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._loop = None
+        self._queue = None
+        self._worker = None
+
+    async def predict(self, img, conf=0.25, iou=0.7, imgsz=None):
+        """Queue one image and wait for its results.
+
+        Returns a one-element list so callers can keep iterating over the
+        return value exactly as they did with ``model(img, ...)``.
+        ``imgsz=None`` keeps the model's default inference size.
+        """
+        self._ensure_worker()
+        fut = self._loop.create_future()
+        await self._queue.put((img, (conf, iou, imgsz), fut))
+        return await fut
+
+    @property
+    def queued(self):
+        """Frames waiting for a forward pass"""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def close(self):
+        """Stop the worker and drop the model (e.g. when a registry unloads it)"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+        self._worker = None
+        self.model = None
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or a new event loop (e.g. uvicorn reload / test client)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = None
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+    async def _collect(self):
+        """Wait for the first request, then gather more until the window closes"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Anything already queued joins the batch without waiting
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+
+            # Requests can only share a forward pass if they use the same settings
+            groups = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+
+            for settings, items in groups.items():
+                await self._run_batch(items, *settings)
+
+    async def _run_batch(self, items, conf, iou, imgsz):
+        # Drop requests whose callers already went away
+        items = [item for item in items if not item[2].done()]
+        if not items:
+            return
+
+        imgs = [item[0] for item in items]
+        kwargs = {"conf": conf, "iou": iou, "verbose": False}
+        if imgsz is not None:
+            kwargs["imgsz"] = imgsz
+        try:
+            # The model object is not thread-safe, so batches run one at a time
+            results = await self._loop.run_in_executor(
+                self.executor, functools.partial(self.model, imgs, **kwargs)
+            )
+        except Exception as e:
+            for item in items:
+                if not item[2].done():
+                    item[2].set_exception(e)
+            return
+
+        for item, r in zip(items, results):
+            if not item[2].done():
+                item[2].set_result([r])
@@ -0,0 +1,387 @@
+"""Reproducible micro- and macro-benchmarks for the analysis pipeline.
+
+    python benchmark.py run -o bench.json
+    python benchmark.py run --models yolov8n-pose.pt yolov8s-pose.pt --sizes 480x640 1080x1920
+    python benchmark.py run -k preprocess -k posture_report --baseline bench.json
+    python benchmark.py compare baseline.json bench.json --threshold 0.10
+
+Micro benchmarks cover decode, preprocess_image, keypoint dict building,
+posture_report (per app) and the generate_* helpers, batch scoring and
+person selection. Macro benchmarks run the in-process pipeline per model and
+image size, and full /analyze requests through the app's ASGI interface.
+
+Every fixture is synthetic and seeded, so two runs on the same machine see
+identical inputs. Results are written as JSON; ``compare`` (or ``run
+--baseline``) flags benchmarks whose median got slower than the threshold
+and exits with status 1 when any did.
+"""
+import os
+os.environ['TORCH_WEIGHTS_ONLY'] = 'False'  # only for trusted checkpoints
+
+import argparse
+import importlib
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from posture_batch import COCO_KPTS, KPT_INDEX, posture_report_batch
+from posture_rules import METRIC_NAMES, rulebook
+from pose_extract import best_pose, keypoint_dict
+from preprocessing import decode_upload, preprocess_image
+from readiness import synthetic_frame
+
+APPS = ("app", "app_enhanced", "app_enhanced_v2", "app_professional")
+DEFAULT_SIZES = ("480x640", "720x1280", "3000x4000")
+SEED = 1234
+
+# Upright seated person in a 640x480 frame: name -> (x, y)
+_UPRIGHT = {
+    "nose": (320, 120), "left_eye": (330, 110), "right_eye": (310, 110),
+    "left_ear": (342, 118), "right_ear": (298, 118),
+    "left_shoulder": (370, 190), "right_shoulder": (270, 190),
+    "left_elbow": (385, 260), "right_elbow": (255, 260),
+    "left_wrist": (380, 320), "right_wrist": (260, 320),
+    "left_hip": (350, 330), "right_hip": (290, 330),
+    "left_knee": (352, 410), "right_knee": (288, 410),
+    "left_ankle": (354, 470), "right_ankle": (286, 470),
+}
+
+
+def keypoint_fixture(pose, seed=SEED):
+    """Deterministic float32[17, 3] keypoints for a named pose"""
+    rng = np.random.default_rng(seed)
+    kpts = np.array([(*_UPRIGHT[n], 0.9) for n in COCO_KPTS], np.float32)
+    kpts[:, :2] += rng.normal(0, 1.5, (17, 2))
+    kpts[:, 2] -= rng.uniform(0, 0.1, 17)
+    head = [KPT_INDEX[n] for n in ("nose", "left_eye", "right_eye", "left_ear", "right_ear")]
+    if pose == "slouched":
+        # Head forward and down, shoulders rolled forward over the hips
+        kpts[head, 0] += 45
+        kpts[head, 1] += 25
+        kpts[[KPT_INDEX["left_shoulder"], KPT_INDEX["right_shoulder"]], 0] += 30
+    elif pose == "tilted":
+        kpts[KPT_INDEX["left_shoulder"], 1] += 24
+        kpts[KPT_INDEX["left_hip"], 1] += 14
+        kpts[head, 0] -= 12
+    elif pose == "partial":
+        # Desk camera framing: legs out of view or occluded
+        for n in ("left_knee", "right_knee", "left_ankle", "right_ankle"):
+            kpts[KPT_INDEX[n], 2] = 0.1
+    return kpts
+
+
+POSES = ("upright", "slouched", "tilted", "partial")
+
+
+def jpeg_fixture(size, seed=SEED):
+    h, w = parse_size(size)
+    ok, buf = cv2.imencode(".jpg", synthetic_frame((h, w), seed), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buf.tobytes()
+
+
+def parse_size(size):
+    h, w = (int(v) for v in size.lower().split("x"))
+    return h, w
+
+
+def rule_inputs(kpts, profile):
+    """What posture_report hands the rule table for one pose: the metrics
+    dict and body proportions for ``evaluate``, and the per-rule values,
+    flags and severity buckets for ``render``"""
+    scored = posture_report_batch(kpts[None], profile=profile)
+    values = [None if math.isnan(v) else float(v) for v in scored.metrics[0]]
+    body_height, shoulder_width = (None if math.isnan(v) else float(v)
+                                   for v in (scored.body_height[0], scored.shoulder_width[0]))
+    xs = [values[j] for j in scored.profile.metric_idx]
+    return (dict(zip(METRIC_NAMES, values)), body_height, shoulder_width,
+            (scored.profile, xs, scored.flagged[0], scored.severity[0]))
+
+
+def candidate_arrays(people, seed=SEED):
+    """(xy, kconf, box_conf, box_xyxy) for ``people`` detections"""
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 640, (people, 17, 2)).astype(np.float32)
+    kconf = rng.uniform(0, 1, (people, 17)).astype(np.float32)
+    box_conf = rng.uniform(0, 1, people).astype(np.float32)
+    corner = rng.uniform(0, 400, (people, 2))
+    box = np.concatenate([corner, corner + rng.uniform(50, 240, (people, 2))], 1).astype(np.float32)
+    return xy, kconf, box_conf, box
+
+
+# ---------------------------------------------------------------- timing
+
+def autorange(fn, target_s=0.0002):
+    """Calls per sample so one sample takes at least ``target_s``"""
+    number = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t >= target_s or number >= 1 << 20:
+            return number
+        number *= 4
+
+
+def measure(fn, min_time, min_samples, warmup):
+    for _ in range(warmup):
+        fn()
+    number = autorange(fn)
+    samples = []
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_samples or time.perf_counter() < deadline:
+        t = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter_ns() - t) / number / 1e3)
+    samples.sort()
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "mean_us": round(statistics.fmean(samples), 3),
+        "min_us": round(samples[0], 3),
+        "p95_us": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        "stdev_us": round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+        "samples": len(samples),
+        "calls_per_sample": number,
+    }
+
+
+# ---------------------------------------------------------------- cases
+# Each case generator yields (name, params, fn, kind); kind "macro" cases
+# use the macro time budget.
+
+def micro_cases(args):
+    for size in args.sizes:
+        data = jpeg_fixture(size)
+        yield f"decode_upload[{size}]", {"size": size}, lambda d=data: decode_upload(d), "micro"
+        img, _ = decode_upload(data)
+        # preprocess_image resizes into a new array but may enhance in place
+        yield f"preprocess_image[{size}]", {"size": size}, lambda i=img: preprocess_image(i.copy()), "micro"
+
+    for pose in POSES:
+        kpts = keypoint_fixture(pose)
+        yield f"keypoint_dict[{pose}]", {"pose": pose}, lambda k=kpts: keypoint_dict(k), "micro"
+
+    for people in (1, 10, 300):
+        from inference_server import PoseResult
+        result = PoseResult(*candidate_arrays(people))
+        yield f"best_pose[people={people}]", {"people": people}, lambda r=result: best_pose([r]), "micro"
+
+    for n in (1, 1024):
+        batch = np.stack([keypoint_fixture(POSES[i % len(POSES)], SEED + i) for i in range(n)])
+        yield f"posture_report_batch[n={n}]", {"n": n}, lambda b=batch: posture_report_batch(b), "micro"
+
+    for app_name in args.apps:
+        mod = importlib.import_module(app_name)
+        for pose in POSES:
+            kdict = keypoint_dict(keypoint_fixture(pose))
+            params = {"app": app_name, "pose": pose}
+            yield f"posture_report[{app_name}/{pose}]", params, lambda m=mod, k=kdict: m.posture_report(k), "micro"
+
+    # The rule table on its own: scoring with and without advice text, and
+    # rendering advice from batch flags
+    rules = rulebook.current()
+    for profile in sorted(rules.profiles):
+        for pose in POSES:
+            measured, body_height, shoulder_width, render_args = rule_inputs(keypoint_fixture(pose), profile)
+            params = {"profile": profile, "pose": pose}
+            yield (f"rules.evaluate[{profile}/{pose}]", params,
+                   lambda p=profile, m=measured, h=body_height, w=shoulder_width: rules.evaluate(p, m, h, w), "micro")
+            yield (f"rules.evaluate_scores[{profile}/{pose}]", params,
+                   lambda p=profile, m=measured, h=body_height, w=shoulder_width: rules.evaluate(p, m, h, w, advice=False),
+                   "micro")
+            yield f"rules.render[{profile}/{pose}]", params, lambda a=render_args: rules.render(*a), "micro"
+
+
+def pipeline_cases(args):
+    """decode -> preprocess -> model -> selection -> scoring, in process"""
+    from backends import load_model
+
+    for model_name in args.models:
+        names = {size: f"pipeline[{model_name}/{args.backend}/{size}]" for size in args.sizes}
+        if not any(selected(n, args.k) for n in names.values()):
+            continue  # do not load models nothing will use
+        model = load_model(model_name, args.backend)
+        for size, name in names.items():
+            data = jpeg_fixture(size)
+
+            def run(d=data, m=model):
+                img, _ = decode_upload(d)
+                img = preprocess_image(img)
+                kpts, _, _ = best_pose(m(img, conf=0.25, iou=0.7, verbose=False))
+                if kpts is not None:
+                    posture_report_batch(kpts[None]).report(0)
+
+            params = {"model": model_name, "backend": args.backend, "size": size}
+            yield name, params, run, "macro"
+
+
+def analyze_cases(args):
+    """Full /analyze requests through the app's ASGI interface"""
+    from fastapi.testclient import TestClient
+    from readiness import ModelLoader
+
+    mod = importlib.import_module(args.analyze_app)
+    # Benchmarks measure the uncached path
+    async def uncached(key, run):
+        return None
+    mod.result_cache.lookup = uncached
+    for model_name in args.models:
+        names = {size: f"analyze[{args.analyze_app}/{model_name}/{size}]" for size in args.sizes}
+        if not any(selected(n, args.k) for n in names.values()):
+            continue
+        mod.MODEL_NAME = model_name
+        mod.metrics.model_name = model_name
+        mod.loader = ModelLoader(mod.load_pose_model, mod.warm_up)
+        with TestClient(mod.app) as client:
+            while mod.loader.state not in ("ready", "failed"):
+                time.sleep(0.05)
+            if not mod.loader.ready:
+                print(f"❌ {args.analyze_app} could not load {model_name}: {mod.loader.error}")
+                continue
+            for size, name in names.items():
+                data = jpeg_fixture(size)
+
+                def run(d=data, c=client):
+                    r = c.post("/analyze", files={"file": ("bench.jpg", d, "image/jpeg")})
+                    r.raise_for_status()
+
+                params = {"app": args.analyze_app, "model": model_name, "size": size}
+                yield name, params, run, "macro"
+
+
+def environment():
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+    try:
+        import torch
+        meta["torch"] = torch.__version__
+        meta["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        meta["commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        meta["commit"] = None
+    return meta
+
+
+def selected(name, patterns):
+    return not patterns or any(p in name for p in patterns)
+
+
+def run(args):
+    suites = {"micro": micro_cases, "pipeline": pipeline_cases, "analyze": analyze_cases}
+    results = {}
+    for suite in args.suites:
+        for name, params, fn, kind in suites[suite](args):
+            if not selected(name, args.k):
+                continue
+            if kind == "macro":
+                stats = measure(fn, args.macro_time, args.macro_samples, warmup=2)
+            else:
+                stats = measure(fn, args.min_time, args.min_samples, warmup=3)
+            results[name] = {"suite": suite, "params": params, **stats}
+            print(f"  {name:<60} {format_us(stats['median_us']):>10}  (p95 {format_us(stats['p95_us'])})", flush=True)
+
+    report = {"meta": environment(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {len(results)} results to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return compare_reports(baseline, report, args.threshold)
+    return 0
+
+
+def format_us(us):
+    if us >= 1e6:
+        return f"{us / 1e6:.2f} s"
+    if us >= 1e3:
+        return f"{us / 1e3:.2f} ms"
+    return f"{us:.2f} us"
+
+
+def compare_reports(baseline, current, threshold):
+    """Print a per-benchmark comparison of medians; returns 1 on regressions"""
+    base, cur = baseline["results"], current["results"]
+    regressions = []
+    print(f"\n📊 Median vs baseline ({baseline['meta'].get('commit')} -> {current['meta'].get('commit')}), threshold {threshold:.0%}")
+    for name in sorted(set(base) & set(cur)):
+        ratio = cur[name]["median_us"] / base[name]["median_us"] if base[name]["median_us"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "❌ slower"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "✅ faster"
+        print(f"  {name:<60} {format_us(base[name]['median_us']):>10} -> {format_us(cur[name]['median_us']):>10}  {ratio:5.2f}x {flag}")
+    missing = set(base) - set(cur)
+    if missing:
+        print(f"  ({len(missing)} baseline benchmark(s) not in this run)")
+    for name in sorted(set(cur) - set(base)):
+        print(f"  {name:<60} new (no baseline)")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {threshold:.0%}")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+def compare(args):
+    reports = []
+    for path in (args.baseline, args.current):
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    return compare_reports(*reports, args.threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the posture analysis pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="run benchmarks")
+    p.add_argument("-o", "--output", help="write results as JSON")
+    p.add_argument("-k", action="append", help="only run benchmarks whose name contains this (repeatable)")
+    p.add_argument("--suites", nargs="+", choices=["micro", "pipeline", "analyze"], default=["micro", "pipeline", "analyze"])
+    p.add_argument("--models", nargs="+", default=["yolov8n-pose.pt"])
+    p.add_argument("--backend", default="torch", help="backend for the pipeline suite (torch, onnx, openvino)")
+    p.add_argument("--sizes", nargs="+", default=list(DEFAULT_SIZES), help="image sizes as HxW")
+    p.add_argument("--apps", nargs="+", default=list(APPS), choices=APPS, help="apps for posture_report benchmarks")
+    p.add_argument("--analyze-app", default="app_enhanced_v2", choices=APPS)
+    p.add_argument("--min-time", type=float, default=0.5, help="seconds per micro benchmark")
+    p.add_argument("--min-samples", type=int, default=20)
+    p.add_argument("--macro-time", type=float, default=3.0, help="seconds per pipeline/analyze benchmark")
+    p.add_argument("--macro-samples", type=int, default=10)
+    p.add_argument("--baseline", help="compare against this results file afterwards")
+    p.add_argument("--threshold", type=float, default=0.10, help="allowed median slowdown before flagging")
+
+    c = sub.add_parser("compare", help="compare two results files")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == "run" else compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Offline posture analysis over image folders and recorded videos.
+
+Runs the same preprocess -> YOLO pose -> posture scoring pipeline as the API.
+
+    python bulk_analyze.py recordings/ photos/ -o results.jsonl
+    python bulk_analyze.py desk_cam.mp4 --every 5 --format parquet -o results/
+
+Frames are decoded and preprocessed on worker threads and fed through a
+bounded prefetch queue into batched inference. Progress is appended to a
+checkpoint log next to the output, so rerunning the same command resumes
+where the previous run stopped.
+"""
+import os
+os.environ['TORCH_WEIGHTS_ONLY'] = 'False'  # only for trusted checkpoints
+
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from backends import BACKEND, BACKENDS, load_model
+from pose_extract import best_pose
+from posture_batch import METRIC_NAMES, posture_report_batch
+from preprocessing import decode_upload, preprocess_image
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+VIDEO_EXTS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+
+
+def find_sources(paths):
+    """Expand files and directories into sorted (kind, path) pairs"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = []
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names)
+        else:
+            files = [path]
+        for f in sorted(files):
+            ext = os.path.splitext(f)[1].lower()
+            if ext in IMAGE_EXTS:
+                sources.append(("image", f))
+            elif ext in VIDEO_EXTS:
+                sources.append(("video", f))
+    return sources
+
+
+class Checkpoint:
+    """Append-only log of finished frames ("path" or "path#frame" per line)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.images = set()
+        self.video_next = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key = line.rstrip("\n")
+                    if not key:
+                        continue
+                    src, sep, frame = key.rpartition("#")
+                    if sep and frame.isdigit():
+                        self.video_next[src] = max(self.video_next.get(src, 0), int(frame) + 1)
+                    else:
+                        self.images.add(key)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def mark(self, keys):
+        self._file.write("".join(k + "\n" for k in keys))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, rows):
+        self._file.write("".join(json.dumps(r) + "\n" for r in rows))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes one part file per run into the output directory"""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow (pip install pyarrow)")
+        self._pa = pa
+        self._pq = pq
+        os.makedirs(path, exist_ok=True)
+        self.path = os.path.join(path, f"part-{time.strftime('%Y%m%d-%H%M%S')}.parquet")
+        # Fixed up front: rows for images, undetected frames or without --tips
+        # lack some keys, and pyarrow would otherwise infer from the first row
+        self.schema = pa.schema(
+            [("source", pa.string()), ("frame", pa.int64()), ("detected", pa.bool_()),
+             ("detection_confidence", pa.float64())]
+            + [(name, pa.float64()) for name in METRIC_NAMES]
+            + [("posture_score", pa.int64()), ("grade", pa.string()),
+               ("tips", pa.string()), ("keypoints", pa.string())])
+        self._writer = None
+
+    def write(self, rows):
+        if not rows:
+            return
+        for r in rows:
+            # Nested lists do not round-trip cleanly; store keypoints as JSON text
+            if "keypoints" in r:
+                r["keypoints"] = json.dumps(r["keypoints"])
+            if "tips" in r:
+                r["tips"] = json.dumps(r["tips"])
+        table = self._pa.Table.from_pylist(rows, schema=self.schema)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, self.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def produce(sources, checkpoint, pool, frames, every):
+    """Producer thread: schedule decode/preprocess work in order.
+
+    Futures go into the bounded ``frames`` queue, so reading pauses whenever
+    inference falls behind.
+    """
+    def load_image(path):
+        # Large JPEGs decode straight at reduced size, as in the API
+        with open(path, "rb") as f:
+            img, _ = decode_upload(f.read())
+        return path, None, None if img is None else preprocess_image(img)
+
+    def prep_frame(path, index, img):
+        return path, index, preprocess_image(img)
+
+    for kind, path in sources:
+        if kind == "image":
+            if path not in checkpoint.images:
+                frames.put(pool.submit(load_image, path))
+            continue
+
+        cap = cv2.VideoCapture(path)
+        start = checkpoint.video_next.get(path, 0)
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        index = start
+        while True:
+            ok = cap.grab()
+            if not ok:
+                break
+            if index % every == 0:
+                ok, img = cap.retrieve()
+                if ok:
+                    frames.put(pool.submit(prep_frame, path, index, img))
+            index += 1
+        cap.release()
+    frames.put(None)
+
+
+def extract_best(results, min_person_conf):
+    """Best person per image as float32[B, 17, 3] plus detection confidences"""
+    kpts = np.zeros((len(results), 17, 3), np.float32)
+    confs = np.zeros(len(results), np.float32)
+    for j, r in enumerate(results):
+        best, _, conf = best_pose([r])
+        if best is not None:
+            kpts[j], confs[j] = best, conf
+    return kpts, confs >= min_person_conf, confs
+
+
+def build_rows(batch, kpts, detected, confs, args):
+    scored = posture_report_batch(kpts)
+    rows = []
+    for j, (path, frame, _) in enumerate(batch):
+        row = {"source": path, "frame": frame, "detected": bool(detected[j])}
+        if detected[j]:
+            row["detection_confidence"] = float(confs[j])
+            for name, value in zip(METRIC_NAMES, scored.metrics[j]):
+                row[name] = None if np.isnan(value) else float(value)
+            row["posture_score"] = int(scored.score[j])
+            row["grade"] = scored.grades[scored.grade_code[j]][0]
+            if args.tips:
+                row["tips"] = scored.report(j)["tips"]
+            if args.keypoints:
+                row["keypoints"] = kpts[j].round(2).tolist()
+        rows.append(row)
+    return rows
+
+
+def run(args):
+    sources = find_sources(args.inputs)
+    if not sources:
+        sys.exit("No images or videos found")
+
+    if args.format == "parquet":
+        writer = ParquetWriter(args.output)
+        checkpoint = Checkpoint(os.path.join(args.output, "checkpoint.log"))
+    else:
+        writer = JsonlWriter(args.output)
+        checkpoint = Checkpoint(args.output + ".checkpoint")
+
+    model = load_model(args.model, args.backend)
+    pool = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="bulk-decode")
+    frames = queue.Queue(maxsize=args.prefetch)
+    producer = threading.Thread(target=produce, args=(sources, checkpoint, pool, frames, args.every), daemon=True)
+    producer.start()
+
+    done = 0
+    started = time.time()
+
+    def flush(batch):
+        nonlocal done
+        ready = [b for b in batch if b[2] is not None]
+        kpts = np.zeros((len(batch), 17, 3), np.float32)
+        detected = np.zeros(len(batch), bool)
+        confs = np.zeros(len(batch), np.float32)
+        if ready:
+            results = model([b[2] for b in ready], conf=args.conf, iou=args.iou, verbose=False)
+            k, d, c = extract_best(results, args.min_person_conf)
+            idx = [j for j, b in enumerate(batch) if b[2] is not None]
+            kpts[idx], detected[idx], confs[idx] = k, d, c
+        writer.write(build_rows(batch, kpts, detected, confs, args))
+        # Only mark frames finished once their rows are safely written
+        checkpoint.mark([p if f is None else f"{p}#{f}" for p, f, _ in batch])
+        done += len(batch)
+        elapsed = time.time() - started
+        print(f"\r📊 {done} frames  {done / max(elapsed, 1e-9):.1f} fps", end="", flush=True)
+
+    batch = []
+    while True:
+        fut = frames.get()
+        if fut is None:
+            break
+        batch.append(fut.result())
+        if len(batch) >= args.batch:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    print()
+    writer.close()
+    checkpoint.close()
+    pool.shutdown()
+    print(f"✅ Done: {done} frames in {time.time() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk posture analysis over images and videos")
+    parser.add_argument("inputs", nargs="+", help="image/video files or directories")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file, or directory for parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--model", default="yolov8n-pose.pt")
+    parser.add_argument("--backend", choices=BACKENDS, default=BACKEND, help="exported graphs come from backends.py export")
+    parser.add_argument("--batch", type=int, default=16, help="frames per forward pass")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="decode threads")
+    parser.add_argument("--prefetch", type=int, default=64, help="max decoded frames waiting for inference")
+    parser.add_argument("--every", type=int, default=1, help="analyze every Nth video frame")
+    parser.add_argument("--conf", type=float, default=0.3)
+    parser.add_argument("--iou", type=float, default=0.7)
+    parser.add_argument("--min-person-conf", type=float, default=0.25)
+    parser.add_argument("--keypoints", action="store_true", help="include keypoints in each row")
+    parser.add_argument("--tips", action="store_true", help="include rendered tip text")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Confidence-gated model cascade: nano first, larger models only when needed.
+
+With ``ERGOWISE_CASCADE=yolov8s-pose.pt`` (or a comma-separated chain such as
+``yolov8s-pose.pt,yolov8m-pose.pt``) every frame runs through
+``ERGOWISE_CASCADE_FIRST`` first (``yolov8n-pose.pt`` by default; empty means
+the app's own model), then the app's own model, then the listed models.
+Names already in the chain are skipped, and the app's model is reused rather
+than loaded twice, so app.py (yolov8s) runs n -> s and the nano apps run
+n -> listed models. The stage order is printed at startup and shown under
+``cascade.stages`` in /model-info.
+
+A frame is escalated to the next model only when the best
+person's confidence is below ``ERGOWISE_CASCADE_MIN_CONF``, or when one of the
+keypoints posture_report depends on is below ``ERGOWISE_CASCADE_MIN_KPT_CONF``.
+Those keypoints are shoulders, hips and either ear by default
+(``ERGOWISE_CASCADE_KEYPOINTS``, where ``a|b`` means "a or b").
+
+Clean webcam frames cost one nano forward pass; hard frames (dim, occluded,
+far away) still get the larger model. ``PoseCascade`` has the same
+``predict`` interface as the batcher and worker pool, so the apps' detection
+code does not change. Decisions are counted per stage in /metrics.
+"""
+import os
+import time
+
+from batching import InferenceBatcher
+from backends import load_model
+from inference_server import INFERENCE_WORKERS, InferenceWorkerPool
+from pose_extract import best_pose
+from posture_batch import KPT_INDEX
+
+CASCADE_MODELS = tuple(m for m in os.environ.get("ERGOWISE_CASCADE", "").split(",") if m)
+CASCADE_FIRST = os.environ.get("ERGOWISE_CASCADE_FIRST", "yolov8n-pose.pt")
+CASCADE_MIN_CONF = float(os.environ.get("ERGOWISE_CASCADE_MIN_CONF", "0.5"))
+CASCADE_MIN_KPT_CONF = float(os.environ.get("ERGOWISE_CASCADE_MIN_KPT_CONF", "0.5"))
+CASCADE_KEYPOINTS = os.environ.get(
+    "ERGOWISE_CASCADE_KEYPOINTS", "left_shoulder,right_shoulder,left_hip,right_hip,left_ear|right_ear")
+
+# Appended to result cache namespaces: a cascade can change the answer
+CASCADE_KEY = (
+    f"|cascade={CASCADE_FIRST}>{','.join(CASCADE_MODELS)}@{CASCADE_MIN_CONF}/{CASCADE_MIN_KPT_CONF}/{CASCADE_KEYPOINTS}"
+    if CASCADE_MODELS else ""
+)
+
+
+def keypoint_groups(spec=CASCADE_KEYPOINTS):
+    """``"a,b|c"`` -> [[index a], [index b, index c]]"""
+    return [[KPT_INDEX[name] for name in group.split("|")] for group in spec.split(",") if group]
+
+
+def escalation_reason(kpts, conf, groups, min_conf=CASCADE_MIN_CONF, min_kpt_conf=CASCADE_MIN_KPT_CONF):
+    """Why a detection is not good enough to stop at, or None if it is"""
+    if kpts is None:
+        return "no_person"
+    if conf < min_conf:
+        return "person_conf"
+    kconf = kpts[:, 2].tolist()
+    for group in groups:
+        if max(kconf[i] for i in group) < min_kpt_conf:
+            return "keypoint_conf"
+    return None
+
+
+def stage_inference(model_name, executor=None):
+    """Serve ``model_name`` the same way the apps serve their main model"""
+    if INFERENCE_WORKERS > 0:
+        return InferenceWorkerPool(model_name)
+    return InferenceBatcher(load_model(model_name), executor=executor)
+
+
+class PoseCascade:
+    """Runs stages in order until a detection passes the confidence gates"""
+
+    def __init__(self, model_name, inference, models=CASCADE_MODELS, executor=None, metrics=None,
+                 min_conf=CASCADE_MIN_CONF, min_kpt_conf=CASCADE_MIN_KPT_CONF, keypoints=CASCADE_KEYPOINTS,
+                 first=CASCADE_FIRST):
+        self.stages = []
+        for name in dict.fromkeys((first or model_name, model_name) + tuple(models)):
+            if name == model_name:
+                self.stages.append((name, inference))  # already loaded by the app
+            else:
+                self.stages.append((name, stage_inference(name, executor)))
+                print(f"✅ Cascade stage {len(self.stages)}: {name}")
+        print(f"🔀 Cascade: {' -> '.join(name for name, _ in self.stages)}")
+        self.min_conf = min_conf
+        self.min_kpt_conf = min_kpt_conf
+        self.keypoints = keypoints
+        self.groups = keypoint_groups(keypoints)
+        # Plain counters for /model-info; /metrics gets the labelled version
+        self.frames = [0] * len(self.stages)
+        self.escalated = [0] * len(self.stages)
+        self.metrics = metrics
+        self.decisions = None
+        if metrics is not None:
+            self.decisions = metrics.counter(
+                "ergowise_cascade_frames_total", "Frames handled by each cascade stage",
+                ("model", "decision", "reason"))
+            metrics.gauge("ergowise_cascade_escalation_ratio",
+                          "Share of frames the first cascade stage passed on", lambda: self.escalation_rate(0))
+
+    @property
+    def queued(self):
+        return sum(stage.queued for _, stage in self.stages)
+
+    async def predict(self, img, conf=0.25, iou=0.7, imgsz=None):
+        """Same contract as ``InferenceBatcher.predict``"""
+        kept = None
+        last = len(self.stages) - 1
+        for i, (name, stage) in enumerate(self.stages):
+            t = time.perf_counter()
+            results = await stage.predict(img, conf=conf, iou=iou, imgsz=imgsz)
+            if self.metrics is not None:
+                self.metrics.lap("cascade", t, model=name)
+            self.frames[i] += 1
+
+            kpts, _, best_conf = best_pose(results)
+            if kpts is not None:
+                kept = results
+            reason = escalation_reason(kpts, best_conf, self.groups, self.min_conf, self.min_kpt_conf)
+            if reason is None or i == last:
+                self._decide(name, "accepted" if reason is None else "exhausted", reason or "")
+                # A larger model that finds nobody does not erase an earlier detection
+                return results if kpts is not None or kept is None else kept
+            self.escalated[i] += 1
+            self._decide(name, "escalated", reason)
+
+    def _decide(self, model_name, decision, reason):
+        if self.decisions is not None:
+            self.decisions.inc((model_name, decision, reason))
+
+    def escalation_rate(self, stage):
+        return round(self.escalated[stage] / self.frames[stage], 4) if self.frames[stage] else 0.0
+
+    def status(self):
+        return {
+            "stages": [name for name, _ in self.stages],
+            "gates": {"min_conf": self.min_conf, "min_kpt_conf": self.min_kpt_conf, "keypoints": self.keypoints},
+            "frames": dict(zip((name for name, _ in self.stages), self.frames)),
+            "escalation_rate": {name: self.escalation_rate(i) for i, (name, _) in enumerate(self.stages[:-1])},
+        }
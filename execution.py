@@ -0,0 +1,83 @@
+"""Execution layer that keeps blocking work off the asyncio event loop.
+
+OpenCV decode/preprocessing and torch inference release the GIL, so they run
+on a sized thread pool. The pure-Python ``posture_report`` (posture_report.py)
+can optionally run in a process pool. Admission is bounded: once
+``max_pending`` requests are in flight, new ones are rejected with
+``Saturated`` so the app can answer 503 instead of queueing without limit.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+CPU_WORKERS = int(os.environ.get("ERGOWISE_CPU_WORKERS", str(os.cpu_count() or 4)))
+# 0 keeps posture_report on the thread pool; >0 enables a process pool
+REPORT_PROCESSES = int(os.environ.get("ERGOWISE_REPORT_PROCESSES", "0"))
+MAX_PENDING = int(os.environ.get("ERGOWISE_MAX_PENDING", str(CPU_WORKERS * 4)))
+
+
+class Saturated(Exception):
+    """Raised when the bounded request queue is full"""
+
+
+class ExecutionLayer:
+    """Thread pool for OpenCV/torch work, optional process pool for reports"""
+
+    def __init__(self, cpu_workers=CPU_WORKERS, report_processes=REPORT_PROCESSES, max_pending=MAX_PENDING):
+        self.cpu_workers = max(1, int(cpu_workers))
+        self.cpu_pool = ThreadPoolExecutor(max_workers=self.cpu_workers, thread_name_prefix="ergowise-cpu")
+        self.report_processes = max(0, int(report_processes))
+        self.report_pool = None
+        if self.report_processes > 0:
+            # Not fork: by the time the pool starts its workers the process has
+            # thread pools and torch/OpenMP threads, and forking those can
+            # deadlock the child. Report functions are pickled by reference, so
+            # the apps submit the ones in posture_report.py, which workers can
+            # import without an app module's startup side effects. (A script
+            # started as `python app.py` is still re-run by multiprocessing in
+            # each worker; serve the apps with `uvicorn app:app` to avoid it.)
+            methods = multiprocessing.get_all_start_methods()
+            ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            self.report_pool = ProcessPoolExecutor(max_workers=self.report_processes, mp_context=ctx)
+        self.max_pending = max(1, int(max_pending))
+        self.pending = 0
+
+    @contextlib.contextmanager
+    def admit(self):
+        """Reserve a slot for one request for the duration of the block.
+
+        Only touched from the event loop thread, so a plain counter is enough.
+        """
+        if self.pending >= self.max_pending:
+            raise Saturated(f"{self.pending} requests already in flight")
+        self.pending += 1
+        try:
+            yield
+        finally:
+            self.pending -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run a blocking call on the CPU thread pool, in the caller's context
+        (like ``asyncio.to_thread``, so e.g. ``metrics.unrecorded`` applies)"""
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        return await loop.run_in_executor(self.cpu_pool, functools.partial(ctx.run, fn, *args, **kwargs))
+
+    async def run_report(self, fn, *args):
+        """Run posture scoring, in the process pool when one is configured"""
+        if self.report_pool is None:
+            return await self.run(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.report_pool, fn, *args)
+
+    def status(self):
+        return {
+            "cpu_workers": self.cpu_workers,
+            "report_processes": self.report_processes,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+        }
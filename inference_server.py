@@ -0,0 +1,347 @@
+"""Inference-server mode: a pool of worker processes that each own a model replica.
+
+Decoded frames are handed to workers through a ``multiprocessing.shared_memory``
+ring buffer per worker, so only a small job header crosses the process
+boundary instead of a pickled image. Each worker is pinned to its own slice of
+CPUs and sizes torch's intra-op thread pool to match, which lets throughput
+scale with cores instead of being serialized behind one interpreter.
+
+Enable it with ``ERGOWISE_INFERENCE_WORKERS=<n>``; 0 keeps the in-process model.
+"""
+import asyncio
+import atexit
+import contextlib
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+
+from execution import Saturated
+
+INFERENCE_WORKERS = int(os.environ.get("ERGOWISE_INFERENCE_WORKERS", "0"))
+# Frames each worker can have in flight (ring buffer slots)
+RING_SLOTS = int(os.environ.get("ERGOWISE_RING_SLOTS", "4"))
+# preprocess_image never returns frames larger than this on either side
+FRAME_MAX_SIDE = int(os.environ.get("ERGOWISE_FRAME_MAX_SIDE", "640"))
+# How often the result reader checks for workers that died without a message
+LIVENESS_CHECK_S = 1.0
+
+
+class WorkersUnavailable(Saturated):
+    """No inference worker is alive and loaded; the app answers 503"""
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cpus(cpus, workers):
+    """Give each worker a contiguous slice of CPUs (shared round-robin if too few)"""
+    if workers >= len(cpus):
+        return [[cpus[i % len(cpus)]] for i in range(workers)]
+    chunk = len(cpus) // workers
+    return [cpus[i * chunk:(i + 1) * chunk] for i in range(workers)]
+
+
+def worker_context():
+    """Start workers from a clean process rather than forking the app.
+
+    forkserver with an explicit preload list keeps the heavy imports out of
+    each start-up; ``main_not_reimported`` keeps the app script itself out.
+    Where forkserver is not available (Windows) spawn is used.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["inference_server"])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+@contextlib.contextmanager
+def main_not_reimported():
+    """Keep worker processes from re-running a ``python app.py`` entry script.
+
+    multiprocessing re-imports ``__main__`` from its file path in every new
+    process, which would load the app's model and start a nested pool. The
+    workers only need this module, so hide the path while they start.
+    """
+    main = sys.modules.get("__main__")
+    path = getattr(main, "__file__", None)
+    if path is None or getattr(main, "__spec__", None) is not None:
+        yield
+        return
+    del main.__file__
+    try:
+        yield
+    finally:
+        main.__file__ = path
+
+
+class FrameRing:
+    """Fixed-size uint8 frame slots laid out in one shared memory block"""
+
+    def __init__(self, slots, max_side, name=None):
+        self.slots = slots
+        self.slot_bytes = max_side * max_side * 3
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=slots * self.slot_bytes)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def view(self, slot, h, w):
+        return np.ndarray((h, w, 3), dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def load_trusted_model(model_name):
+    """Load a trusted ultralytics checkpoint inside a worker process"""
+    os.environ['TORCH_WEIGHTS_ONLY'] = 'False'
+    import torch
+    from ultralytics import YOLO
+
+    # Same approach as the apps: checkpoints are trusted, allow full unpickling
+    original_torch_load = torch.load
+
+    def unsafe_load(*args, **kwargs):
+        kwargs['weights_only'] = False
+        return original_torch_load(*args, **kwargs)
+
+    torch.load = unsafe_load
+    try:
+        return YOLO(model_name)
+    finally:
+        torch.load = original_torch_load
+
+
+def worker_main(index, model_name, ring_name, slots, max_side, cpu_ids, threads, jobs, results):
+    """Worker process loop: read frames from the ring, run pose, send back arrays"""
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpu_ids)
+        except OSError:
+            pass
+    from backends import BACKEND, load_model
+    from pose_extract import extract_poses
+    if BACKEND == "torch":
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    ring = FrameRing(slots, max_side, name=ring_name)
+    try:
+        # Exported backends size their own thread pool and never import torch here
+        model = load_model(model_name, threads=threads)
+    except Exception as e:
+        results.put(("error", index, f"Worker {index} failed to load {model_name}: {e}"))
+        ring.close()
+        return
+    results.put(("ready", index, None))
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job_id, slot, h, w, conf, iou, imgsz = job
+        kwargs = {"conf": conf, "iou": iou, "verbose": False}
+        if imgsz is not None:
+            kwargs["imgsz"] = imgsz
+        try:
+            if hasattr(model, "predict_arrays"):
+                results.put(("result", job_id, model.predict_arrays(ring.view(slot, h, w), **kwargs)[0]))
+                continue
+            kpts, box_conf, boxes = extract_poses(model(ring.view(slot, h, w), **kwargs)[0])
+            results.put(("result", job_id, (kpts[..., :2], kpts[..., 2], box_conf, boxes)))
+        except Exception as e:
+            results.put(("failed", job_id, str(e)))
+    ring.close()
+
+
+class PoseResult:
+    """Minimal stand-in for an ultralytics Results object.
+
+    Carries the raw (xy, kconf, box_conf, box_xyxy) arrays for
+    ``pose_extract`` plus the fields older callers read (keypoints.xy,
+    keypoints.conf, boxes.conf and boxes.xyxy) as zero-copy torch tensors.
+    """
+
+    def __init__(self, xy, kconf, box_conf, box_xyxy):
+        import torch
+        self.arrays = (xy, kconf, box_conf, box_xyxy)
+        self.keypoints = SimpleNamespace(
+            xy=torch.from_numpy(xy),
+            conf=torch.from_numpy(kconf) if kconf is not None else None,
+        )
+        self.boxes = SimpleNamespace(conf=torch.from_numpy(box_conf), xyxy=torch.from_numpy(box_xyxy))
+
+
+class InferenceWorkerPool:
+    """Dispatches frames to pinned model-replica processes via shared memory"""
+
+    def __init__(self, model_name, workers=INFERENCE_WORKERS, slots=RING_SLOTS, max_side=FRAME_MAX_SIDE, threads=None):
+        self.model_name = model_name
+        self.max_side = max_side
+        ctx = worker_context()
+        self._results = ctx.Queue()
+        self._workers = []
+        self._pending = {}
+        self._ids = itertools.count()
+        self._loop = None
+        self._slots_available = None
+        self.ready = set()
+        self.errors = {}
+
+        cpu_sets = split_cpus(available_cpus(), max(1, workers))
+        for index, cpu_ids in enumerate(cpu_sets):
+            ring = FrameRing(slots, max_side)
+            jobs = ctx.Queue()
+            proc = ctx.Process(
+                target=worker_main,
+                args=(index, model_name, ring.name, slots, max_side, cpu_ids, threads or len(cpu_ids), jobs, self._results),
+                daemon=True,
+                name=f"ergowise-inference-{index}",
+            )
+            with main_not_reimported():
+                proc.start()
+            self._workers.append({"proc": proc, "jobs": jobs, "ring": ring, "free": list(range(slots))})
+
+        self._reader = threading.Thread(target=self._drain, daemon=True, name="ergowise-inference-results")
+        self._reader.start()
+        atexit.register(self.close)
+
+    async def predict(self, img, conf=0.25, iou=0.7, imgsz=None):
+        """Run pose on one frame in a worker; returns ``[PoseResult]``"""
+        h, w = img.shape[:2]
+        if h > self.max_side or w > self.max_side:
+            raise ValueError(f"Frame {w}x{h} exceeds ring slot size {self.max_side}px")
+
+        self._bind_loop()
+        while True:
+            if not self._healthy():
+                raise WorkersUnavailable(f"No healthy inference workers for {self.model_name}")
+            await self._slots_available.acquire()
+            healthy = self._healthy()
+            if not healthy:
+                self._slots_available.release()
+                raise WorkersUnavailable(f"No healthy inference workers for {self.model_name}")
+            # Least-loaded worker = the one with the most free ring slots
+            index = max(healthy, key=lambda i: len(self._workers[i]["free"]))
+            if self._workers[index]["free"]:
+                break
+            # Only a dead worker had a free slot: retire that permit for good
+            for i in range(len(self._workers)):
+                if i not in healthy and self._workers[i]["free"]:
+                    self._workers[i]["free"].pop()
+                    break
+        worker = self._workers[index]
+        slot = worker["free"].pop()
+
+        np.copyto(worker["ring"].view(slot, h, w), img)
+        job_id = next(self._ids)
+        fut = self._loop.create_future()
+        self._pending[job_id] = (fut, index, slot)
+        worker["jobs"].put((job_id, slot, h, w, conf, iou, imgsz))
+        return await fut
+
+    @property
+    def queued(self):
+        """Frames handed to workers and not yet answered"""
+        return len(self._pending)
+
+    def _healthy(self):
+        """Workers that can take jobs: not failed, not dead (may still be loading)"""
+        return [i for i, w in enumerate(self._workers) if i not in self.errors and w["proc"].is_alive()]
+
+    def status(self):
+        return {
+            "workers": len(self._workers),
+            "ready": len(self.ready),
+            "healthy": len(self._healthy()),
+            "errors": list(self.errors.values()),
+            "in_flight": len(self._pending),
+        }
+
+    def close(self):
+        for worker in self._workers:
+            if worker["proc"].is_alive():
+                worker["jobs"].put(None)
+        for worker in self._workers:
+            worker["proc"].join(timeout=2)
+            if worker["proc"].is_alive():
+                worker["proc"].terminate()
+            worker["ring"].close(unlink=True)
+        self._workers = []
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            free = sum(len(w["free"]) for w in self._workers)
+            self._slots_available = asyncio.Semaphore(free)
+
+    def _drain(self):
+        """Reader thread: hand worker messages back to the event loop"""
+        while True:
+            try:
+                msg = self._results.get(timeout=LIVENESS_CHECK_S)
+            except queue.Empty:
+                for index, worker in enumerate(list(self._workers)):
+                    if index not in self.errors and not worker["proc"].is_alive():
+                        self._worker_failed(index, f"Worker {index} exited (code {worker['proc'].exitcode})")
+                continue
+            except (EOFError, OSError):
+                return
+            kind, key, payload = msg
+            if kind == "ready":
+                self.ready.add(key)
+            elif kind == "error":
+                self._worker_failed(key, payload)
+            elif self._loop is not None:
+                self._loop.call_soon_threadsafe(self._complete, kind, key, payload)
+
+    def _worker_failed(self, index, reason):
+        """Reader thread: take a worker out of rotation and fail its jobs"""
+        self.errors[index] = reason
+        print(f"❌ {reason}")
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._fail_pending, index, reason)
+
+    def _fail_pending(self, index, reason):
+        for job_id, (fut, worker_index, _) in list(self._pending.items()):
+            if worker_index == index:
+                self._complete("unavailable", job_id, reason)
+
+    def _complete(self, kind, job_id, payload):
+        entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return
+        fut, index, slot = entry
+        # The worker is done with the frame, so the slot can be reused
+        self._workers[index]["free"].append(slot)
+        self._slots_available.release()
+        if fut.done():
+            return
+        if kind == "result":
+            fut.set_result([PoseResult(*payload)])
+        elif kind == "unavailable":
+            fut.set_exception(WorkersUnavailable(payload))
+        else:
+            fut.set_exception(RuntimeError(payload))
@@ -0,0 +1,251 @@
+"""Load generator for the posture APIs.
+
+Targets any of the apps (app.py on 8002, app_enhanced.py on 8001, ...).
+Replays a corpus of images, or a directory recorded by recording.py, and
+reports throughput, p50/p95/p99 latency and error rates per endpoint.
+
+    python loadtest.py http://localhost:8002 photos/ --rate 20 --duration 60
+    python loadtest.py http://localhost:8001 recorded/ --concurrency 8 --duration 30 -o load.json
+    python loadtest.py http://localhost:8002 recorded/ --pace recorded --speed 2
+
+--rate is an open-loop test: requests start on schedule whether or not
+earlier ones finished, and latency is measured from the scheduled start, so
+a stalled server shows up as latency rather than as fewer requests.
+--concurrency is closed-loop: N clients each send their next request as soon
+as the previous one is answered. --pace recorded reproduces the arrival
+pattern stored in a recorded corpus.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import mimetypes
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+def load_corpus(paths, endpoint):
+    """Requests as dicts with method, path, query, content and content_type.
+
+    A directory containing ``index.jsonl`` is a recorded corpus and is
+    replayed verbatim; image files become multipart uploads to ``endpoint``.
+    """
+    import httpx
+
+    requests = []
+    for path in paths:
+        index = os.path.join(path, "index.jsonl")
+        if os.path.isdir(path) and os.path.exists(index):
+            with open(index, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    with open(os.path.join(path, entry["body"]), "rb") as body:
+                        content = body.read()
+                    requests.append({
+                        "method": entry["method"], "path": entry["path"], "query": entry.get("query", ""),
+                        "content": content, "content_type": entry.get("content_type", ""), "t": entry.get("t"),
+                    })
+            continue
+
+        files = []
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, n) for n in names)
+        else:
+            files = [path]
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTS:
+                continue
+            with open(name, "rb") as f:
+                data = f.read()
+            mime = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            # Encode the multipart body once up front rather than per request
+            req = httpx.Request("POST", "http://corpus" + endpoint, files={"file": (os.path.basename(name), data, mime)})
+            requests.append({
+                "method": "POST", "path": endpoint, "query": "",
+                "content": req.read(), "content_type": req.headers["content-type"], "t": None,
+            })
+    return requests
+
+
+class Stats:
+    """Latencies and outcomes per endpoint"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+
+    def add(self, path, latency_s, status):
+        self.latencies.setdefault(path, []).append(latency_s)
+        counts = self.statuses.setdefault(path, {})
+        counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, elapsed):
+        out = {}
+        for path, lat in sorted(self.latencies.items()):
+            ms = np.array(lat) * 1000
+            statuses = self.statuses[path]
+            ok = sum(n for s, n in statuses.items() if isinstance(s, int) and 200 <= s < 300)
+            out[path] = {
+                "requests": len(lat),
+                "ok": ok,
+                "error_rate": round(1 - ok / len(lat), 4),
+                "throughput_rps": round(ok / elapsed, 2),
+                "latency_ms": {
+                    "p50": round(float(np.percentile(ms, 50)), 2),
+                    "p95": round(float(np.percentile(ms, 95)), 2),
+                    "p99": round(float(np.percentile(ms, 99)), 2),
+                    "mean": round(float(ms.mean()), 2),
+                    "max": round(float(ms.max()), 2),
+                },
+                "statuses": {str(s): n for s, n in sorted(statuses.items(), key=lambda kv: str(kv[0]))},
+            }
+        return out
+
+
+async def send(client, base_url, item, stats, started, measure_from=None):
+    """Send one request; latency counts from ``measure_from`` when given"""
+    url = base_url + item["path"] + ("?" + item["query"] if item["query"] else "")
+    t0 = measure_from if measure_from is not None else time.perf_counter()
+    try:
+        r = await client.request(item["method"], url, content=item["content"],
+                                 headers={"content-type": item["content_type"]} if item["content_type"] else None)
+        status = r.status_code
+    except Exception as e:
+        status = type(e).__name__
+    done = time.perf_counter()
+    if t0 >= started:  # requests scheduled during warm-up are not counted
+        stats.add(item["path"], done - t0, status)
+
+
+async def open_loop(client, args, corpus, stats, started):
+    """Fixed (or Poisson) arrival rate for --duration seconds"""
+    rng = random.Random(args.seed)
+    tasks = set()
+    begin = time.perf_counter()
+    end = started + args.duration
+    next_at = begin
+    i = 0
+    while next_at < end:
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) < args.max_outstanding:
+            task = asyncio.create_task(send(client, args.url, corpus[i % len(corpus)], stats, started, measure_from=next_at))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        elif next_at >= started:
+            stats.add(corpus[i % len(corpus)]["path"], 0.0, "client_overload")
+        i += 1
+        gap = rng.expovariate(args.rate) if args.poisson else 1.0 / args.rate
+        next_at += gap
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def closed_loop(client, args, corpus, stats, started):
+    """``--concurrency`` clients, each sending back to back until the deadline"""
+    end = started + args.duration
+    counter = itertools.count()
+
+    async def worker():
+        while time.perf_counter() < end:
+            await send(client, args.url, corpus[next(counter) % len(corpus)], stats, started)
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+
+
+async def recorded_pace(client, args, corpus, stats, started):
+    """Replay a recorded corpus once with its original inter-arrival gaps"""
+    timed = sorted((c for c in corpus if c["t"] is not None), key=lambda c: c["t"])
+    if not timed:
+        sys.exit("--pace recorded needs a corpus recorded by recording.py")
+    tasks = []
+    origin = timed[0]["t"]
+    for item in timed:
+        at = started + (item["t"] - origin) / args.speed
+        delay = at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send(client, args.url, item, stats, started, measure_from=at)))
+    await asyncio.gather(*tasks)
+
+
+async def run(args):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("loadtest.py needs httpx (pip install httpx)")
+
+    corpus = load_corpus(args.corpus, args.endpoint)
+    if not corpus:
+        sys.exit("No requests in corpus")
+    if args.shuffle:
+        random.Random(args.seed).shuffle(corpus)
+    args.url = args.url.rstrip("/")
+
+    limits = httpx.Limits(max_connections=args.max_outstanding, max_keepalive_connections=args.max_outstanding)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        stats = Stats()
+        started = time.perf_counter() + args.warmup
+        if args.pace == "recorded":
+            started = time.perf_counter()
+            await recorded_pace(client, args, corpus, stats, started)
+        elif args.rate:
+            await open_loop(client, args, corpus, stats, started)
+        else:
+            await closed_loop(client, args, corpus, stats, started)
+        elapsed = time.perf_counter() - started
+        if args.pace != "recorded":
+            # The last arrival can land just before the deadline
+            elapsed = max(elapsed, args.duration)
+
+    mode = "recorded" if args.pace == "recorded" else f"rate={args.rate}/s" if args.rate else f"concurrency={args.concurrency}"
+    report = {
+        "url": args.url,
+        "mode": mode,
+        "duration_s": round(elapsed, 2),
+        "corpus_requests": len(corpus),
+        "endpoints": stats.summary(elapsed),
+    }
+    print(f"\n📊 {args.url}  {mode}  {elapsed:.1f}s")
+    for path, s in report["endpoints"].items():
+        lat = s["latency_ms"]
+        print(f"  {path:<24} {s['requests']:>7} req  {s['throughput_rps']:>8.1f} ok/s  "
+              f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f} ms  "
+              f"errors {s['error_rate']:.1%}  {s['statuses']}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Wrote {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the posture APIs")
+    parser.add_argument("url", help="base URL, e.g. http://localhost:8002")
+    parser.add_argument("corpus", nargs="+", help="image files/directories, or a recorded corpus directory")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, help="open loop: requests per second")
+    mode.add_argument("--concurrency", type=int, default=4, help="closed loop: concurrent clients")
+    mode.add_argument("--pace", choices=["recorded"], help="replay a recorded corpus with its arrival times")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival gaps with --rate")
+    parser.add_argument("--speed", type=float, default=1.0, help="time compression for --pace recorded")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds (not used with --pace)")
+    parser.add_argument("--warmup", type=float, default=0.0, help="seconds of traffic excluded from the stats")
+    parser.add_argument("--endpoint", default="/analyze", help="endpoint image files are uploaded to")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--max-outstanding", type=int, default=256, help="cap on in-flight requests")
+    parser.add_argument("--shuffle", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
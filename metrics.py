@@ -0,0 +1,191 @@
+"""Prometheus-style instrumentation for the analysis pipeline.
+
+Each app owns one ``PipelineMetrics``: a latency histogram per pipeline stage
+and model, a counter of request outcomes, and gauges that are sampled when
+``/metrics`` is scraped. ``render()`` produces the Prometheus text format, so
+no client library is needed.
+
+Recording is lock-free: every thread writes only to its own shard of plain
+lists (registered once under a lock), and a scrape sums the shards. An
+observation is a ``bisect`` plus two list updates, well under a microsecond
+on the event loop. Synthetic traffic (the model warm-up in readiness.py) runs
+inside ``unrecorded()`` and leaves no trace.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds: sub-millisecond stages up to multi-second requests
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# "cascade" is recorded per cascade stage model (see cascade.py)
+STAGES = ("read", "decode", "preprocess", "inference", "cascade", "extract", "report", "serialize", "total")
+OUTCOMES = ("detected", "undetected", "failed", "rejected")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# True while synthetic frames are processed; per context, not global, so real
+# requests served at the same time are still recorded
+_unrecorded = contextvars.ContextVar("ergowise_metrics_unrecorded", default=False)
+
+
+@contextlib.contextmanager
+def unrecorded():
+    """Drop histogram and counter updates made in this context (and in tasks
+    it creates), e.g. by warm-up frames"""
+    token = _unrecorded.set(True)
+    try:
+        yield
+    finally:
+        _unrecorded.reset(token)
+
+
+class _Sharded:
+    """Per-thread ``{label values: list}`` shards, summed at scrape time"""
+
+    def __init__(self, name, help_text, labelnames):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+
+    def _series(self):
+        series = getattr(self._local, "series", None)
+        if series is None:
+            series = self._local.series = {}
+            with self._lock:
+                self._shards.append(series)
+        return series
+
+    def _collect(self, width):
+        totals = {}
+        with self._lock:
+            shards = list(self._shards)
+        for shard in shards:
+            # dict.items() is copied in one step under the GIL, so an owner
+            # thread adding a series mid-scrape cannot break the iteration
+            for labels, values in list(shard.items()):
+                total = totals.setdefault(labels, [0] * width)
+                for i, v in enumerate(values):
+                    total[i] += v
+        return totals
+
+    def _labels(self, values, extra=""):
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram(_Sharded):
+    def __init__(self, name, help_text, labelnames, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels, value):
+        """Record ``value`` seconds for the ``labels`` tuple"""
+        if _unrecorded.get():
+            return
+        series = self._series()
+        counts = series.get(labels)
+        if counts is None:
+            # One slot per bucket, one for +Inf, then the running sum
+            counts = series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in sorted(self._collect(len(self.buckets) + 2).items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {cumulative}")
+        return lines
+
+
+class Counter(_Sharded):
+    def inc(self, labels, amount=1):
+        if _unrecorded.get():
+            return
+        series = self._series()
+        value = series.get(labels)
+        if value is None:
+            value = series[labels] = [0]
+        value[0] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, (value,) in sorted(self._collect(1).items()):
+            lines.append(f"{self.name}{self._labels(labels)} {value}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def result_outcome(result):
+    """Classify an /analyze result as detected, undetected or failed"""
+    if not isinstance(result, dict):
+        return "failed"  # JSONResponse errors such as "Invalid image"
+    if result.get("detected"):
+        return "detected"
+    if result.get("message", "").startswith("Analysis failed"):
+        return "failed"
+    return "undetected"
+
+
+class PipelineMetrics:
+    """Stage histograms, outcome counters and scrape-time gauges for one app"""
+
+    def __init__(self, model_name, buckets=DEFAULT_BUCKETS):
+        self.model_name = model_name
+        self.stages = Histogram(
+            "ergowise_stage_seconds", "Time spent in each analysis stage", ("model", "stage"), buckets)
+        self.outcomes = Counter(
+            "ergowise_requests_total", "Analysis requests by endpoint and outcome", ("model", "endpoint", "outcome"))
+        self.counters = []
+        self.gauges = []
+
+    def observe(self, stage, seconds, model=None):
+        self.stages.observe((model or self.model_name, stage), seconds)
+
+    def lap(self, stage, started, model=None):
+        """Record the time since ``started`` for ``stage``; returns the new start"""
+        now = time.perf_counter()
+        self.stages.observe((model or self.model_name, stage), now - started)
+        return now
+
+    def outcome(self, outcome, endpoint="analyze", model=None):
+        self.outcomes.inc((model or self.model_name, endpoint, outcome))
+
+    def counter(self, name, help_text, labelnames):
+        """Register and return an extra counter rendered with the others"""
+        counter = Counter(name, help_text, labelnames)
+        self.counters.append(counter)
+        return counter
+
+    def gauge(self, name, help_text, fn):
+        """Register a gauge whose value ``fn()`` is read at scrape time"""
+        self.gauges.append((name, help_text, fn))
+
+    def render(self):
+        lines = self.stages.render() + self.outcomes.render()
+        for counter in self.counters:
+            lines += counter.render()
+        for name, help_text, fn in self.gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge",
+                      f'{name}{{model="{_escape(self.model_name)}"}} {value}']
+        return "\n".join(lines) + "\n"
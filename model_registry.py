@@ -0,0 +1,224 @@
+"""Registry of pose models so one process can serve several checkpoints.
+
+Requests pick a model with ``?model=yolov8m-pose.pt`` or an ``X-Model``
+header; without one they get the app's own ``MODEL_NAME``, which is pinned.
+Other models are loaded on first use (on the CPU pool, then warmed with one
+synthetic frame), counted against a memory budget, and unloaded least
+recently used first when a new model would not fit, or once they have been
+idle for ``ERGOWISE_MODEL_IDLE_S``. Idle models are swept after each request
+and every ``ERGOWISE_MODEL_SWEEP_S`` seconds from a background task, so a
+model is released even when no further requests arrive. Models in use by a
+request are never unloaded.
+
+``ERGOWISE_MODELS`` lists the checkpoints requests may ask for, so a query
+string cannot make the server download or open arbitrary files. Extra models
+are served plainly (batcher or worker pool); the cascade only wraps the
+default model, and asking for one of its other stages gets that stage's
+already loaded model (``share``) rather than a second copy.
+"""
+import asyncio
+import contextlib
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+from batching import InferenceBatcher
+from backends import BACKEND, exported_path, load_model
+from inference_server import INFERENCE_WORKERS, InferenceWorkerPool
+from readiness import synthetic_frame
+
+MODELS = tuple(m for m in os.environ.get(
+    "ERGOWISE_MODELS",
+    "yolov8n-pose.pt,yolov8s-pose.pt,yolov8m-pose.pt,yolov8l-pose.pt,yolo11n-pose.pt,yolo11s-pose.pt,yolo11m-pose.pt",
+).split(",") if m)
+MODEL_MEMORY_MB = float(os.environ.get("ERGOWISE_MODEL_MEMORY_MB", "2048"))
+MODEL_IDLE_S = float(os.environ.get("ERGOWISE_MODEL_IDLE_S", "900"))
+MODEL_SWEEP_S = float(os.environ.get("ERGOWISE_MODEL_SWEEP_S", "60"))
+# Resident size relative to the weights: activations, allocator arenas, workspaces
+MODEL_MEMORY_FACTOR = float(os.environ.get("ERGOWISE_MODEL_MEMORY_FACTOR", "3.0"))
+
+
+class UnknownModel(ValueError):
+    """Raised for a model name that is not in the allowed list"""
+
+
+def weights_bytes(model, model_name):
+    """Bytes of weights held by ``model`` (torch), or the file it was loaded from"""
+    net = getattr(model, "model", None)
+    if net is not None and hasattr(net, "parameters"):
+        tensors = itertools.chain(net.parameters(), net.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    path = exported_path(model_name, BACKEND) if BACKEND != "torch" else model_name
+    if BACKEND == "openvino":
+        path = path[:-len(".xml")] + ".bin"
+    try:
+        return os.path.getsize(path) + (os.path.getsize(path + ".data") if os.path.exists(path + ".data") else 0)
+    except OSError:
+        return 0
+
+
+class Resident:
+    __slots__ = ("name", "inference", "bytes", "pinned", "in_use", "last_used", "uses")
+
+    def __init__(self, name, inference, nbytes, pinned=False):
+        self.name = name
+        self.inference = inference
+        self.bytes = nbytes
+        self.pinned = pinned
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.uses = 0
+
+
+class ModelRegistry:
+    """Lazily loaded pose models with a memory budget and LRU unloading"""
+
+    def __init__(self, executor=None, allowed=MODELS, budget_mb=MODEL_MEMORY_MB, idle_s=MODEL_IDLE_S,
+                 memory_factor=MODEL_MEMORY_FACTOR, sweep_s=MODEL_SWEEP_S):
+        self.executor = executor
+        self.allowed = set(allowed)
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.idle_s = idle_s
+        self.memory_factor = memory_factor
+        self.sweep_s = sweep_s
+        self.default = None
+        self.resident = OrderedDict()  # least recently used first
+        self._locks = {}
+        self.loads = 0
+        self.evictions = 0
+        self.sweeper = None
+
+    def start(self):
+        """Schedule the periodic idle sweep on the running event loop (call from a startup hook)"""
+        if self.sweeper is None and self.sweep_s > 0:
+            self.sweeper = asyncio.get_running_loop().create_task(self._sweep())
+        return self.sweeper
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_s)
+            try:
+                self._unload_idle()
+            except Exception as e:
+                print(f"⚠️ Idle model sweep failed: {e}")
+
+    def pin(self, name, inference, model=None):
+        """Register the app's own (already loaded) model; it is never unloaded"""
+        if self.default is not None:
+            self.resident.pop(self.default, None)  # reloaded, e.g. by benchmark.py
+        self.default = name
+        self.share(name, inference, model)
+
+    def share(self, name, inference, model=None):
+        """Serve ``name`` with an inference frontend loaded elsewhere (e.g. a
+        cascade stage) instead of loading it again; it is never unloaded"""
+        self.allowed.add(name)
+        nbytes = int(weights_bytes(model, name) * self.memory_factor) if model is not None else 0
+        self.resident[name] = Resident(name, inference, nbytes, pinned=True)
+
+    def check(self, name):
+        """Resolve a requested name (None = default); raises UnknownModel"""
+        if not name or name == self.default:
+            return self.default
+        if name not in self.allowed:
+            raise UnknownModel(f"Unknown model {name!r}; available: {', '.join(sorted(self.allowed))}")
+        return name
+
+    @contextlib.asynccontextmanager
+    async def use(self, name=None):
+        """Yield the inference frontend for ``name``, loading it if needed"""
+        name = self.check(name)
+        entry = self.resident.get(name)
+        if entry is None:
+            entry = await self._load(name)
+        entry.in_use += 1
+        entry.uses += 1
+        self.resident.move_to_end(name)
+        try:
+            yield entry.inference
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            self._unload_idle()
+
+    async def _load(self, name):
+        lock = self._locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            entry = self.resident.get(name)
+            if entry is not None:  # loaded while we waited
+                return entry
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            # Free room before loading (estimated from the file) so peak memory stays near budget
+            self._make_room(int(weights_bytes(None, name) * self.memory_factor), quiet=True)
+            inference, nbytes = await loop.run_in_executor(self.executor, self._build, name)
+            # One synthetic frame so the first real request is not the slow one
+            try:
+                await inference.predict(synthetic_frame())
+            except Exception as e:
+                print(f"⚠️ Warm-up of {name} failed: {e}")
+            self._make_room(nbytes)
+            entry = self.resident[name] = Resident(name, inference, nbytes)
+            self.loads += 1
+            print(f"✅ Loaded {name} on demand ({nbytes / 2**20:.0f} MB est., {time.perf_counter() - started:.1f}s)")
+            return entry
+
+    def _build(self, name):
+        if INFERENCE_WORKERS > 0:
+            # Replicas live in the workers; size them from the checkpoint on disk
+            return InferenceWorkerPool(name), int(weights_bytes(None, name) * self.memory_factor * INFERENCE_WORKERS)
+        model = load_model(name)
+        return InferenceBatcher(model, executor=self.executor), int(weights_bytes(model, name) * self.memory_factor)
+
+    def _make_room(self, nbytes, quiet=False):
+        """Unload idle models, least recently used first, until ``nbytes`` fits"""
+        for entry in list(self.resident.values()):
+            if self.used_bytes() + nbytes <= self.budget:
+                return
+            if not entry.pinned and entry.in_use == 0:
+                self._unload(entry)
+        if not quiet and self.used_bytes() + nbytes > self.budget:
+            print(f"⚠️ Model memory over budget: {(self.used_bytes() + nbytes) / 2**20:.0f} MB "
+                  f"> {self.budget / 2**20:.0f} MB (the rest are pinned or in use)")
+
+    def _unload_idle(self):
+        cutoff = time.monotonic() - self.idle_s
+        for entry in list(self.resident.values()):
+            if not entry.pinned and entry.in_use == 0 and entry.last_used < cutoff:
+                self._unload(entry)
+
+    def _unload(self, entry):
+        del self.resident[entry.name]
+        close = getattr(entry.inference, "close", None)
+        if close is not None:
+            close()
+        self.evictions += 1
+        print(f"♻️ Unloaded {entry.name} ({entry.bytes / 2**20:.0f} MB est.)")
+
+    def used_bytes(self):
+        return sum(e.bytes for e in self.resident.values())
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "default": self.default,
+            "available": sorted(self.allowed),
+            "budget_mb": round(self.budget / 2**20, 1),
+            "used_mb": round(self.used_bytes() / 2**20, 1),
+            "idle_unload_s": self.idle_s,
+            "idle_sweep_s": self.sweep_s,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "resident": [
+                {
+                    "name": e.name,
+                    "memory_mb": round(e.bytes / 2**20, 1),
+                    "pinned": e.pinned,
+                    "in_use": e.in_use,
+                    "uses": e.uses,
+                    "idle_s": round(now - e.last_used, 1),
+                }
+                for e in self.resident.values()
+            ],
+        }
@@ -0,0 +1,304 @@
+"""Append-only binary archive of per-frame keypoints and posture metrics.
+
+Set ``ERGOWISE_ARCHIVE_DIR`` to keep every scored frame server-side. Each
+frame is one fixed-size 144-byte record (``RECORD_DTYPE``): timestamp, a
+64-bit session id hash, float16 ``[17, 3]`` keypoints, the six metrics as
+float32 (NaN when a metric could not be measured), the score and a grade
+code. The same frame as /analyze JSON is about 2.5 KB, so weeks of
+10 fps monitoring take a few GB instead of tens.
+
+Records go to one file per UTC day (``poses-YYYYMMDD.bin``, 64-byte header).
+``append`` only copies the frame into an in-memory batch; a background
+thread writes batches with one ``write`` (and optional ``fsync``) every
+``ERGOWISE_ARCHIVE_FLUSH_MS`` or ``ERGOWISE_ARCHIVE_GROUP`` records,
+whichever comes first (group commit). ``ArchiveReader`` memory-maps the
+files as NumPy record arrays, so scans are zero-copy column operations:
+
+    reader = ArchiveReader("archive/")
+    for recs in reader.segments():
+        mine = recs[recs["session"] == session_hash("abc")]
+        print(mine["score"].mean())
+
+Session ids are hashed to fit the fixed record; ``sessions.jsonl`` maps the
+hashes back to the ids seen.
+"""
+import argparse
+import atexit
+import calendar
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+
+from posture_rules import METRIC_NAMES, rulebook
+
+ARCHIVE_DIR = os.environ.get("ERGOWISE_ARCHIVE_DIR", "")
+ARCHIVE_GROUP = int(os.environ.get("ERGOWISE_ARCHIVE_GROUP", "512"))
+ARCHIVE_FLUSH_MS = float(os.environ.get("ERGOWISE_ARCHIVE_FLUSH_MS", "250"))
+# fsync after each group commit (durable across power loss, not just crashes)
+ARCHIVE_FSYNC = os.environ.get("ERGOWISE_ARCHIVE_FSYNC", "0") == "1"
+
+MAGIC = b"EWPOSE01"
+HEADER_SIZE = 64
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),                  # unix seconds
+    ("session", "<u8"),            # session_hash(session_id); 0 = one-off upload
+    ("kpts", "<f2", (17, 3)),      # x, y, conf in COCO_KPTS order
+    ("metrics", "<f4", (len(METRIC_NAMES),)),
+    ("score", "u1"),
+    ("grade", "u1"),               # index into the rule table's grades, 255 = unknown
+])
+NO_GRADE = 255
+
+
+def session_hash(session_id):
+    """64-bit id stored in the ``session`` column (0 for no session)"""
+    if not session_id:
+        return 0
+    return int.from_bytes(hashlib.blake2b(session_id.encode(), digest_size=8).digest(), "little") or 1
+
+
+def segment_path(directory, day):
+    return os.path.join(directory, time.strftime("poses-%Y%m%d.bin", time.gmtime(day * 86400)))
+
+
+def _header():
+    # magic and record size; the rest is reserved
+    return (MAGIC + RECORD_DTYPE.itemsize.to_bytes(4, "little")).ljust(HEADER_SIZE, b"\0")
+
+
+class PoseArchive:
+    """Group-committing writer; ``append`` is safe from any thread or the event loop"""
+
+    def __init__(self, directory=ARCHIVE_DIR, group=ARCHIVE_GROUP, flush_ms=ARCHIVE_FLUSH_MS, fsync=ARCHIVE_FSYNC):
+        self.directory = directory
+        self.group = max(1, int(group))
+        self.flush_s = max(0.001, flush_ms / 1000.0)
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._batch = np.zeros(self.group, RECORD_DTYPE)
+        self._n = 0
+        self._new_sessions = {}
+        self._known_sessions = set()
+        self._closed = False
+        self.records = 0
+        self.commits = 0
+        self.bytes = 0
+        self.dropped = 0
+        self._writer = threading.Thread(target=self._run, name="ergowise-archive", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def append(self, session_id, kpts, report, t=None):
+        """Queue one scored frame: ``kpts`` float[17, 3], ``report`` from posture_report"""
+        metrics = report.get("metrics") or {}
+        with self._cond:
+            if self._closed:
+                return
+            if self._n == len(self._batch):
+                # Writer is behind (slow disk): grow rather than block the caller
+                self._batch = np.concatenate([self._batch, np.zeros(self.group, RECORD_DTYPE)])
+            rec = self._batch[self._n]
+            rec["t"] = time.time() if t is None else t
+            sid = session_hash(session_id)
+            rec["session"] = sid
+            rec["kpts"] = kpts
+            rec["metrics"] = [np.nan if metrics.get(m) is None else metrics[m] for m in METRIC_NAMES]
+            rec["score"] = min(255, max(0, int(round(report.get("posture_score", 0)))))
+            rec["grade"] = rulebook.current().grade_codes.get(report.get("grade"), NO_GRADE)
+            if sid and sid not in self._known_sessions:
+                if len(self._known_sessions) >= 100000:
+                    self._known_sessions.clear()  # repeats in sessions.jsonl are harmless
+                self._known_sessions.add(sid)
+                self._new_sessions[sid] = session_id
+            self._n += 1
+            if self._n >= self.group:
+                self._cond.notify()
+
+    def flush(self):
+        """Write everything appended so far (blocks until done)"""
+        with self._cond:
+            batch, n, sessions = self._take()
+        self._commit(batch, n, sessions)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._writer.join()
+
+    def _take(self):
+        batch, n, sessions = self._batch, self._n, self._new_sessions
+        self._batch = np.zeros(self.group, RECORD_DTYPE)
+        self._n = 0
+        self._new_sessions = {}
+        return batch, n, sessions
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._n < self.group and not self._closed:
+                    self._cond.wait(self.flush_s)
+                closed = self._closed
+                batch, n, sessions = self._take()
+            self._commit(batch, n, sessions)
+            if closed:
+                return
+
+    def _commit(self, batch, n, sessions):
+        if not n:
+            return
+        with self._write_lock:
+            self._commit_locked(batch[:n], sessions)
+
+    def _commit_locked(self, recs, sessions):
+        n = len(recs)
+        days = (recs["t"] // 86400).astype(np.int64)
+        try:
+            if sessions:
+                with open(os.path.join(self.directory, "sessions.jsonl"), "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps({"hash": h, "session_id": s}) + "\n" for h, s in sessions.items())
+            for day in np.unique(days):
+                self._write_segment(int(day), recs[days == day])
+        except OSError as e:
+            self.dropped += n
+            print(f"⚠️ Could not write pose archive: {e}")
+            return
+        self.records += n
+        self.commits += 1
+
+    def _write_segment(self, day, recs):
+        path = segment_path(self.directory, day)
+        with open(path, "ab") as f:
+            if f.tell() == 0:
+                f.write(_header())
+            else:
+                # A crash mid-write can leave a partial record; keep records aligned
+                torn = (f.tell() - HEADER_SIZE) % RECORD_DTYPE.itemsize
+                if torn:
+                    f.truncate(f.tell() - torn)
+                    f.seek(0, os.SEEK_END)
+            data = recs.tobytes()
+            f.write(data)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self.bytes += len(data)
+
+    def status(self):
+        return {
+            "directory": self.directory,
+            "records": self.records,
+            "commits": self.commits,
+            "bytes": self.bytes,
+            "pending": self._n,
+            "dropped": self.dropped,
+            "record_bytes": RECORD_DTYPE.itemsize,
+        }
+
+
+class ArchiveReader:
+    """Zero-copy NumPy views over the archive's day files"""
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+
+    def paths(self, start=None, end=None):
+        """Segment files overlapping [start, end) (unix seconds), oldest first"""
+        out = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("poses-") and name.endswith(".bin")):
+                continue
+            day = calendar.timegm(time.strptime(name[6:14], "%Y%m%d"))
+            if (start is None or day + 86400 > start) and (end is None or day < end):
+                out.append(os.path.join(self.directory, name))
+        return out
+
+    def open(self, path):
+        """Read-only memmap of one segment's records (complete records only)"""
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if header[:8] != MAGIC or int.from_bytes(header[8:12], "little") != RECORD_DTYPE.itemsize:
+            raise ValueError(f"{path} is not a pose archive segment with this record layout")
+        count = (size - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, RECORD_DTYPE)
+        return np.memmap(path, RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+    def segments(self, start=None, end=None):
+        """Yield memmapped record arrays for each day file in range"""
+        for path in self.paths(start, end):
+            yield self.open(path)
+
+    def scan(self, start=None, end=None, session_id=None):
+        """Records in [start, end), optionally for one session, as one array (copies)"""
+        sid = None if session_id is None else session_hash(session_id)
+        parts = []
+        for recs in self.segments(start, end):
+            mask = np.ones(len(recs), bool)
+            if start is not None:
+                mask &= recs["t"] >= start
+            if end is not None:
+                mask &= recs["t"] < end
+            if sid is not None:
+                mask &= recs["session"] == sid
+            parts.append(recs[mask])
+        return np.concatenate(parts) if parts else np.zeros(0, RECORD_DTYPE)
+
+    def sessions(self):
+        """{hash: session id} for every session written"""
+        out = {}
+        path = os.path.join(self.directory, "sessions.jsonl")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    out[entry["hash"]] = entry["session_id"]
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize a pose archive")
+    parser.add_argument("directory", nargs="?", default=ARCHIVE_DIR)
+    parser.add_argument("--session", help="only this session id")
+    parser.add_argument("--hours", type=float, help="only the last N hours")
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error("pass a directory or set ERGOWISE_ARCHIVE_DIR")
+
+    reader = ArchiveReader(args.directory)
+    start = time.time() - args.hours * 3600 if args.hours else None
+    t0 = time.perf_counter()
+    recs = reader.scan(start=start, session_id=args.session)
+    scan_s = time.perf_counter() - t0
+    disk = sum(os.path.getsize(p) for p in reader.paths())
+    print(f"📊 {len(recs)} frames in {scan_s * 1000:.1f} ms ({disk / 2**20:.1f} MB on disk)")
+    if not len(recs):
+        return
+    names = reader.sessions()
+    print(f"  {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(recs['t'].min()))} -> "
+          f"{time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(recs['t'].max()))} UTC")
+    print(f"  mean score {recs['score'].mean():.1f}")
+    grade_names = [name for name, _ in rulebook.current().grades]
+    grades = np.bincount(recs["grade"][recs["grade"] < len(grade_names)], minlength=len(grade_names))
+    print("  grades " + ", ".join(f"{name}: {n}" for name, n in zip(grade_names, grades)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # metrics never measured in range
+        means = np.nanmean(recs["metrics"], axis=0)
+    print("  metrics " + ", ".join(f"{m} {v:.1f}" for m, v in zip(METRIC_NAMES, means)))
+    sids, counts = np.unique(recs["session"], return_counts=True)
+    for sid, n in sorted(zip(sids.tolist(), counts.tolist()), key=lambda x: -x[1])[:10]:
+        print(f"  session {names.get(sid, '(one-off)' if sid == 0 else hex(sid))}: {n} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Array-native extraction of pose results.
+
+Turns one ultralytics ``Results`` (or an ``inference_server.PoseResult``)
+into contiguous NumPy arrays with a single device-to-host copy:
+
+* ``kpts``  float32[N, 17, 3] rows of ``(x, y, conf)`` in ``COCO_KPTS`` order,
+* ``conf``  float32[N] person (box) confidences,
+* ``boxes`` float32[N, 4] person boxes as ``x1, y1, x2, y2``.
+
+Best-person selection is an argmax over ``conf``, and the
+``{name: ((x, y), conf)}`` keypoint dict the JSON responses use is only built
+for the selected person.
+"""
+import numpy as np
+
+from posture_batch import COCO_KPTS
+
+# Keypoint confidence assumed when a model does not predict visibility
+DEFAULT_KPT_CONF = 0.5
+
+_EMPTY = (
+    np.zeros((0, 17, 3), np.float32),
+    np.zeros((0,), np.float32),
+    np.zeros((0, 4), np.float32),
+)
+
+
+def pack_arrays(xy, kconf, box_conf, box_xyxy):
+    """Pack (xy, kconf, box_conf, box_xyxy) arrays into (kpts, conf, boxes)"""
+    n = len(box_conf)
+    if n == 0 or len(xy) == 0:
+        return _EMPTY
+    kpts = np.empty((n, 17, 3), np.float32)
+    kpts[..., :2] = xy
+    kpts[..., 2] = DEFAULT_KPT_CONF if kconf is None else kconf
+    return kpts, np.asarray(box_conf, np.float32), np.asarray(box_xyxy, np.float32)
+
+
+def extract_poses(result):
+    """All people in one result as (kpts[N,17,3], conf[N], boxes[N,4])"""
+    arrays = getattr(result, "arrays", None)
+    if arrays is not None:
+        # Worker pool / exported backends already produced host arrays
+        return pack_arrays(*arrays)
+    keypoints, boxes = getattr(result, "keypoints", None), getattr(result, "boxes", None)
+    if keypoints is None or boxes is None or len(boxes.data) == 0:
+        return _EMPTY
+
+    import torch
+
+    kdata = keypoints.data  # [N, 17, 3], or [N, 17, 2] without visibility
+    n, k, d = kdata.shape
+    # One contiguous [N, 17*d + 5] tensor -> one copy off the device
+    packed = torch.cat((kdata.reshape(n, k * d), boxes.data[:, :5]), 1)
+    packed = packed.to("cpu", torch.float32).numpy()
+
+    kpts = np.empty((n, k, 3), np.float32)
+    kpts[..., :d] = packed[:, :k * d].reshape(n, k, d)
+    if d == 2:
+        kpts[..., 2] = DEFAULT_KPT_CONF
+    return kpts, packed[:, k * d + 4].copy(), packed[:, k * d:k * d + 4].copy()
+
+
+def best_pose(results):
+    """Highest-confidence person across ``results``.
+
+    Returns (kpts[17,3], box[4], confidence); kpts and box are None and the
+    confidence is -1 when nobody was detected.
+    """
+    found = [extract_poses(r) for r in results]
+    found = [f for f in found if len(f[1])]
+    if not found:
+        return None, None, -1.0
+    if len(found) == 1:
+        kpts, conf, boxes = found[0]
+    else:
+        kpts, conf, boxes = (np.concatenate(parts) for parts in zip(*found))
+    i = int(conf.argmax())
+    return kpts[i], boxes[i], float(conf[i])
+
+
+def keypoint_dict(kpts, names=COCO_KPTS):
+    """``{name: ((x, y), conf)}`` for one float[17, 3] keypoint row"""
+    return {name: ((x, y), v) for name, (x, y, v) in zip(names, kpts.tolist())}
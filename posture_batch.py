@@ -0,0 +1,187 @@
+"""Vectorized posture scoring over NumPy keypoint arrays.
+
+``posture_report_batch`` computes the same six metrics, adaptive thresholds,
+scores and grades as the apps' ``posture_report`` for N poses at once, using
+array operations and confidence masks instead of per-point Python calls.
+Limits, penalties and grades come from the compiled rule table
+(posture_rules.py). Tip text is only rendered when ``PostureBatch.report(i)``
+is called, so bulk re-scoring never pays for string building.
+
+Keypoint arrays are ``float[N, 17, 3]`` rows of ``(x, y, conf)`` in
+``COCO_KPTS`` order. ``parse_keypoints`` decodes them from request bodies
+for clients that run pose estimation on-device.
+"""
+import json
+import os
+
+import numpy as np
+
+from posture_rules import COCO_KPTS, METRIC_NAMES, rulebook
+
+# Largest batch accepted by /analyze/keypoints
+KEYPOINTS_MAX_POSES = int(os.environ.get("ERGOWISE_KEYPOINTS_MAX_POSES", "1024"))
+
+KPT_INDEX = {name: i for i, name in enumerate(COCO_KPTS)}
+
+
+def kdict_to_array(kdict):
+    """Convert a ``{name: ((x, y), conf)}`` keypoint dict into a float32[17, 3] row"""
+    return np.array([(kdict[n][0][0], kdict[n][0][1], kdict[n][1]) for n in COCO_KPTS], np.float32)
+
+
+def parse_keypoints(body, content_type="", max_poses=KEYPOINTS_MAX_POSES):
+    """Decode a keypoints request body into float32[N, 17, 3].
+
+    JSON bodies are a ``[17, 3]`` or ``[N, 17, 3]`` array, bare or under
+    ``"keypoints"``; any other body is raw little-endian float32 in the
+    ``[N, 17, 3]`` layout. Returns (array, single), where single is True for
+    one unbatched JSON pose. Raises ValueError for malformed input.
+    """
+    if "json" in content_type:
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}") from None
+        if isinstance(data, dict):
+            data = data.get("keypoints")
+        try:
+            kpts = np.asarray(data, dtype=np.float32)
+        except (TypeError, ValueError):
+            raise ValueError("keypoints must be a numeric [N, 17, 3] array") from None
+    else:
+        row = 17 * 3 * 4
+        if not body or len(body) % row:
+            raise ValueError(f"Binary body must be float32 [N, 17, 3] ({row} bytes per pose), got {len(body)} bytes")
+        kpts = np.frombuffer(body, dtype="<f4").reshape(-1, 17, 3)
+    single = kpts.shape == (17, 3)
+    if single:
+        kpts = kpts[None]
+    if kpts.ndim != 3 or kpts.shape[1:] != (17, 3) or not len(kpts):
+        raise ValueError(f"keypoints must have shape [N, 17, 3] or [17, 3], got {list(kpts.shape)}")
+    if len(kpts) > max_poses:
+        raise ValueError(f"At most {max_poses} poses per request, got {len(kpts)}")
+    if not np.isfinite(kpts).all():
+        raise ValueError("keypoints must be finite numbers")
+    return kpts, single
+
+
+def _angle_from_vertical(top, bottom):
+    v = top - bottom
+    norm = np.linalg.norm(v, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = -v[..., 1] / (norm + 1e-9)
+    ang = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+    return np.where(norm == 0, np.nan, ang)
+
+
+def _joint_angle(p1, p2, p3):
+    a = p1 - p2
+    b = p3 - p2
+    na = np.linalg.norm(a, axis=-1)
+    nb = np.linalg.norm(b, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cos = np.sum(a * b, axis=-1) / (na * nb)
+    ang = np.degrees(np.arccos(np.clip(cos, -1.0, 1.0)))
+    return np.where((na == 0) | (nb == 0), np.nan, ang)
+
+
+class PostureBatch:
+    """Scored poses. Arrays are indexed by pose; missing metrics are NaN."""
+
+    def __init__(self, metrics, body_height, shoulder_width, rules, profile):
+        self.metrics = metrics                # float64[N, 6], METRIC_NAMES order
+        self.body_height = body_height        # float64[N]
+        self.shoulder_width = shoulder_width  # float64[N]
+        self.rules = rules
+        self.profile = rules.profiles[profile]
+        self.grades = rules.grades
+        (self.score,        # int64[N], 0-100
+         self.grade_code,   # int8[N], index into grades
+         self.limits,       # float64[N, L]: profile.limits
+         self.flagged,      # bool[N, R]: profile.rules
+         self.severity,     # int[N, R]: severity bucket per rule
+         ) = rules.evaluate_batch(profile, metrics, body_height, shoulder_width)
+
+    def __len__(self):
+        return len(self.score)
+
+    def _value(self, v):
+        return None if np.isnan(v) else float(v)
+
+    def brief(self, i):
+        """Pose ``i`` at the reduced detail levels: metrics, score and grade only"""
+        grade, color = self.grades[self.grade_code[i]]
+        return {"metrics": dict(zip(METRIC_NAMES, (self._value(v) for v in self.metrics[i]))),
+                "posture_score": int(self.score[i]), "grade": grade, "grade_color": color}
+
+    def report(self, i):
+        """Render pose ``i`` in the ``posture_report`` response schema"""
+        prof = self.profile
+        values = [self._value(v) for v in self.metrics[i]]
+        xs = [values[j] for j in prof.metric_idx]
+        lines = self.rules.render(prof, xs, self.flagged[i], self.severity[i])
+        grade, color = self.grades[self.grade_code[i]]
+        report = {"metrics": dict(zip(METRIC_NAMES, values)), **lines, "posture_score": int(self.score[i]),
+                  "grade": grade, "grade_color": color}
+        if grade in prof.summaries:
+            report["overall_summary"] = prof.summaries[grade]
+        report["confidence_metrics"] = {
+            "body_height": self._value(self.body_height[i]),
+            "shoulder_width": self._value(self.shoulder_width[i]),
+            "adaptive_thresholds": {
+                lim.name: float(self.limits[i, j]) for j, lim in enumerate(prof.limits) if lim.name in prof.adaptive
+            },
+        }
+        return report
+
+
+def posture_report_batch(kpts, min_conf=None, profile="enhanced", rules=None):
+    """Score N poses at once.
+
+    ``kpts`` is ``float[N, 17, 3]`` (x, y, conf). ``profile`` picks the
+    rule-table report style ("enhanced", "app" or "professional", matching
+    the apps' ``RULE_PROFILE``); ``rules`` defaults to the current rule
+    table. ``min_conf`` is a scalar or per-keypoint array overriding the
+    profile's keypoint gates; a point counts only when its confidence is
+    strictly above it.
+    """
+    rules = rules or rulebook.current()
+    if min_conf is None:
+        min_conf = rules.profiles[profile].min_conf
+    kpts = np.asarray(kpts, dtype=np.float64)
+    if kpts.ndim == 2:
+        kpts = kpts[None]
+    xy = kpts[..., :2]
+    ok = kpts[..., 2] > np.broadcast_to(min_conf, (17,))
+
+    def pt(name):
+        i = KPT_INDEX[name]
+        return xy[:, i], ok[:, i]
+
+    ls, ls_ok = pt("left_shoulder"); rs, rs_ok = pt("right_shoulder")
+    lh, lh_ok = pt("left_hip");      rh, rh_ok = pt("right_hip")
+    le, le_ok = pt("left_ear");      re, re_ok = pt("right_ear")
+    nose, nose_ok = pt("nose")
+    lk, lk_ok = pt("left_knee");     rk, rk_ok = pt("right_knee")
+    la, la_ok = pt("left_ankle");    ra, ra_ok = pt("right_ankle")
+
+    sh_ok = ls_ok & rs_ok
+    hip_ok = lh_ok & rh_ok
+    ear_ok = le_ok & re_ok
+    sh_mid = (ls + rs) / 2.0
+    hip_mid = (lh + rh) / 2.0
+    head_ref = np.where(ear_ok[:, None], (le + re) / 2.0, nose)
+    head_ok = ear_ok | nose_ok
+
+    nan = np.nan
+    torso_lean = np.where(sh_ok & hip_ok, _angle_from_vertical(sh_mid, hip_mid), nan)
+    head_tilt = np.where(head_ok & sh_ok, _angle_from_vertical(head_ref, sh_mid), nan)
+    shoulder_drop = np.where(sh_ok, rs[:, 1] - ls[:, 1], nan)
+    pelvic_tilt = np.where(hip_ok, rh[:, 1] - lh[:, 1], nan)
+    left_knee = np.where(lh_ok & lk_ok & la_ok, _joint_angle(lh, lk, la), nan)
+    right_knee = np.where(rh_ok & rk_ok & ra_ok, _joint_angle(rh, rk, ra), nan)
+    metrics = np.stack([head_tilt, torso_lean, shoulder_drop, pelvic_tilt, left_knee, right_knee], axis=1)
+
+    body_height = np.where(sh_ok & hip_ok, np.abs(sh_mid[:, 1] - hip_mid[:, 1]), nan)
+    shoulder_width = np.where(sh_ok, np.abs(rs[:, 0] - ls[:, 0]), nan)
+    return PostureBatch(metrics, body_height, shoulder_width, rules, profile)
@@ -0,0 +1,179 @@
+"""Per-pose posture scoring shared by the apps.
+
+``posture_report`` turns one ``{name: ((x, y), conf)}`` keypoint dict into
+the six metrics and the rule-table verdict (posture_rules.py), laid out in
+the response schema of the app that uses the ``profile``. ``score_keypoints``
+does the same for ``float32[N, 17, 3]`` batches.
+
+The module only imports the scoring code, so the execution layer's report
+process pool (execution.py) can run these functions without importing an
+app module and re-running its startup side effects (archive and cache writer
+threads, the rollup database, pools). The apps bind their ``RULE_PROFILE``
+with ``functools.partial``, which pickles by reference to this module.
+"""
+import numpy as np
+
+from pose_extract import keypoint_dict
+from posture_batch import posture_report_batch
+from posture_rules import rulebook
+
+
+def angle_deg(p1, p2, p3):
+    a = np.array(p1) - np.array(p2)
+    b = np.array(p3) - np.array(p2)
+    na = np.linalg.norm(a); nb = np.linalg.norm(b)
+    if na == 0 or nb == 0: return None
+    cosang = np.clip(np.dot(a, b) / (na * nb), -1.0, 1.0)
+    return float(np.degrees(np.arccos(cosang)))
+
+def line_angle_from_vertical(p_top, p_bottom):
+    v = np.array(p_top) - np.array(p_bottom)
+    if np.linalg.norm(v) == 0: return None
+    vu = np.array([0, -1.0])
+    v = v / (np.linalg.norm(v) + 1e-9)
+    ang = np.degrees(np.arccos(np.clip(np.dot(v, vu), -1.0, 1.0)))
+    return float(ang)
+
+def midpoint(p, q):
+    return ((p[0]+q[0])/2.0, (p[1]+q[1])/2.0)
+
+def safe(p_dict, key, min_confidence=0.4):
+    """Get keypoint with minimum confidence threshold"""
+    (xy, vis) = p_dict.get(key, ((None, None), 0.0))
+    return xy if vis > min_confidence else (None, None)
+
+
+def _app_layout(measured, verdict, body_height, shoulder_width):
+    return {
+        "metrics": measured,
+        "tips": verdict.lines["tips"],
+        "posture_score": verdict.score,
+        "grade": verdict.grade,
+        "grade_color": verdict.color,
+        # Add professional analysis structure
+        "professional_analysis": {
+            "good_observations": verdict.lines["good_observations"],
+            "areas_to_improve": verdict.lines["areas_to_improve"],
+            "recommendations": verdict.lines["recommendations"]
+        }
+    }
+
+def _professional_layout(measured, verdict, body_height, shoulder_width):
+    return {
+        "metrics": measured,
+        "posture_score": verdict.score,
+        "grade": verdict.grade,
+        "grade_color": verdict.color,
+        "overall_summary": verdict.summary,
+        "good_observations": verdict.lines["good_observations"],
+        "areas_to_improve": verdict.lines["areas_to_improve"],
+        "recommendations": verdict.lines["recommendations"],
+        "confidence_metrics": {
+            "body_height": body_height,
+            "shoulder_width": shoulder_width,
+            "adaptive_thresholds": verdict.thresholds
+        }
+    }
+
+def _enhanced_layout(measured, verdict, body_height, shoulder_width):
+    return {
+        "metrics": measured,
+        "tips": verdict.lines["tips"],
+        "posture_score": verdict.score,
+        "grade": verdict.grade,
+        "grade_color": verdict.color,
+        "confidence_metrics": {
+            "body_height": body_height,
+            "shoulder_width": shoulder_width,
+            "adaptive_thresholds": verdict.thresholds
+        }
+    }
+
+# Full-report layouts that differ from the batch report (PostureBatch.report);
+# other profiles use the enhanced layout
+LAYOUTS = {"app": _app_layout, "professional": _professional_layout}
+
+
+def posture_report(k, smoother=None, detail="full", profile="enhanced"):
+    """Enhanced posture analysis with improved thresholds and scoring"""
+    # Keypoint confidence gates come from the rule profile (posture_rules.toml)
+    rules = rulebook.current()
+    gates = rules.profiles[profile].gates
+    def g(name):
+        return safe(k, name, gates[name])
+
+    ls = g("left_shoulder");  rs = g("right_shoulder")
+    lh = g("left_hip");       rh = g("right_hip")
+    le = g("left_ear");       re = g("right_ear")
+    nose = g("nose")
+    lk = g("left_knee");      rk = g("right_knee")
+    la = g("left_ankle");     ra = g("right_ankle")
+
+    sh_mid = midpoint(ls, rs) if None not in (ls[0], rs[0]) else (None, None)
+    hip_mid = midpoint(lh, rh) if None not in (lh[0], rh[0]) else (None, None)
+    ear_mid = midpoint(le, re) if None not in (le[0], re[0]) else (None, None)
+
+    torso_lean = line_angle_from_vertical(sh_mid, hip_mid) if None not in sh_mid+hip_mid else None
+    head_ref = ear_mid if None not in ear_mid else nose
+    head_tilt = line_angle_from_vertical(head_ref, sh_mid) if None not in head_ref+sh_mid else None
+
+    shoulder_drop = None
+    if None not in (ls[1], rs[1]):
+        shoulder_drop = float(rs[1] - ls[1])
+
+    pelvic_tilt = None
+    if None not in (lh[1], rh[1]):
+        pelvic_tilt = float(rh[1] - lh[1])
+
+    left_knee_angle = angle_deg(lh, lk, la) if None not in lh+lk+la else None
+    right_knee_angle = angle_deg(rh, rk, ra) if None not in rh+rk+ra else None
+
+    if smoother is not None:
+        # Streaming session: average the derived metrics over recent frames
+        head_tilt, torso_lean, shoulder_drop, pelvic_tilt, left_knee_angle, right_knee_angle = smoother.smooth_metrics(
+            head_tilt, torso_lean, shoulder_drop, pelvic_tilt, left_knee_angle, right_knee_angle)
+
+    # Calculate body proportions for adaptive thresholds
+    body_height = None
+    shoulder_width = None
+
+    if None not in sh_mid + hip_mid:
+        body_height = abs(sh_mid[1] - hip_mid[1])
+    if None not in (ls[0], rs[0]):
+        shoulder_width = abs(rs[0] - ls[0])
+
+    measured = {
+        "head_tilt_deg": head_tilt,
+        "torso_lean_deg": torso_lean,
+        "shoulder_drop_px": shoulder_drop,
+        "pelvic_drop_px": pelvic_tilt,
+        "left_knee_angle_deg": left_knee_angle,
+        "right_knee_angle_deg": right_knee_angle
+    }
+    # Limits (with session hysteresis), penalties, grade and advice come from posture_rules.toml
+    verdict = rules.evaluate(profile, measured, body_height, shoulder_width, smoother,
+                             advice=detail == "full")
+    if detail != "full":
+        # Reduced detail levels (response_encoding.py): no advice text or confidence metrics
+        return {"metrics": measured, "posture_score": verdict.score, "grade": verdict.grade,
+                "grade_color": verdict.color}
+
+    layout = LAYOUTS.get(profile, _enhanced_layout)
+    return layout(measured, verdict, body_height, shoulder_width)
+
+
+def score_keypoints(kpts, detail="full", profile="enhanced"):
+    """/analyze-style results for float32[N, 17, 3] poses. Reduced detail
+    levels, and full reports in the enhanced layout, are scored as one
+    vectorized batch (posture_batch matches posture_report); the other
+    layouts go through ``posture_report`` pose by pose."""
+    if detail != "full" or profile not in LAYOUTS:
+        scored = posture_report_batch(kpts, profile=profile)
+        if detail != "full":
+            return [{"detected": True, **scored.brief(i)} for i in range(len(scored))]
+        return [{"detected": True, "keypoints": keypoint_dict(row), **scored.report(i)} for i, row in enumerate(kpts)]
+    results = []
+    for row in kpts:
+        kdict = keypoint_dict(row)
+        results.append({"detected": True, "keypoints": kdict, **posture_report(kdict, profile=profile)})
+    return results
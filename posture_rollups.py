@@ -0,0 +1,325 @@
+"""Incremental per-session and per-user rollups of posture reports.
+
+Set ``ERGOWISE_ROLLUP_DB`` to a SQLite path to enable. Every detected frame
+with a ``session_id`` and/or ``user_id`` is folded into minute, hour and day
+buckets plus an all-time total for that session and that user. Each bucket
+holds, for ``posture_score`` and the six posture metrics:
+
+* count, sum (for the mean), min and max,
+* a fixed-bin histogram used as a mergeable quantile sketch (p50/p90 are
+  accurate to one bin, a few degrees or pixels),
+* seconds spent past a threshold, using the gap to the session's previous
+  frame (capped at ``ERGOWISE_ROLLUP_MAX_GAP_S``) as the frame's duration.
+  Thresholds come from the rule table (posture_rules.toml): ``posture_score``
+  counts while it is in the worst grade, each metric while it is past its
+  limit's base ``value`` (abs and below limits compare the same way as the
+  rules). Rule table reloads apply from the next folded batch.
+
+``add`` only queues the report. A background thread folds queued frames in
+vectorized batches and writes the changed buckets back every
+``ERGOWISE_ROLLUP_FLUSH_S``; a bucket that is not in memory is read back
+before it is updated, so restarts do not lose counts.
+Queries read one row (summary) or one row per bucket in the requested
+window (trends), so they cost the same however long the history is. One
+process should own a database file.
+"""
+import atexit
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from posture_batch import METRIC_NAMES
+from posture_rules import rulebook
+
+ROLLUP_DB = os.environ.get("ERGOWISE_ROLLUP_DB", "")
+ROLLUP_FLUSH_S = float(os.environ.get("ERGOWISE_ROLLUP_FLUSH_S", "5"))
+ROLLUP_MAX_GAP_S = float(os.environ.get("ERGOWISE_ROLLUP_MAX_GAP_S", "2"))
+# Buckets not updated for this long are dropped from memory once written
+ROLLUP_IDLE_S = float(os.environ.get("ERGOWISE_ROLLUP_IDLE_S", "300"))
+
+METRICS = ["posture_score"] + METRIC_NAMES
+# Histogram range per metric; values outside land in the end bins
+RANGES = {
+    "posture_score": (0.0, 100.0),
+    "head_tilt_deg": (0.0, 180.0),
+    "torso_lean_deg": (0.0, 180.0),
+    "shoulder_drop_px": (-100.0, 100.0),
+    "pelvic_drop_px": (-100.0, 100.0),
+    "left_knee_angle_deg": (0.0, 180.0),
+    "right_knee_angle_deg": (0.0, 180.0),
+}
+BINS = 64
+GRAINS = {"minute": 60, "hour": 3600, "day": 86400}
+TOTAL = 0  # grain of the all-time row
+
+_LO = np.array([RANGES[m][0] for m in METRICS])
+_WIDTH = np.array([(RANGES[m][1] - RANGES[m][0]) / BINS for m in METRICS])
+# stats columns
+COUNT, SUM, MIN, MAX, OVER = range(5)
+
+
+def rule_thresholds(rules):
+    """(limit, below, abs) per METRICS column from a RuleSet.
+
+    ``posture_score`` is below the worst grade's upper bound; a metric uses
+    the first limit on it, at its base value (body size adjustments need
+    per-frame proportions the rollups do not keep). NaN means no threshold.
+    """
+    limits = np.full(len(METRICS), np.nan)
+    below = np.zeros(len(METRICS), bool)
+    absolute = np.zeros(len(METRICS), bool)
+    if len(rules.min_scores) > 1:
+        limits[0] = rules.min_scores[-2]
+        below[0] = True
+    for lim in rules.limits.values():
+        i = METRICS.index(lim.metric)
+        if np.isnan(limits[i]):
+            limits[i], below[i], absolute[i] = lim.value, lim.below, lim.abs
+    return limits, below, absolute
+
+
+class Bucket:
+    """Aggregates for one (scope, id, grain, start)"""
+
+    __slots__ = ("frames", "seconds", "first", "last", "stats", "hist", "dirty", "touched")
+
+    def __init__(self):
+        self.frames = 0
+        self.seconds = 0.0
+        self.first = None
+        self.last = None
+        self.stats = np.zeros((len(METRICS), 5))
+        self.stats[:, MIN] = np.inf
+        self.stats[:, MAX] = -np.inf
+        self.hist = np.zeros((len(METRICS), BINS), np.uint32)
+        self.dirty = False
+        self.touched = 0.0
+
+    def fold(self, t, dt, values, present, bins, over):
+        """Add N frames: ``t``/``dt`` are [N], the rest [N, len(METRICS)]"""
+        self.frames += len(t)
+        self.seconds += float(dt.sum())
+        first, last = float(t.min()), float(t.max())
+        self.first = first if self.first is None else min(self.first, first)
+        self.last = last if self.last is None else max(self.last, last)
+        s = self.stats
+        s[:, COUNT] += present.sum(axis=0)
+        s[:, SUM] += np.where(present, values, 0.0).sum(axis=0)
+        s[:, MIN] = np.fmin(s[:, MIN], np.fmin.reduce(values, axis=0))
+        s[:, MAX] = np.fmax(s[:, MAX], np.fmax.reduce(values, axis=0))
+        s[:, OVER] += (over * dt[:, None]).sum(axis=0)
+        rows, cols = np.nonzero(present)
+        np.add.at(self.hist, (cols, bins[rows, cols]), 1)
+
+    def quantile(self, i, q):
+        n = self.stats[i, COUNT]
+        if not n:
+            return None
+        cum = np.cumsum(self.hist[i])
+        b = int(np.searchsorted(cum, q * n))
+        before = cum[b - 1] if b else 0
+        frac = (q * n - before) / max(1, self.hist[i, b])
+        value = _LO[i] + (b + frac) * _WIDTH[i]
+        # The sketch cannot be more precise than the observed range
+        return round(float(min(max(value, self.stats[i, MIN]), self.stats[i, MAX])), 2)
+
+    def summary(self, quantiles=(0.5, 0.9)):
+        out = {}
+        for i, name in enumerate(METRICS):
+            n = int(self.stats[i, COUNT])
+            entry = {"count": n, "mean": None, "min": None, "max": None}
+            if n:
+                entry.update(
+                    mean=round(float(self.stats[i, SUM] / n), 2),
+                    min=round(float(self.stats[i, MIN]), 2),
+                    max=round(float(self.stats[i, MAX]), 2),
+                )
+            for q in quantiles:
+                entry[f"p{int(q * 100)}"] = self.quantile(i, q)
+            entry["minutes_over_threshold"] = round(float(self.stats[i, OVER]) / 60, 2)
+            out[name] = entry
+        return {
+            "frames": self.frames,
+            "monitored_minutes": round(self.seconds / 60, 2),
+            "first": self.first,
+            "last": self.last,
+            "metrics": out,
+        }
+
+
+class PostureRollups:
+    """Folds posture reports into SQLite-backed minute/hour/day/total buckets"""
+
+    def __init__(self, path=ROLLUP_DB, flush_s=ROLLUP_FLUSH_S, max_gap_s=ROLLUP_MAX_GAP_S,
+                 rules=None, idle_s=ROLLUP_IDLE_S):
+        self.path = path
+        self.flush_s = flush_s
+        self.max_gap_s = max_gap_s
+        # A fixed RuleSet (tests, scripts); None follows rulebook.current()
+        self.rules = rules
+        self._rules = self._limits = None
+        self.idle_s = idle_s
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS rollups ("
+            " scope TEXT NOT NULL, scope_id TEXT NOT NULL, grain INTEGER NOT NULL, start INTEGER NOT NULL,"
+            " frames INTEGER NOT NULL, seconds REAL NOT NULL, first REAL, last REAL,"
+            " stats BLOB NOT NULL, hist BLOB NOT NULL,"
+            " PRIMARY KEY (scope, scope_id, grain, start)) WITHOUT ROWID"
+        )
+        self._db.commit()
+        self._buckets = {}
+        self._pending = []
+        self._last_seen = {}  # previous frame time per session (or user)
+        self.frames = 0
+        self.flushes = 0
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._run, name="ergowise-rollups", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def add(self, report, session_id=None, user_id=None, t=None):
+        """Queue one detected frame's posture report (folded in batches)"""
+        if not session_id and not user_id:
+            return
+        metrics = report.get("metrics") or {}
+        values = [report.get("posture_score")] + [metrics.get(m) for m in METRIC_NAMES]
+        with self._lock:
+            self._pending.append((time.time() if t is None else t, session_id, user_id, values))
+
+    def _fold_pending(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        t = np.array([p[0] for p in pending])
+        values = np.array([p[3] for p in pending], dtype=float)  # None -> NaN
+        present = ~np.isnan(values)
+        bins = np.clip(((np.nan_to_num(values) - _LO) / _WIDTH).astype(np.int64), 0, BINS - 1)
+        limits, below, absolute = self._thresholds()
+        with np.errstate(invalid="ignore"):
+            over = present & np.where(below, values < limits, np.where(absolute, np.abs(values), values) > limits)
+
+        dt = np.zeros(len(pending))
+        groups = {}
+        for i, (ti, session_id, user_id, _) in enumerate(pending):
+            clock = ("session", session_id) if session_id else ("user", user_id)
+            prev = self._last_seen.get(clock)
+            self._last_seen[clock] = ti
+            if prev is not None:
+                dt[i] = min(max(0.0, ti - prev), self.max_gap_s)
+            for scope, scope_id in (("session", session_id), ("user", user_id)):
+                if scope_id:
+                    groups.setdefault((scope, scope_id, TOTAL, 0), []).append(i)
+                    for grain in GRAINS.values():
+                        groups.setdefault((scope, scope_id, grain, int(ti // grain) * grain), []).append(i)
+
+        now = time.time()
+        for key, rows in groups.items():
+            bucket = self._bucket(key)
+            bucket.fold(t[rows], dt[rows], values[rows], present[rows], bins[rows], over[rows])
+            bucket.dirty = True
+            bucket.touched = now
+        self.frames += len(pending)
+
+    def _thresholds(self):
+        rules = self.rules or rulebook.current()
+        if rules is not self._rules:
+            self._rules = rules
+            self._limits = rule_thresholds(rules)
+        return self._limits
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = self._load(key) or Bucket()
+        return bucket
+
+    def _load(self, key):
+        row = self._db.execute(
+            "SELECT frames, seconds, first, last, stats, hist FROM rollups"
+            " WHERE scope=? AND scope_id=? AND grain=? AND start=?", key).fetchone()
+        return None if row is None else self._from_row(row)
+
+    @staticmethod
+    def _from_row(row):
+        bucket = Bucket()
+        bucket.frames, bucket.seconds, bucket.first, bucket.last = row[:4]
+        bucket.stats = np.frombuffer(row[4], np.float64).reshape(len(METRICS), 5).copy()
+        bucket.hist = np.frombuffer(row[5], np.uint32).reshape(len(METRICS), BINS).copy()
+        return bucket
+
+    def flush(self):
+        """Fold queued frames, write dirty buckets and drop idle ones from memory"""
+        with self._lock:
+            self._fold_pending()
+            rows = []
+            for key, b in self._buckets.items():
+                if b.dirty:
+                    rows.append((*key, b.frames, b.seconds, b.first, b.last, b.stats.tobytes(), b.hist.tobytes()))
+                    b.dirty = False
+            if rows:
+                self._db.executemany("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.commit()
+                self.flushes += 1
+            cutoff = time.time() - self.idle_s
+            for key in [k for k, b in self._buckets.items() if b.touched < cutoff]:
+                del self._buckets[key]
+            for key in [k for k, last in self._last_seen.items() if last < cutoff]:
+                del self._last_seen[key]
+
+    def _run(self):
+        while not self._stop.wait(self.flush_s):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"⚠️ Could not write posture rollups: {e}")
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._writer.join()
+        self.flush()
+        self._db.close()
+
+    def summary(self, scope, scope_id):
+        """All-time aggregates for one session or user, or None if unknown"""
+        with self._lock:
+            self._fold_pending()
+            bucket = self._buckets.get((scope, scope_id, TOTAL, 0)) or self._load((scope, scope_id, TOTAL, 0))
+            return None if bucket is None else bucket.summary()
+
+    def trends(self, scope, scope_id, grain="hour", limit=24):
+        """The ``limit`` most recent ``grain`` buckets, oldest first"""
+        seconds = GRAINS[grain]
+        with self._lock:
+            self._fold_pending()
+            rows = self._db.execute(
+                "SELECT start, frames, seconds, first, last, stats, hist FROM rollups"
+                " WHERE scope=? AND scope_id=? AND grain=? ORDER BY start DESC LIMIT ?",
+                (scope, scope_id, seconds, limit)).fetchall()
+            buckets = {row[0]: self._from_row(row[1:]) for row in rows}
+            # Unwritten changes in memory are newer than the database
+            for (s, sid, g, start), b in self._buckets.items():
+                if s == scope and sid == scope_id and g == seconds:
+                    buckets[start] = b
+            starts = sorted(buckets)[-limit:]
+            return [{"start": start, **buckets[start].summary()} for start in starts]
+
+    def status(self):
+        return {
+            "path": self.path,
+            "frames": self.frames,
+            "flushes": self.flushes,
+            "open_buckets": len(self._buckets),
+            "thresholds": ",".join(
+                f"|{name}|>{limit:g}" if is_abs else f"{name}{'<' if is_below else '>'}{limit:g}"
+                for name, limit, is_below, is_abs in zip(METRICS, *self._thresholds()) if not np.isnan(limit)
+            ),
+        }
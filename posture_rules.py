@@ -0,0 +1,548 @@
+"""Compiled posture rule table.
+
+Limits, score penalties, severity bands, grades and advice text for every
+report style live in one table, ``posture_rules.toml`` (or
+``ERGOWISE_RULES``), instead of if/elif chains in each app. The table is
+compiled once into:
+
+* per-profile NumPy arrays (metric index, limit, direction, penalty, bands),
+  so ``posture_batch`` scores N poses with array operations, and
+* advice text pre-rendered per severity bucket and side; only ``{value}`` is
+  formatted per frame, so a report is a few lookups rather than string
+  building, and
+* per-rule steps with "below" rules negated and bands pre-sorted, so
+  scoring a frame is one ``>`` per rule and a ``bisect`` for the severity.
+
+``rulebook.current()`` returns the compiled table and, at most every
+``ERGOWISE_RULES_RELOAD_S`` seconds, checks whether the file changed and
+recompiles it, so edits apply without a restart. A table that fails to
+compile is reported and the previous one kept.
+
+    verdict = rulebook.current().evaluate("enhanced", metrics, body_height, shoulder_width)
+    verdict.score, verdict.grade, verdict.lines["tips"]
+"""
+import bisect
+import hashlib
+import os
+import string
+import sys
+import threading
+import time
+import tomllib
+
+import numpy as np
+
+RULES_PATH = os.environ.get(
+    "ERGOWISE_RULES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "posture_rules.toml"))
+# Seconds between checks for an edited table; 0 turns hot reload off
+RULES_RELOAD_S = float(os.environ.get("ERGOWISE_RULES_RELOAD_S", "2"))
+
+METRIC_NAMES = [
+    "head_tilt_deg", "torso_lean_deg", "shoulder_drop_px",
+    "pelvic_drop_px", "left_knee_angle_deg", "right_knee_angle_deg",
+]
+COCO_KPTS = [
+    "nose","left_eye","right_eye","left_ear","right_ear",
+    "left_shoulder","right_shoulder","left_elbow","right_elbow",
+    "left_wrist","right_wrist","left_hip","right_hip",
+    "left_knee","right_knee","left_ankle","right_ankle"
+]
+SIDES = ("left", "right")
+
+
+class RuleError(ValueError):
+    """Raised for a rule table that does not compile"""
+
+
+def _keys(where, table, required=(), optional=()):
+    if not isinstance(table, dict):
+        raise RuleError(f"{where}: expected a table")
+    for key in required:
+        if key not in table:
+            raise RuleError(f"{where}: missing {key!r}")
+    unknown = set(table) - set(required) - set(optional)
+    if unknown:
+        raise RuleError(f"{where}: unknown key(s) {', '.join(sorted(unknown))}")
+
+
+def _number(where, value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError(f"{where}: expected a number, got {value!r}")
+    return value
+
+
+def _template(where, text, severity, side):
+    """Render everything but ``{value}`` into ``text``.
+
+    Returns (text, has_value); when has_value, ``text.format(value)`` gives
+    the line.
+    """
+    if not isinstance(text, str):
+        raise RuleError(f"{where}: expected a string, got {text!r}")
+    raw, escaped, has_value = [], [], False
+    try:
+        parsed = list(string.Formatter().parse(text))
+    except ValueError as e:
+        raise RuleError(f"{where}: {e} in {text!r}") from None
+    for literal, field, spec, conversion in parsed:
+        raw.append(literal)
+        escaped.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if field == "value":
+            has_value = True
+            escaped.append("{0" + (f"!{conversion}" if conversion else "") + (f":{spec}" if spec else "") + "}")
+            continue
+        if field == "severity" and severity is not None:
+            part = severity
+        elif field in ("side", "Side") and side is not None:
+            part = side if field == "side" else side.capitalize()
+        else:
+            raise RuleError(f"{where}: {{{field}}} is not available in {text!r}")
+        part = format(part, spec)
+        raw.append(part)
+        escaped.append(part.replace("{", "{{").replace("}", "}}"))
+    if not has_value:
+        return sys.intern("".join(raw)), False
+    text = "".join(escaped)
+    try:
+        text.format(0.0)
+    except (ValueError, IndexError, KeyError) as e:
+        raise RuleError(f"{where}: {e} in {text!r}") from None
+    return text, True
+
+
+def _lines(where, spec, lists, severity, side):
+    """((list, text, has_value), ...) for a ``{list: text or [texts]}`` table"""
+    out = []
+    for name, texts in spec.items():
+        if name not in lists:
+            raise RuleError(f"{where}: {name!r} is not one of this profile's lists ({', '.join(lists)})")
+        for text in [texts] if isinstance(texts, str) else texts:
+            out.append((name, *_template(f"{where}.{name}", text, severity, side)))
+    return tuple(out)
+
+
+def _emit(out, lines, value):
+    for name, text, has_value in lines:
+        if has_value:
+            text = text.format(value)
+        target = out[name]
+        if text not in target:
+            target.append(text)
+
+
+class Limit:
+    __slots__ = ("name", "metric", "abs", "below", "value", "tall", "per_shoulder_width", "hysteresis")
+
+    def __init__(self, name, spec):
+        where = f"limits.{name}"
+        _keys(where, spec, ("metric", "value"), ("abs", "below", "tall", "per_shoulder_width", "hysteresis"))
+        if spec["metric"] not in METRIC_NAMES:
+            raise RuleError(f"{where}: unknown metric {spec['metric']!r}")
+        self.name = name
+        self.metric = spec["metric"]
+        self.abs = bool(spec.get("abs", False))
+        self.below = bool(spec.get("below", False))
+        self.value = _number(where, spec["value"])
+        self.tall = None if spec.get("tall") is None else _number(where, spec["tall"])
+        self.per_shoulder_width = _number(where, spec.get("per_shoulder_width", 0))
+        self.hysteresis = _number(where, spec.get("hysteresis", 0.0))
+
+    @property
+    def adaptive(self):
+        return self.tall is not None or bool(self.per_shoulder_width)
+
+
+class Rule:
+    """One profile rule bound to its check, with its advice pre-rendered"""
+
+    __slots__ = ("check", "metric", "abs", "below", "limit", "const", "penalty", "bands",
+                 "flagged", "ok", "ok_when_missing", "sides")
+
+    def __init__(self, where, spec, checks, limits, lists, severity):
+        _keys(where, spec, ("check",), ("flagged", "ok", "ok_when_missing", "severity"))
+        name = spec["check"]
+        if name not in checks:
+            raise RuleError(f"{where}: unknown check {name!r}")
+        check = checks[name]
+        cwhere = f"checks.{name}"
+        _keys(cwhere, check, ("limit",), ("metric", "abs", "below", "penalty", "bands"))
+        self.check = name
+        if isinstance(check["limit"], str):
+            if check["limit"] not in limits:
+                raise RuleError(f"{cwhere}: unknown limit {check['limit']!r}")
+            lim = limits[check["limit"]]
+            self.limit, self.const = lim.name, None
+            self.metric, self.abs, self.below = lim.metric, lim.abs, lim.below
+        else:
+            if "metric" not in check:
+                raise RuleError(f"{cwhere}: a numeric limit needs 'metric'")
+            self.limit, self.const = None, _number(cwhere, check["limit"])
+            self.metric, self.abs, self.below = None, False, False
+        # Explicit keys override what the named limit implies
+        self.metric = check.get("metric", self.metric)
+        if self.metric not in METRIC_NAMES:
+            raise RuleError(f"{cwhere}: unknown metric {self.metric!r}")
+        self.abs = bool(check.get("abs", self.abs))
+        self.below = bool(check.get("below", self.below))
+
+        penalty = check.get("penalty")
+        if penalty is not None:
+            _keys(f"{cwhere}.penalty", penalty, ("rate", "cap"), ("from",))
+            penalty = (_number(cwhere, penalty["rate"]), _number(cwhere, penalty["cap"]),
+                       _number(cwhere, penalty.get("from", 0)))
+        self.penalty = penalty
+        self.bands = tuple(_number(cwhere, b) for b in check.get("bands", ()))
+        if list(self.bands) != sorted(self.bands, reverse=not self.below):
+            raise RuleError(f"{cwhere}: bands must go from most to least severe")
+
+        severity = spec.get("severity", severity) or (None,) * (len(self.bands) + 1)
+        if len(severity) != len(self.bands) + 1:
+            raise RuleError(f"{where}: {len(self.bands)} bands need {len(self.bands) + 1} severity words, got {len(severity)}")
+        self.sides = SIDES if self.abs else (None,)
+        # Indexed [bucket * len(sides) + side]; side is 1 (right) for positive abs metrics
+        flagged = spec.get("flagged", {})
+        self.flagged = tuple(
+            _lines(f"{where}.flagged", flagged, lists, word, side) for word in severity for side in self.sides)
+        self.ok = []
+        for i, entry in enumerate(spec.get("ok", ())):
+            within = entry.get("within")
+            lines = {k: v for k, v in entry.items() if k != "within"}
+            self.ok.append((None if within is None else _number(where, within),
+                            tuple(_lines(f"{where}.ok[{i}]", lines, lists, None, side) for side in self.sides)))
+        self.ok = tuple(self.ok)
+        self.ok_when_missing = bool(spec.get("ok_when_missing", False))
+
+    def advise(self, out, x, flagged, bucket):
+        """Add this rule's lines for metric value ``x`` (None if missing) to ``out``"""
+        if x is None:
+            if self.ok_when_missing and self.ok:
+                _emit(out, self.ok[0][1][0], None)
+            return
+        side = self.abs and x > 0
+        if flagged:
+            _emit(out, self.flagged[bucket * len(self.sides) + side], x)
+            return
+        a = abs(x) if self.abs else x
+        for within, lines in self.ok:
+            if within is None or (a >= within if self.below else a <= within):
+                _emit(out, lines[side], x)
+                return
+
+
+class Profile:
+    """A report style: its rules, output lists and the arrays used for batches"""
+
+    def __init__(self, name, lists, rules, always, summaries, limits, min_conf):
+        self.name = name
+        self.min_conf = min_conf  # float64[17]: a keypoint counts when its confidence is above this
+        self.gates = dict(zip(COCO_KPTS, min_conf.tolist()))  # the same, by name, for one pose
+        self.lists = lists
+        self.rules = rules
+        self.always = always
+        self.summaries = summaries
+        used = {r.limit for r in rules if r.limit}
+        self.limits = [lim for lim in limits.values() if lim.name in used]  # table order
+        self.adaptive = [lim.name for lim in self.limits if lim.adaptive]
+        self.limit_names = [lim.name for lim in self.limits]
+        column = {lim.name: j for j, lim in enumerate(self.limits)}
+
+        # Flat tuples for the per-frame loop in RuleSet.evaluate. Like the
+        # arrays below, "below" rules are negated (sign -1) so every check is
+        # "value > limit", and bands are ascending so bisect gives the bucket.
+        self.limit_plan = tuple((lim.name, lim.metric, lim.value, lim.tall, lim.per_shoulder_width, lim.hysteresis,
+                                 lim.below) for lim in self.limits)
+        self.plan = tuple(
+            (r.metric, r.abs, -1.0 if r.below else 1.0, column[r.limit] if r.limit else -1,
+             None if r.limit else (-r.const if r.below else r.const),
+             r.penalty and (r.penalty[0], r.penalty[1], -r.penalty[2] if r.below else r.penalty[2]),
+             sorted(-b if r.below else b for b in r.bands), r.flagged, len(r.sides),
+             tuple((None if within is None else (-within if r.below else within), lines) for within, lines in r.ok),
+             r.ok[0][1][0] if r.ok_when_missing and r.ok else None)
+            for r in rules)
+
+        # Threshold arrays, one entry per rule
+        self.metric_idx = np.array([METRIC_NAMES.index(r.metric) for r in rules], np.intp)
+        self.abs = np.array([r.abs for r in rules], bool)
+        self.below = np.array([r.below for r in rules], bool)
+        self.limit_col = np.array([column[r.limit] if r.limit else -1 for r in rules], np.intp)
+        # "below" rules are stored negated so every comparison is "value > limit"
+        self.sign = np.where(self.below, -1.0, 1.0)
+        self.const = self.sign * [0.0 if r.limit else r.const for r in rules]
+        self.rate = np.array([r.penalty[0] if r.penalty else 0.0 for r in rules], float)
+        self.cap = np.array([r.penalty[1] if r.penalty else 0.0 for r in rules], float)
+        self.origin = self.sign * [r.penalty[2] if r.penalty else 0.0 for r in rules]
+        self.scored = [j for j, r in enumerate(rules) if r.penalty]
+        width = max([len(r.bands) for r in rules], default=0)
+        self.bands = np.full((len(rules), width), np.nan)  # NaN padding never counts
+        for j, r in enumerate(rules):
+            self.bands[j, :len(r.bands)] = np.multiply(r.bands, self.sign[j])
+
+
+class Verdict:
+    __slots__ = ("score", "grade", "color", "summary", "lines", "limits", "thresholds")
+
+    def __init__(self, score, grade, color, summary, lines, limits, thresholds):
+        self.score = score
+        self.grade = grade
+        self.color = color
+        self.summary = summary
+        self.lines = lines            # {list name: [text, ...]}
+        self.limits = limits          # {limit name: effective limit}
+        self.thresholds = thresholds  # the adaptive ones, for confidence_metrics
+
+
+class RuleSet:
+    """A compiled rule table"""
+
+    def __init__(self, data, digest=""):
+        self.digest = digest
+        _keys("table", data, ("limits", "checks", "grades", "profiles"), ("body",))
+        body = data.get("body", {})
+        _keys("body", body, (), ("tall_px",))
+        self.tall_px = _number("body.tall_px", body.get("tall_px", 200))
+        self.limits = {name: Limit(name, spec) for name, spec in data["limits"].items()}
+
+        self.grades = []
+        for i, g in enumerate(data["grades"]):
+            _keys(f"grades[{i}]", g, ("name", "min_score", "color"))
+            self.grades.append((g["name"], g["color"]))
+        self.min_scores = np.array([_number("grades", g["min_score"]) for g in data["grades"]], float)
+        if not self.grades or list(self.min_scores) != sorted(self.min_scores, reverse=True):
+            raise RuleError("grades: list them best first (descending min_score)")
+        self._grade_steps = list(zip(self.min_scores.tolist(), self.grades))
+        # Small codes for compact formats (archive records, pose encoding)
+        self.grade_codes = {name: i for i, (name, _) in enumerate(self.grades)}
+
+        self.profiles = {}
+        for name in data["profiles"]:
+            self._profile(name, data["profiles"], data["checks"], ())
+
+    def _profile(self, name, specs, checks, seen):
+        if name in self.profiles:
+            return self.profiles[name]
+        if name in seen:
+            raise RuleError(f"profiles.{name}: 'extends' loops back to itself")
+        if name not in specs:
+            raise RuleError(f"profiles.{seen[-1]}: extends unknown profile {name!r}")
+        where = f"profiles.{name}"
+        spec = specs[name]
+        _keys(where, spec, (), ("extends", "lists", "severity", "rules", "always", "summaries", "min_conf"))
+        lists, rules, always, summaries = [], [], [], {}
+        min_conf = np.full(len(COCO_KPTS), 0.4)
+        if "extends" in spec:
+            parent = self._profile(spec["extends"], specs, checks, seen + (name,))
+            lists, rules, always, summaries = list(parent.lists), list(parent.rules), list(parent.always), dict(parent.summaries)
+            min_conf = parent.min_conf
+        if "min_conf" in spec:
+            # Replaces the parent's gates: "default" plus per-keypoint overrides
+            gates = spec["min_conf"]
+            _keys(f"{where}.min_conf", gates, (), ["default"] + COCO_KPTS)
+            min_conf = np.full(len(COCO_KPTS), _number(f"{where}.min_conf.default", gates.get("default", 0.4)))
+            for i, kpt in enumerate(COCO_KPTS):
+                if kpt in gates:
+                    min_conf[i] = _number(f"{where}.min_conf.{kpt}", gates[kpt])
+        lists += [n for n in spec.get("lists", ()) if n not in lists]
+        severity = spec.get("severity", ())
+        for i, rule in enumerate(spec.get("rules", ())):
+            rules.append(Rule(f"{where}.rules[{i}]", rule, checks, self.limits, lists, severity))
+        for i, entry in enumerate(spec.get("always", ())):
+            awhere = f"{where}.always[{i}]"
+            _keys(awhere, entry, ("list", "text"), ("if_empty", "unless_mentioned"))
+            if entry["list"] not in lists:
+                raise RuleError(f"{awhere}: {entry['list']!r} is not one of this profile's lists")
+            text, has_value = _template(awhere, entry["text"], None, None)
+            if has_value:
+                raise RuleError(f"{awhere}: {{value}} is not available in {entry['text']!r}")
+            mentioned = entry.get("unless_mentioned")
+            always.append((entry["list"], text, bool(entry.get("if_empty", False)), mentioned and mentioned.lower()))
+        for grade, text in spec.get("summaries", {}).items():
+            if not isinstance(text, str):
+                raise RuleError(f"{where}.summaries.{grade}: expected a string, got {text!r}")
+            summaries[grade] = text
+        profile = self.profiles[name] = Profile(name, lists, rules, always, summaries, self.limits, min_conf)
+        return profile
+
+    def grade(self, score):
+        """(grade, color) for a 0-100 score"""
+        for min_score, grade in self._grade_steps:
+            if score >= min_score:
+                return grade
+        return self.grades[-1]
+
+    def evaluate(self, profile, metrics, body_height=None, shoulder_width=None, smoother=None, advice=True):
+        """Score one pose. ``metrics`` maps METRIC_NAMES to values or None; a
+        streaming session's ``smoother`` adds hysteresis to the limits. With
+        ``advice=False`` no text is rendered and ``Verdict.lines`` is empty."""
+        prof = self.profiles[profile]
+        tall = bool(body_height) and body_height > self.tall_px
+        limits = []
+        for name, metric, value, tall_value, per_width, band, below in prof.limit_plan:
+            if tall and tall_value is not None:
+                value = tall_value
+            if per_width and shoulder_width:
+                value = max(value, shoulder_width * per_width)
+            if smoother is not None:
+                value = smoother.threshold(name, metrics.get(metric), value, band, below=below)
+            limits.append(value)
+
+        score = 100
+        out = {name: [] for name in prof.lists} if advice else {}
+        for metric, is_abs, sign, col, const, penalty, bands, flagged, sides, ok, missing in prof.plan:
+            x = metrics.get(metric)
+            if x is None:
+                if missing is not None and advice:
+                    _emit(out, missing, None)
+                continue
+            a = sign * (abs(x) if is_abs else x)
+            if a > (sign * limits[col] if const is None else const):
+                if penalty:
+                    rate, cap, origin = penalty
+                    score -= min(cap, (a - origin) * rate)
+                if advice:
+                    # Bucket = bands the value has not passed yet (0 = most severe)
+                    bucket = len(bands) - bisect.bisect_left(bands, a)
+                    _emit(out, flagged[bucket * sides + (is_abs and x > 0)], x)
+            elif ok and advice:
+                for within, lines in ok:
+                    if within is None or a <= within:
+                        _emit(out, lines[is_abs and x > 0], x)
+                        break
+        if prof.always and advice:
+            self._always(prof, out)
+
+        score = max(0, round(score))
+        grade, color = self.grade(score)
+        limits = dict(zip(prof.limit_names, limits))
+        return Verdict(score, grade, color, prof.summaries.get(grade), out,
+                       limits, {name: limits[name] for name in prof.adaptive})
+
+    def render(self, prof, xs, flags, buckets):
+        """Advice lines for one pose from its per-rule values, flags and severity buckets"""
+        out = {name: [] for name in prof.lists}
+        for rule, x, flagged, bucket in zip(prof.rules, xs, flags, buckets):
+            rule.advise(out, x, flagged, bucket)
+        self._always(prof, out)
+        return out
+
+    def _always(self, prof, out):
+        for name, text, if_empty, mentioned in prof.always:
+            target = out[name]
+            if (if_empty and target) or (mentioned and any(mentioned in line.lower() for line in target)):
+                continue
+            if text not in target:
+                target.append(text)
+
+    def evaluate_batch(self, profile, metrics, body_height, shoulder_width):
+        """Vectorized ``evaluate`` (without hysteresis) for float[N, 6] metrics.
+
+        Returns (score int64[N], grade code int8[N] into ``grades``, limits
+        float[N, L] for ``profiles[profile].limits``, flagged bool[N, R] and
+        severity bucket int[N, R] per rule).
+        """
+        prof = self.profiles[profile]
+        n = len(metrics)
+        with np.errstate(invalid="ignore"):
+            tall = body_height > self.tall_px
+        width = np.nan_to_num(shoulder_width)
+        limits = np.empty((n, len(prof.limits)))
+        for j, lim in enumerate(prof.limits):
+            value = np.where(tall, lim.tall, lim.value) if lim.tall is not None else np.full(n, float(lim.value))
+            if lim.per_shoulder_width:
+                value = np.where(width != 0, np.maximum(value, width * lim.per_shoulder_width), value)
+            limits[:, j] = value
+
+        a = metrics[:, prof.metric_idx]
+        a = np.where(prof.abs, np.abs(a), a) * prof.sign
+        limit = np.broadcast_to(prof.const, a.shape).copy()
+        named = prof.limit_col >= 0
+        limit[:, named] = limits[:, prof.limit_col[named]] * prof.sign[named]
+        # NaN comparisons are False, so missing metrics are never flagged
+        with np.errstate(invalid="ignore"):
+            flagged = a > limit
+            bucket = (a[..., None] <= prof.bands).sum(-1)
+            penalty = np.minimum(prof.cap, (a - prof.origin) * prof.rate)
+        score = np.full(n, 100.0)
+        for j in prof.scored:  # in rule order, like evaluate
+            score -= np.where(flagged[:, j], penalty[:, j], 0.0)
+        score = np.maximum(0, np.round(score)).astype(np.int64)
+        grade_code = np.minimum((score[:, None] < self.min_scores).sum(1), len(self.grades) - 1).astype(np.int8)
+        return score, grade_code, limits, flagged, bucket
+
+
+def load_rules(path=RULES_PATH):
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        table = tomllib.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+        raise RuleError(f"{path}: {e}") from None
+    return RuleSet(table, hashlib.blake2b(data, digest_size=6).hexdigest())
+
+
+class RuleBook:
+    """The current RuleSet, recompiled when the table file changes"""
+
+    def __init__(self, path=RULES_PATH, reload_s=RULES_RELOAD_S):
+        self.path = path
+        self.reload_s = reload_s
+        self._lock = threading.Lock()
+        self._stamp = self._stat()
+        self.rules = load_rules(path)
+        self._next_check = time.monotonic() + reload_s
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.last_error = None
+
+    def current(self):
+        if self.reload_s > 0 and time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            try:
+                self._next_check = time.monotonic() + self.reload_s
+                self._check()
+            finally:
+                self._lock.release()
+        return self.rules
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _check(self):
+        stamp = self._stat()
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        try:
+            rules = load_rules(self.path)
+            removed = set(self.rules.profiles) - set(rules.profiles)
+            if removed:
+                raise RuleError(f"profile(s) in use were removed: {', '.join(sorted(removed))}")
+        except (OSError, ValueError) as e:  # RuleError is a ValueError
+            self.last_error = str(e)
+            print(f"⚠️ Keeping previous posture rules, reload failed: {e}")
+            return
+        self.rules = rules
+        self.reloads += 1
+        self.loaded_at = time.time()
+        self.last_error = None
+        print(f"♻️ Reloaded posture rules from {self.path} ({rules.digest})")
+
+    def status(self):
+        rules = self.current()
+        return {
+            "path": self.path,
+            "digest": rules.digest,
+            "grades": [name for name, _ in rules.grades],
+            "profiles": sorted(rules.profiles),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "reload_s": self.reload_s,
+            "last_error": self.last_error,
+        }
+
+
+rulebook = RuleBook()
@@ -0,0 +1,101 @@
+"""Opt-in recorder that samples real requests into a load-test corpus.
+
+Set ``ERGOWISE_RECORD_DIR`` to enable it. A fraction of requests to the
+recorded paths (``ERGOWISE_RECORD_SAMPLE``, default 1%) has its raw body saved
+under ``bodies/`` (content-addressed, so repeated uploads are stored once),
+and one line per request is appended to ``index.jsonl``: arrival time,
+method, path, query, content type, status and server-side latency.
+``loadtest.py`` replays that directory as-is, including multipart framing,
+and can reproduce the recorded arrival pattern.
+
+Recording holds the body of sampled requests in memory until the response
+is sent and writes on a single background thread, so it never blocks the
+event loop. Uploads are user photos: keep the directory access-controlled
+and bounded (``ERGOWISE_RECORD_MAX``).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RECORD_DIR = os.environ.get("ERGOWISE_RECORD_DIR", "")
+RECORD_SAMPLE = float(os.environ.get("ERGOWISE_RECORD_SAMPLE", "0.01"))
+RECORD_MAX = int(os.environ.get("ERGOWISE_RECORD_MAX", "1000"))
+RECORD_PATHS = tuple(p for p in os.environ.get("ERGOWISE_RECORD_PATHS", "/analyze").split(",") if p)
+
+
+class RequestRecorder:
+    """ASGI middleware: ``app.add_middleware(RequestRecorder)`` when RECORD_DIR is set"""
+
+    def __init__(self, app, directory=RECORD_DIR, sample=RECORD_SAMPLE, max_entries=RECORD_MAX, paths=RECORD_PATHS):
+        self.app = app
+        self.directory = directory
+        self.sample = sample
+        self.max_entries = max_entries
+        self.paths = set(paths)
+        self.recorded = 0
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+        index = os.path.join(directory, "index.jsonl")
+        if os.path.exists(index):
+            with open(index, encoding="utf-8") as f:
+                self.recorded = sum(1 for _ in f)
+        # One writer thread keeps index lines in arrival order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ergowise-recorder")
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["path"] not in self.paths
+                or self.recorded >= self.max_entries or random.random() >= self.sample):
+            await self.app(scope, receive, send)
+            return
+
+        self.recorded += 1
+        arrived = time.time()
+        started = time.perf_counter()
+        chunks = []
+        status = None
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def recording_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, recording_receive, recording_send)
+        finally:
+            headers = dict(scope.get("headers") or [])
+            entry = {
+                "t": round(arrived, 6),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "content_type": headers.get(b"content-type", b"").decode("latin-1"),
+                "status": status,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            asyncio.get_running_loop().run_in_executor(self._writer, self._write, entry, b"".join(chunks))
+
+    def _write(self, entry, body):
+        try:
+            name = hashlib.blake2b(body, digest_size=16).hexdigest() + ".bin"
+            path = os.path.join(self.directory, "bodies", name)
+            if not os.path.exists(path):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, path)
+            entry["body"] = f"bodies/{name}"
+            entry["bytes"] = len(body)
+            with open(os.path.join(self.directory, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"⚠️ Could not record request: {e}")
@@ -0,0 +1,200 @@
+"""Response detail levels and negotiated encodings for posture results.
+
+``detail=`` picks how much of a report is generated:
+
+- ``scores``: detected, posture_score, grade, grade_color (and ``resolution``
+  when adaptive inference size is on)
+- ``metrics``: the above plus the six metrics
+- ``full`` (default): the complete report with advice, confidence metrics,
+  keypoints and detection metadata
+
+Reduced levels skip the advice text, keypoint dicts and metadata in the
+pipeline itself; ``trim`` only drops the last few fields.
+
+The body encoding comes from ``format=`` or, failing that, the Accept header:
+
+- ``json`` (application/json): orjson when installed, else the stdlib encoder
+- ``msgpack`` (application/msgpack): needs the optional ``msgpack`` package;
+  floats are single precision and keypoints are float32 ``[17, 3]`` bytes
+- ``pose`` (application/x-ergowise-pose): little-endian records, one per
+  result, back to back. Each starts with a 4-byte header ``u8 flags, u8
+  score, u8 grade, u8 0``; float32[6] metrics (24 bytes, NaN = not measured)
+  follow when ``flags & 2``, then float32 ``[17, 3]`` keypoints in COCO_KPTS
+  order (204 bytes) when ``flags & 4``. A record is therefore 4, 28, 208 or
+  232 bytes, and a reader takes each record's length from its own flags.
+  ``flags & 1`` means detected and grade indexes the current rule table's
+  grades (``rules.grades`` in /model-info; 255 = none).
+
+Bodies of at least ERGOWISE_COMPRESS_MIN_BYTES are gzipped for clients that
+accept it; per-frame scores are smaller than the gzip header is worth.
+"""
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+from fastapi.responses import Response
+
+from pose_archive import NO_GRADE
+from posture_batch import kdict_to_array
+from posture_rules import METRIC_NAMES, rulebook
+
+try:
+    import orjson
+except ImportError:  # optional, several times faster than json.dumps
+    orjson = None
+try:
+    import msgpack
+except ImportError:  # optional, enables format=msgpack
+    msgpack = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("ERGOWISE_COMPRESS_MIN_BYTES", "1400"))
+COMPRESS_LEVEL = int(os.environ.get("ERGOWISE_COMPRESS_LEVEL", "5"))
+
+DETAIL_LEVELS = ("scores", "metrics", "full")
+_DETAIL_FIELDS = {
+    "scores": ("detected", "message", "posture_score", "grade", "grade_color", "resolution"),
+    "metrics": ("detected", "message", "posture_score", "grade", "grade_color", "metrics", "resolution"),
+}
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "pose": "application/x-ergowise-pose",
+}
+_ACCEPT = [("application/x-ergowise-pose", "pose"), ("application/msgpack", "msgpack"),
+           ("application/x-msgpack", "msgpack")]
+
+_POSE_HEADER = struct.Struct("<4B")
+DETECTED, HAS_METRICS, HAS_KEYPOINTS = 1, 2, 4
+
+
+def available(encoding):
+    return encoding != "msgpack" or msgpack is not None
+
+
+def _default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+
+def dumps_json(content):
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, separators=(",", ":"), default=_default).encode()
+
+
+def _packed_keypoints(result):
+    kdict = result.get("keypoints")
+    if not isinstance(kdict, dict):
+        return result
+    return {**result, "keypoints": kdict_to_array(kdict).astype("<f4").tobytes()}
+
+
+def dumps_msgpack(content):
+    if "results" in content:
+        content = {**content, "results": [_packed_keypoints(r) for r in content["results"]]}
+    else:
+        content = _packed_keypoints(content)
+    return msgpack.packb(content, default=_default, use_single_float=True)
+
+
+def pose_record(result):
+    """One ``pose`` record for a result dict"""
+    flags = DETECTED if result.get("detected") else 0
+    parts = [b""]
+    metrics = result.get("metrics")
+    if metrics is not None:
+        flags |= HAS_METRICS
+        parts.append(np.array([np.nan if metrics.get(m) is None else metrics[m] for m in METRIC_NAMES], "<f4").tobytes())
+    kdict = result.get("keypoints")
+    if isinstance(kdict, dict):
+        flags |= HAS_KEYPOINTS
+        parts.append(kdict_to_array(kdict).astype("<f4").tobytes())
+    score = min(255, max(0, int(round(result.get("posture_score") or 0))))
+    grade = rulebook.current().grade_codes.get(result.get("grade"), NO_GRADE)
+    parts[0] = _POSE_HEADER.pack(flags, score, grade, 0)
+    return b"".join(parts)
+
+
+def dumps_pose(content):
+    return b"".join(pose_record(r) for r in content.get("results", [content]))
+
+
+_DUMPS = {"json": dumps_json, "msgpack": dumps_msgpack, "pose": dumps_pose}
+
+
+def trim(result, detail):
+    """Drop the fields a reduced detail level does not include"""
+    fields = _DETAIL_FIELDS.get(detail)
+    if fields is None:
+        return result
+    if "results" in result:
+        return {**result, "results": [trim(r, detail) for r in result["results"]]}
+    return {k: result[k] for k in fields if k in result}
+
+
+class ResponseFormat:
+    """What one request asked for: detail level, body encoding and gzip"""
+
+    def __init__(self, detail="full", encoding="json", gzip=False):
+        self.detail = detail
+        self.encoding = encoding
+        self.gzip = gzip
+
+    @property
+    def full(self):
+        return self.detail == "full"
+
+    @classmethod
+    def negotiate(cls, headers, detail=None, fmt=None):
+        """From request headers and the ``detail``/``format`` query values.
+        Raises ValueError for unknown values or a format that is not installed."""
+        detail = detail or "full"
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"detail must be one of {', '.join(DETAIL_LEVELS)}")
+        if fmt:
+            if fmt not in MEDIA_TYPES:
+                raise ValueError(f"format must be one of {', '.join(MEDIA_TYPES)}")
+            if not available(fmt):
+                raise ValueError(f"format={fmt} needs the {fmt} package, which is not installed")
+            encoding = fmt
+        else:
+            # First listed type we can produce; no q-value ranking
+            accept = headers.get("accept", "")
+            encoding = "json"
+            for media_type, name in _ACCEPT:
+                if media_type in accept and available(name):
+                    encoding = name
+                    break
+        return cls(detail, encoding, "gzip" in headers.get("accept-encoding", ""))
+
+    def dumps(self, content):
+        return _DUMPS[self.encoding](trim(content, self.detail))
+
+    def response(self, content, status_code=200):
+        body = self.dumps(content)
+        headers = {"Vary": "Accept, Accept-Encoding"}
+        if self.gzip and len(body) >= COMPRESS_MIN_BYTES:
+            body = gzip.compress(body, COMPRESS_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+        return Response(body, status_code=status_code, media_type=MEDIA_TYPES[self.encoding], headers=headers)
+
+
+def stream_encoder(fmt):
+    """(send method name, dumps) for a WebSocket session's ``format``: JSON
+    text frames, or msgpack binary frames"""
+    fmt = fmt or "json"
+    if fmt not in ("json", "msgpack"):
+        raise ValueError("format must be json or msgpack")
+    if not available(fmt):
+        raise ValueError(f"format={fmt} needs the {fmt} package, which is not installed")
+    if fmt == "msgpack":
+        return "send_bytes", lambda message: msgpack.packb(message, use_single_float=True)
+    if orjson is not None:
+        return "send_text", lambda message: orjson.dumps(message).decode()
+    return "send_text", lambda message: json.dumps(message, separators=(",", ":"))
@@ -0,0 +1,135 @@
+"""Temporal smoothing and hysteresis for streamed posture metrics.
+
+Scoring each frame on its own makes ``head_tilt_deg`` and ``torso_lean_deg``
+jitter with keypoint noise, and tips flip on and off near their thresholds.
+For streaming sessions this module sits between keypoint extraction and
+scoring:
+
+* a One-Euro filter per keypoint coordinate (smooth when still, responsive
+  when moving),
+* an exponential moving average on the six derived metrics,
+* hysteresis on the flag thresholds, so a flagged metric has to fall clearly
+  back inside its threshold before the tip clears.
+
+State is a handful of small NumPy arrays per session, kept in a bounded LRU.
+"""
+import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SMOOTH_MAX_SESSIONS = int(os.environ.get("ERGOWISE_SMOOTH_MAX_SESSIONS", "1024"))
+
+# One-Euro parameters (pixel coordinates, seconds)
+ONE_EURO_MIN_CUTOFF = float(os.environ.get("ERGOWISE_ONE_EURO_MIN_CUTOFF", "1.0"))
+ONE_EURO_BETA = float(os.environ.get("ERGOWISE_ONE_EURO_BETA", "0.02"))
+ONE_EURO_D_CUTOFF = 1.0
+
+# Weight of the newest frame in the metric moving average
+METRIC_EMA_ALPHA = float(os.environ.get("ERGOWISE_METRIC_EMA_ALPHA", "0.4"))
+
+# Keypoints below this confidence are passed through and reset the filter
+MIN_TRACK_CONF = 0.3
+
+METRIC_NAMES = [
+    "head_tilt_deg", "torso_lean_deg", "shoulder_drop_px",
+    "pelvic_drop_px", "left_knee_angle_deg", "right_knee_angle_deg",
+]
+
+def _alpha(cutoff, dt):
+    tau = 1.0 / (2 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class SessionSmoother:
+    """Filter state for one stream: keypoints, metric averages and flags"""
+
+    def __init__(self, n_kpts=17):
+        self.xy = np.zeros((n_kpts, 2), np.float32)
+        self.dxy = np.zeros((n_kpts, 2), np.float32)
+        self.valid = np.zeros(n_kpts, bool)
+        self.t = None
+        self.metrics = np.full(len(METRIC_NAMES), np.nan)
+        self.active = {}
+
+    def filter_array(self, kpts, t=None):
+        """One-Euro filter a float[17, 3] keypoint row; returns a new float32 row"""
+        t = time.monotonic() if t is None else t
+        raw = np.asarray(kpts[:, :2], np.float32)
+        conf = np.asarray(kpts[:, 2], np.float32)
+        ok = conf >= MIN_TRACK_CONF
+
+        if self.t is None or t <= self.t:
+            smoothed = raw
+            self.dxy[:] = 0
+        else:
+            dt = t - self.t
+            dx = (raw - self.xy) / dt
+            a_d = _alpha(ONE_EURO_D_CUTOFF, dt)
+            self.dxy = a_d * dx + (1 - a_d) * self.dxy
+            speed = np.linalg.norm(self.dxy, axis=1, keepdims=True)
+            cutoff = ONE_EURO_MIN_CUTOFF + ONE_EURO_BETA * speed
+            tau = 1.0 / (2 * np.pi * cutoff)
+            a = 1.0 / (1.0 + tau / dt)
+            smoothed = a * raw + (1 - a) * self.xy
+
+        # Points that were not tracked before, or are unreliable now, restart from raw
+        fresh = ~(self.valid & ok)
+        smoothed = np.where(fresh[:, None], raw, smoothed).astype(np.float32)
+        self.dxy[fresh] = 0
+        self.xy = smoothed
+        self.valid = ok
+        self.t = t
+
+        out = np.empty((len(raw), 3), np.float32)
+        out[:, :2] = smoothed
+        out[:, 2] = conf
+        return out
+
+    def smooth_metrics(self, *values):
+        """EMA over the six derived metrics; None resets that metric's average"""
+        raw = np.array([np.nan if v is None else v for v in values], float)
+        prev = self.metrics
+        blended = METRIC_EMA_ALPHA * raw + (1 - METRIC_EMA_ALPHA) * prev
+        self.metrics = np.where(np.isnan(prev), raw, blended)
+        return tuple(None if np.isnan(v) else float(v) for v in self.metrics)
+
+    def threshold(self, name, value, threshold, band, below=False):
+        """Effective threshold for ``name`` given whether it is already flagged.
+
+        ``band`` is how far past the threshold a flagged metric must come back
+        to clear it (``hysteresis`` in posture_rules.toml). Returns a value the
+        caller compares against exactly as before (``abs(value) > threshold``,
+        or ``value < threshold`` with ``below=True``), and records the
+        resulting flag state.
+        """
+        if self.active.get(name):
+            threshold = threshold + band if below else threshold - band
+        if value is None:
+            self.active[name] = False
+        else:
+            self.active[name] = value < threshold if below else abs(value) > threshold
+        return threshold
+
+
+class SmootherRegistry:
+    """LRU of per-session smoothers"""
+
+    def __init__(self, max_sessions=SMOOTH_MAX_SESSIONS):
+        self.max_sessions = max(1, int(max_sessions))
+        self.sessions = OrderedDict()
+
+    def get(self, session_id):
+        smoother = self.sessions.get(session_id)
+        if smoother is None:
+            smoother = self.sessions[session_id] = SessionSmoother()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return smoother
+
+    def forget(self, session_id):
+        self.sessions.pop(session_id, None)
@@ -0,0 +1,148 @@
+"""WebSocket streaming for continuous webcam posture monitoring.
+
+Clients send JPEG frames as binary messages. Only the newest unprocessed frame
+is kept: if the client sends faster than inference runs, older frames are
+dropped so latency stays bounded. Each processed frame is answered with a
+compact message carrying only the metrics that changed since the last one:
+JSON text frames by default, msgpack binary frames with ``?format=msgpack``.
+"""
+import asyncio
+import os
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from execution import Saturated
+from response_encoding import stream_encoder
+
+# Metric changes smaller than this are not re-sent (degrees / pixels)
+METRIC_EPSILON = float(os.environ.get("ERGOWISE_STREAM_METRIC_EPSILON", "0.5"))
+
+
+class LatestFrame:
+    """Single-slot mailbox: a new frame replaces one that was not picked up yet"""
+
+    def __init__(self):
+        self._frame = None
+        self._event = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self._event.set()
+
+    def close(self):
+        self.closed = True
+        self._event.set()
+
+    async def get(self):
+        """Wait for the newest frame; returns None once the client is gone"""
+        while self._frame is None:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        frame, self._frame = self._frame, None
+        return frame
+
+
+class MetricDeltas:
+    """Tracks what the client has already been sent and emits only changes"""
+
+    def __init__(self, epsilon=METRIC_EPSILON):
+        self.epsilon = epsilon
+        self.sent = {}
+        self.detected = None
+
+    def _changed(self, key, value):
+        if key not in self.sent:
+            return True
+        old = self.sent[key]
+        if old is None or value is None:
+            return old is not value
+        return abs(value - old) >= self.epsilon
+
+    def update(self, report):
+        """Message fields for one frame's report (None = no person detected)"""
+        out = {}
+        detected = report is not None
+        if detected != self.detected:
+            out["detected"] = detected
+            self.detected = detected
+        if not detected:
+            return out
+
+        metrics = {}
+        for key, value in report["metrics"].items():
+            value = round(value, 1) if value is not None else None
+            if self._changed(key, value):
+                metrics[key] = value
+                self.sent[key] = value
+        if metrics:
+            out["metrics"] = metrics
+        for key in ("posture_score", "grade"):
+            if self.sent.get(key) != report[key]:
+                out[key] = report[key]
+                self.sent[key] = report[key]
+        return out
+
+
+async def stream_analysis(websocket: WebSocket, analyze_frame):
+    """Serve one monitoring session.
+
+    ``analyze_frame(data)`` is the app's per-frame pipeline coroutine; it
+    returns a ``posture_report`` dict with at least metrics, posture_score and
+    grade, or None when nobody was detected.
+    """
+    try:
+        send, dumps = stream_encoder(websocket.query_params.get("format"))
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e)[:120])
+        return
+    await websocket.accept()
+    send = getattr(websocket, send)
+    mailbox = LatestFrame()
+
+    async def receive():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    mailbox.put(message["bytes"])
+        finally:
+            mailbox.close()
+
+    receiver = asyncio.create_task(receive())
+    deltas = MetricDeltas()
+    seq = 0
+    reported_drops = 0
+    try:
+        while True:
+            data = await mailbox.get()
+            if data is None:
+                break
+            seq += 1
+            try:
+                report = await analyze_frame(data)
+            except Saturated:
+                # Server is at capacity: treat like any other stale frame
+                mailbox.dropped += 1
+                continue
+            except Exception as e:
+                await send(dumps({"seq": seq, "error": str(e)}))
+                continue
+
+            message = {"seq": seq, **deltas.update(report)}
+            if mailbox.dropped != reported_drops:
+                message["dropped"] = mailbox.dropped - reported_drops
+                reported_drops = mailbox.dropped
+            await send(dumps(message))
+    except (WebSocketDisconnect, RuntimeError):
+        # Client went away mid-send
+        pass
+    finally:
+        receiver.cancel()
@@ -0,0 +1,145 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import backends
+from backends import GraphPoseModel, check_imgsz, nms
+
+# The torch checkpoint to compare exported graphs against; exporting needs it
+# locally (nothing is downloaded)
+PARITY_MODEL = os.environ.get("ERGOWISE_PARITY_MODEL", "yolov8n-pose.pt")
+# Max keypoint/box difference in pixels, as `python backends.py parity`
+PARITY_ATOL = 1.0
+
+
+class FixedGraph(GraphPoseModel):
+    """Returns the same raw prediction for every image"""
+
+    def __init__(self, pred):
+        self.pred = pred
+        self.blobs = []
+
+    def _forward(self, blob):
+        self.blobs.append(blob.shape)
+        return np.repeat(self.pred[None], len(blob), axis=0)
+
+
+def raw_prediction(*people):
+    """[56, anchors] from (cx, cy, w, h, score, kpts float[17, 3]) tuples"""
+    return np.stack([np.concatenate([[cx, cy, w, h, score], kpts.ravel()])
+                     for cx, cy, w, h, score, kpts in people], axis=1).astype(np.float32)
+
+
+def person_kpts(cx, cy, conf=0.9):
+    k = np.zeros((17, 3), np.float32)
+    k[:, 0] = cx + np.linspace(-20, 20, 17)
+    k[:, 1] = cy + np.linspace(-60, 60, 17)
+    k[:, 2] = conf
+    return k
+
+
+def test_graph_model_is_abstract():
+    with pytest.raises(TypeError):
+        GraphPoseModel()
+
+
+def test_check_imgsz_rounds_up_to_stride():
+    assert check_imgsz(640) == 640
+    assert check_imgsz(300) == 320
+    assert check_imgsz(1) == 32
+
+
+def test_nms_keeps_best_of_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [50, 50, 60, 60]], np.float32)
+    scores = np.array([0.8, 0.9, 0.7], np.float32)
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+
+
+def test_predict_arrays_rescales_to_the_original_frame():
+    kpts = person_kpts(320, 160)
+    kpts[0, 2] = 0.3  # below 0.5: zeroed like ultralytics Keypoints
+    pred = raw_prediction(
+        (320, 160, 64, 128, 0.9, kpts),
+        (322, 161, 64, 128, 0.6, person_kpts(322, 161)),  # suppressed by NMS
+        (100, 100, 20, 20, 0.1, person_kpts(100, 100)),   # below conf
+    )
+    model = FixedGraph(pred)
+    img = np.zeros((300, 600, 3), np.uint8)
+    (xy, kconf, box_conf, box), = model.predict_arrays(img, conf=0.25, iou=0.7, imgsz=640)
+
+    # 600x300 letterboxes to 640x320 with no padding: gain 640/600
+    assert model.blobs == [(1, 3, 320, 640)]
+    gain = 640 / 600
+    assert len(xy) == 1 and box_conf.tolist() == [pytest.approx(0.9)]
+    np.testing.assert_allclose(box[0], np.round([288 / gain, 96 / gain, 352 / gain, 224 / gain]))
+    np.testing.assert_allclose(xy[0, 1:], kpts[1:, :2] / gain, rtol=1e-5)
+    assert xy[0, 0].tolist() == [0, 0]
+    np.testing.assert_allclose(kconf[0], kpts[:, 2])
+
+
+def test_predict_arrays_runs_single_batch_graphs_per_image():
+    model = FixedGraph(raw_prediction((320, 160, 64, 128, 0.9, person_kpts(320, 160))))
+    model.single_batch = True
+    img = np.zeros((320, 640, 3), np.uint8)
+    assert len(model.predict_arrays([img, img])) == 2
+    assert model.blobs == [(1, 3, 320, 640), (1, 3, 320, 640)]
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    pytest.importorskip("ultralytics")
+    pytest.importorskip("onnx")
+    if not os.path.exists(PARITY_MODEL):
+        pytest.skip(f"{PARITY_MODEL} not found; set ERGOWISE_PARITY_MODEL to a local checkpoint")
+    # Export next to a copy so the test never overwrites real exports
+    path = tmp_path_factory.mktemp("models") / os.path.basename(PARITY_MODEL)
+    shutil.copy(PARITY_MODEL, path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def photos():
+    import cv2
+    from ultralytics.utils import ASSETS
+    return [cv2.imread(str(ASSETS / name)) for name in ("bus.jpg", "zidane.jpg")]
+
+
+@pytest.fixture(scope="module", params=[("onnx", "onnxruntime"), ("openvino", "openvino")], ids=["onnx", "openvino"])
+def models(request, checkpoint):
+    backend, runtime = request.param
+    pytest.importorskip(runtime)
+    if not os.path.exists(backends.exported_path(checkpoint, backend)):
+        backends.export(checkpoint, [backend])
+    return backends.load_model(checkpoint, "torch"), backends.load_model(checkpoint, backend)
+
+
+def test_exported_graph_matches_torch_outputs(models, photos):
+    import torch
+    torch_model, graph_model = models
+    img = photos[0]
+    blob = np.ascontiguousarray(backends.letterbox(img, 640, True)[None, ..., ::-1].transpose(0, 3, 1, 2), np.float32)
+    blob /= 255.0
+    net = torch_model.model.eval()
+    with torch.no_grad():
+        ref = net(torch.from_numpy(blob))
+    ref = (ref[0] if isinstance(ref, (list, tuple)) else ref).numpy()
+    out = graph_model._forward(blob)
+    # Rows: box xywh, box score, then x, y, conf per keypoint
+    scores = [4] + list(range(7, 56, 3))
+    pixels = [i for i in range(56) if i not in scores]
+    np.testing.assert_allclose(out[:, pixels], ref[:, pixels], atol=PARITY_ATOL)
+    np.testing.assert_allclose(out[:, scores], ref[:, scores], atol=1e-2)
+
+
+def test_exported_keypoints_match_torch(models, photos):
+    torch_model, graph_model = models
+    ref = torch_model(photos[0], verbose=False)[0]
+    conf = ref.boxes.conf.cpu().numpy()
+    if len(np.unique(conf)) < len(conf):
+        pytest.skip("checkpoint gives tied detection scores (untrained weights?); people cannot be paired")
+    for img in photos:
+        ref_count, count, kpt_err, box_err = backends.compare(torch_model, graph_model, img)
+        assert ref_count > 0 and count == ref_count
+        assert kpt_err <= PARITY_ATOL and box_err <= PARITY_ATOL
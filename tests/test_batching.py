@@ -0,0 +1,67 @@
+import asyncio
+
+from batching import InferenceBatcher
+
+
+class RecordingModel:
+    """Returns each image tagged with its settings; records every call"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def __call__(self, imgs, conf, iou, verbose, imgsz=None):
+        self.calls.append((list(imgs), conf, iou, imgsz))
+        if self.fail:
+            raise RuntimeError("forward failed")
+        return [(img, conf, imgsz) for img in imgs]
+
+
+def run(batcher, *requests):
+    async def main():
+        return await asyncio.gather(*(batcher.predict(img, **kw) for img, kw in requests))
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_a_forward_pass():
+    model = RecordingModel()
+    results = run(InferenceBatcher(model, max_batch_size=8, max_wait_ms=20), *[(i, {}) for i in range(5)])
+    assert results == [[(i, 0.25, None)] for i in range(5)]
+    assert [call[0] for call in model.calls] == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_capped_at_max_size():
+    model = RecordingModel()
+    run(InferenceBatcher(model, max_batch_size=2, max_wait_ms=20), *[(i, {}) for i in range(5)])
+    assert [call[0] for call in model.calls] == [[0, 1], [2, 3], [4]]
+
+
+def test_requests_are_grouped_by_settings():
+    model = RecordingModel()
+    results = run(InferenceBatcher(model, max_wait_ms=20),
+                  (0, {}), (1, {"imgsz": 320}), (2, {}), (3, {"conf": 0.5, "imgsz": 320}), (4, {"imgsz": 320}))
+    assert results == [[(0, 0.25, None)], [(1, 0.25, 320)], [(2, 0.25, None)], [(3, 0.5, 320)], [(4, 0.25, 320)]]
+    assert sorted((call[0], call[1], call[3]) for call in model.calls) == [
+        ([0, 2], 0.25, None), ([1, 4], 0.25, 320), ([3], 0.5, 320)]
+
+
+def test_model_errors_reach_every_caller():
+    batcher = InferenceBatcher(RecordingModel(fail=True), max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(batcher.predict(0), batcher.predict(1), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert [str(e) for e in errors] == ["forward failed", "forward failed"]
+
+
+def test_close_drops_the_model():
+    batcher = InferenceBatcher(RecordingModel(), max_wait_ms=0)
+
+    async def main():
+        await batcher.predict(0)
+        assert batcher.queued == 0
+        batcher.close()
+
+    asyncio.run(main())
+    assert batcher.model is None and batcher._worker is None
@@ -0,0 +1,71 @@
+import asyncio
+
+from metrics import PipelineMetrics, result_outcome, unrecorded
+from readiness import ModelLoader
+
+
+def series(metrics, prefix):
+    return [line for line in metrics.render().splitlines() if line.startswith(prefix)]
+
+
+def test_histogram_and_outcome_render():
+    metrics = PipelineMetrics("yolov8n-pose.pt")
+    metrics.observe("decode", 0.003)
+    metrics.observe("decode", 0.2)
+    metrics.outcome("detected")
+    metrics.gauge("ergowise_queue", "Queued frames", lambda: 4)
+    text = metrics.render()
+    assert 'ergowise_stage_seconds_bucket{model="yolov8n-pose.pt",stage="decode",le="0.005"} 1' in text
+    assert 'ergowise_stage_seconds_count{model="yolov8n-pose.pt",stage="decode"} 2' in text
+    assert 'ergowise_requests_total{model="yolov8n-pose.pt",endpoint="analyze",outcome="detected"} 1' in text
+    assert 'ergowise_queue{model="yolov8n-pose.pt"} 4' in text
+
+
+def test_result_outcome():
+    assert result_outcome({"detected": True}) == "detected"
+    assert result_outcome({"detected": False, "message": "No person detected"}) == "undetected"
+    assert result_outcome({"detected": False, "message": "Analysis failed: boom"}) == "failed"
+    assert result_outcome(object()) == "failed"
+
+
+def test_unrecorded_drops_observations():
+    metrics = PipelineMetrics("m")
+    extra = metrics.counter("ergowise_extra_total", "Extra", ("model",))
+    with unrecorded():
+        metrics.observe("decode", 0.1)
+        metrics.outcome("detected")
+        extra.inc(("m",))
+    assert series(metrics, "ergowise_stage_seconds_count") == []
+    assert series(metrics, "ergowise_requests_total") == []
+    assert series(metrics, "ergowise_extra_total") == []
+
+
+def test_warm_up_is_not_recorded_but_concurrent_requests_are():
+    metrics = PipelineMetrics("m")
+
+    async def request(seconds):
+        metrics.observe("total", seconds)
+        metrics.outcome("detected")
+
+    async def main():
+        served = asyncio.Event()
+
+        async def warm_up():
+            await request(0.5)
+            await served.wait()
+
+        loader = ModelLoader(lambda: True, warm_up, runs=2)
+        task = loader.start()
+        while loader.state != "warming":
+            await asyncio.sleep(0.001)
+        # A real request answered while the model warms up
+        await request(0.01)
+        served.set()
+        await task
+        assert loader.ready and len(loader.warmup_runs_ms) == 2
+
+    asyncio.run(main())
+    assert series(metrics, "ergowise_stage_seconds_count") == ['ergowise_stage_seconds_count{model="m",stage="total"} 1']
+    assert series(metrics, "ergowise_stage_seconds_sum") == ['ergowise_stage_seconds_sum{model="m",stage="total"} 0.010000']
+    assert series(metrics, "ergowise_requests_total") == [
+        'ergowise_requests_total{model="m",endpoint="analyze",outcome="detected"} 1']
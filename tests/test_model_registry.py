@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import model_registry
+from model_registry import ModelRegistry, UnknownModel
+
+
+class FakeInference:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    async def predict(self, img, **kwargs):
+        return []
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = ModelRegistry(allowed=["yolov8n-pose.pt", "yolov8m-pose.pt"], idle_s=3600, sweep_s=0)
+    monkeypatch.setattr(registry, "_build", lambda name: (FakeInference(name), 100))
+    monkeypatch.setattr(model_registry, "synthetic_frame", lambda: None)
+    registry.pin("yolov8s-pose.pt", FakeInference("default"))
+    return registry
+
+
+def use(registry, name):
+    async def main():
+        async with registry.use(name) as inference:
+            return inference
+    return asyncio.run(main())
+
+
+def test_default_and_unknown_models(registry):
+    assert use(registry, None).name == "default"
+    assert registry.check("yolov8s-pose.pt") == "yolov8s-pose.pt"
+    with pytest.raises(UnknownModel):
+        registry.check("../evil.pt")
+
+
+def test_models_load_once_on_demand(registry):
+    first = use(registry, "yolov8m-pose.pt")
+    assert use(registry, "yolov8m-pose.pt") is first
+    assert registry.loads == 1
+
+
+def test_shared_cascade_stage_is_not_loaded_again(registry):
+    stage = FakeInference("cascade nano")
+    registry.share("yolov8n-pose.pt", stage)
+    assert use(registry, "yolov8n-pose.pt") is stage
+    assert registry.loads == 0
+    # Shared frontends belong to their owner: never unloaded
+    registry.idle_s = -1
+    registry._unload_idle()
+    assert "yolov8n-pose.pt" in registry.resident and not stage.closed
+
+
+def test_idle_models_are_unloaded(registry):
+    loaded = use(registry, "yolov8m-pose.pt")
+    registry.idle_s = -1
+    registry._unload_idle()
+    assert loaded.closed and list(registry.resident) == ["yolov8s-pose.pt"]
+    assert registry.evictions == 1
+
+
+def test_budget_unloads_least_recently_used(registry):
+    registry.budget = 150
+    first = use(registry, "yolov8m-pose.pt")
+    use(registry, "yolov8n-pose.pt")
+    assert first.closed and list(registry.resident) == ["yolov8s-pose.pt", "yolov8n-pose.pt"]
@@ -0,0 +1,79 @@
+import sys
+
+import numpy as np
+
+import pose_archive
+from pose_archive import NO_GRADE, RECORD_DTYPE, ArchiveReader, PoseArchive, session_hash
+from posture_rules import METRIC_NAMES, rulebook
+
+T0 = 1_700_000_000.0
+
+
+def kpts(offset=0.0):
+    k = np.zeros((17, 3), np.float32)
+    k[:, 0] = np.arange(17) * 10 + offset
+    k[:, 1] = np.arange(17) * 20
+    k[:, 2] = 0.75
+    return k
+
+
+def report(score, grade, head_tilt=None):
+    metrics = dict.fromkeys(METRIC_NAMES)
+    metrics["head_tilt_deg"] = head_tilt
+    return {"metrics": metrics, "posture_score": score, "grade": grade}
+
+
+def write_frames(directory):
+    grades = [name for name, _ in rulebook.current().grades]
+    archive = PoseArchive(str(directory), group=8, flush_ms=10_000)
+    archive.append("abc", kpts(), report(92, grades[0], 4.5), t=T0)
+    archive.append("abc", kpts(1.0), report(70, grades[-1]), t=T0 + 1)
+    archive.append(None, kpts(2.0), report(300, "not a grade", 12.0), t=T0 + 2)
+    archive.close()
+    return archive, grades
+
+
+def test_round_trip(tmp_path):
+    archive, grades = write_frames(tmp_path)
+    assert archive.records == 3 and archive.dropped == 0
+
+    reader = ArchiveReader(str(tmp_path))
+    recs = reader.scan()
+    assert recs.dtype == RECORD_DTYPE and len(recs) == 3
+    assert recs["t"].tolist() == [T0, T0 + 1, T0 + 2]
+    np.testing.assert_allclose(recs["kpts"][1], kpts(1.0), atol=0.01)
+    assert recs["score"].tolist() == [92, 70, 255]
+    assert recs["grade"].tolist() == [0, len(grades) - 1, NO_GRADE]
+    assert recs["metrics"][0][0] == 4.5 and np.isnan(recs["metrics"][1]).all()
+
+    assert len(reader.scan(session_id="abc")) == 2
+    assert len(reader.scan(start=T0 + 1)) == 2
+    assert reader.sessions() == {session_hash("abc"): "abc"}
+
+
+def test_torn_record_is_dropped_on_next_write(tmp_path):
+    write_frames(tmp_path)
+    path, = ArchiveReader(str(tmp_path)).paths()
+    with open(path, "ab") as f:
+        f.write(b"\1" * 10)  # partial record from a crash
+    archive = PoseArchive(str(tmp_path), group=8, flush_ms=10_000)
+    archive.append("abc", kpts(), report(80, "Good"), t=T0 + 3)
+    archive.close()
+    assert len(ArchiveReader(str(tmp_path)).scan()) == 4
+
+
+def test_main_summarizes_archive(tmp_path, monkeypatch, capsys):
+    _, grades = write_frames(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["pose_archive.py", str(tmp_path)])
+    pose_archive.main()
+    out = capsys.readouterr().out
+    assert "3 frames" in out
+    assert f"{grades[0]}: 1" in out and f"{grades[-1]}: 1" in out
+    assert "session abc: 2 frames" in out
+    assert "session (one-off): 1 frames" in out
+
+
+def test_main_empty_archive(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["pose_archive.py", str(tmp_path)])
+    pose_archive.main()
+    assert "0 frames" in capsys.readouterr().out
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from pose_extract import DEFAULT_KPT_CONF, best_pose, extract_poses, keypoint_dict
+from posture_batch import COCO_KPTS
+
+
+def arrays(n, offset=0.0, kconf=True):
+    xy = np.arange(n * 17 * 2, dtype=np.float32).reshape(n, 17, 2) + offset
+    conf = np.full((n, 17), 0.8, np.float32) if kconf else None
+    box_conf = np.linspace(0.5, 0.9, n, dtype=np.float32)
+    boxes = np.tile(np.array([10, 20, 110, 220], np.float32), (n, 1)) + offset
+    return xy, conf, box_conf, boxes
+
+
+def test_extract_from_host_arrays():
+    xy, conf, box_conf, boxes = arrays(2)
+    kpts, got_conf, got_boxes = extract_poses(SimpleNamespace(arrays=(xy, conf, box_conf, boxes)))
+    assert kpts.shape == (2, 17, 3) and kpts.dtype == np.float32
+    np.testing.assert_array_equal(kpts[..., :2], xy)
+    np.testing.assert_array_equal(kpts[..., 2], conf)
+    np.testing.assert_array_equal(got_conf, box_conf)
+    np.testing.assert_array_equal(got_boxes, boxes)
+
+
+def test_missing_visibility_uses_default_conf():
+    kpts, _, _ = extract_poses(SimpleNamespace(arrays=arrays(1, kconf=False)))
+    assert (kpts[..., 2] == DEFAULT_KPT_CONF).all()
+
+
+def test_nobody_detected():
+    kpts, conf, boxes = extract_poses(SimpleNamespace(keypoints=None, boxes=None))
+    assert kpts.shape == (0, 17, 3) and conf.shape == (0,) and boxes.shape == (0, 4)
+    assert best_pose([SimpleNamespace(arrays=arrays(0))]) == (None, None, -1.0)
+
+
+@pytest.mark.parametrize("dims", [3, 2])
+def test_extract_from_ultralytics_tensors(dims):
+    torch = pytest.importorskip("torch")
+    xy, conf, box_conf, boxes = arrays(2)
+    kdata = np.concatenate([xy, conf[..., None]], -1)[..., :dims]
+    bdata = np.concatenate([boxes, box_conf[:, None], np.zeros((2, 1), np.float32)], 1)  # + class
+    result = SimpleNamespace(keypoints=SimpleNamespace(data=torch.from_numpy(kdata)),
+                             boxes=SimpleNamespace(data=torch.from_numpy(bdata)))
+    kpts, got_conf, got_boxes = extract_poses(result)
+    np.testing.assert_array_equal(kpts[..., :2], xy)
+    np.testing.assert_array_equal(kpts[..., 2], conf if dims == 3 else DEFAULT_KPT_CONF)
+    np.testing.assert_array_equal(got_conf, box_conf)
+    np.testing.assert_array_equal(got_boxes, boxes)
+
+
+def test_best_pose_across_results():
+    first = SimpleNamespace(arrays=arrays(2))
+    xy, kconf, box_conf, boxes = arrays(3, offset=1000.0)
+    box_conf[1] = 0.95
+    kpts, box, conf = best_pose([first, SimpleNamespace(arrays=(xy, kconf, box_conf, boxes))])
+    assert conf == pytest.approx(0.95)
+    assert box.tolist() == [1010, 1020, 1110, 1220]
+    np.testing.assert_array_equal(kpts[:, :2], xy[1])
+
+
+def test_keypoint_dict():
+    kpts = np.zeros((17, 3), np.float32)
+    kpts[0] = (1.5, 2.5, 0.75)
+    d = keypoint_dict(kpts)
+    assert list(d) == COCO_KPTS
+    assert d["nose"] == ((1.5, 2.5), 0.75)
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+import pytest
+
+from posture_batch import KPT_INDEX, kdict_to_array, parse_keypoints, posture_report_batch
+from posture_rules import load_rules
+
+RULES = load_rules()
+
+
+def standing(dx=0.0):
+    """A front-facing upright person; ``dx`` shifts the head sideways"""
+    k = np.zeros((17, 3), np.float32)
+    k[:, 2] = 0.9
+    points = {
+        "nose": (200 + dx, 80), "left_eye": (210 + dx, 70), "right_eye": (190 + dx, 70),
+        "left_ear": (220 + dx, 75), "right_ear": (180 + dx, 75),
+        "left_shoulder": (250, 150), "right_shoulder": (150, 150),
+        "left_elbow": (260, 230), "right_elbow": (140, 230),
+        "left_wrist": (265, 300), "right_wrist": (135, 300),
+        "left_hip": (235, 320), "right_hip": (165, 320),
+        "left_knee": (235, 450), "right_knee": (165, 450),
+        "left_ankle": (235, 580), "right_ankle": (165, 580),
+    }
+    for name, xy in points.items():
+        k[KPT_INDEX[name], :2] = xy
+    return k
+
+
+def test_parse_json_single_and_batched():
+    pose = standing()
+    kpts, single = parse_keypoints(json.dumps(pose.tolist()), "application/json")
+    assert single and kpts.shape == (1, 17, 3)
+    kpts, single = parse_keypoints(json.dumps({"keypoints": [pose.tolist()] * 2}), "application/json")
+    assert not single and kpts.shape == (2, 17, 3)
+    np.testing.assert_array_equal(kpts[1], pose)
+
+
+def test_parse_binary():
+    poses = np.stack([standing(), standing(30)])
+    kpts, single = parse_keypoints(poses.astype("<f4").tobytes(), "application/octet-stream")
+    assert not single
+    np.testing.assert_array_equal(kpts, poses)
+
+
+@pytest.mark.parametrize("body, content_type, message", [
+    (b"{", "application/json", "Invalid JSON"),
+    (json.dumps([[1, 2]]), "application/json", "shape"),
+    (json.dumps({"keypoints": "x"}), "application/json", "numeric"),
+    (json.dumps([[[float("nan")] * 3] * 17]), "application/json", "finite"),
+    (b"\0" * 10, "", "bytes per pose"),
+    (b"", "", "bytes per pose"),
+])
+def test_parse_rejects_malformed(body, content_type, message):
+    with pytest.raises(ValueError, match=message):
+        parse_keypoints(body, content_type)
+
+
+def test_parse_pose_limit():
+    body = np.zeros((3, 17, 3), "<f4").tobytes()
+    with pytest.raises(ValueError, match="At most 2"):
+        parse_keypoints(body, max_poses=2)
+
+
+def test_kdict_round_trip():
+    pose = standing()
+    kdict = {name: ((x, y), c) for name, (x, y, c) in zip(KPT_INDEX, pose.tolist())}
+    np.testing.assert_array_equal(kdict_to_array(kdict), pose)
+
+
+def test_batch_metrics_and_report():
+    batch = posture_report_batch(np.stack([standing(), standing(40)]), profile="enhanced", rules=RULES)
+    assert len(batch) == 2
+    upright, tilted = batch.report(0), batch.report(1)
+    assert upright["metrics"]["head_tilt_deg"] == pytest.approx(0.0, abs=1e-3)
+    assert upright["metrics"]["shoulder_drop_px"] == 0.0
+    assert upright["posture_score"] == 100 and upright["grade"] == "Excellent"
+    assert tilted["metrics"]["head_tilt_deg"] > 10 and tilted["posture_score"] < 100
+    assert tilted["confidence_metrics"]["body_height"] == 170.0
+    assert batch.brief(1)["posture_score"] == tilted["posture_score"]
+
+
+def test_batch_gates_drop_low_confidence_points():
+    pose = standing(40)
+    pose[[KPT_INDEX["nose"], KPT_INDEX["left_ear"], KPT_INDEX["right_ear"]], 2] = 0.1
+    report = posture_report_batch(pose, profile="enhanced", rules=RULES).report(0)
+    assert report["metrics"]["head_tilt_deg"] is None
+    assert report["posture_score"] == 100
@@ -0,0 +1,42 @@
+import functools
+import pickle
+
+import numpy as np
+import pytest
+
+import posture_report
+from pose_extract import keypoint_dict
+from posture_batch import posture_report_batch
+from tests.test_posture_batch import standing
+
+
+@pytest.mark.parametrize("profile, keys", [
+    ("app", {"tips", "professional_analysis"}),
+    ("enhanced", {"tips", "confidence_metrics"}),
+    ("professional", {"overall_summary", "good_observations", "confidence_metrics"}),
+])
+def test_layout_per_profile(profile, keys):
+    report = posture_report.posture_report(keypoint_dict(standing(40)), profile=profile)
+    assert keys <= set(report)
+    brief = posture_report.posture_report(keypoint_dict(standing(40)), detail="scores", profile=profile)
+    assert set(brief) == {"metrics", "posture_score", "grade", "grade_color"}
+    assert brief["posture_score"] == report["posture_score"] < 100
+
+
+@pytest.mark.parametrize("profile", ["app", "enhanced", "professional"])
+def test_score_keypoints_matches_posture_report(profile):
+    kpts = np.stack([standing(), standing(40)])
+    batch = posture_report_batch(kpts, profile=profile)
+    results = posture_report.score_keypoints(kpts, profile=profile)
+    for i, result in enumerate(results):
+        assert result["detected"] and result["keypoints"] == keypoint_dict(kpts[i])
+        assert result["posture_score"] == batch.report(i)["posture_score"]
+        assert result["grade"] == posture_report.posture_report(keypoint_dict(kpts[i]), profile=profile)["grade"]
+
+
+def test_bound_report_pickles_by_reference():
+    # What the apps hand the report process pool: no reference to an app module
+    bound = functools.partial(posture_report.posture_report, profile="app")
+    data = pickle.dumps(bound)
+    assert b"posture_report" in data and b"app_" not in data
+    assert pickle.loads(data)(keypoint_dict(standing()))["posture_score"] == 100
@@ -0,0 +1,54 @@
+import pytest
+
+from posture_rollups import PostureRollups
+from posture_rules import RuleSet, load_rules
+
+RULES = load_rules()
+
+
+def report(score, head_tilt=None, shoulder_drop=None, left_knee=None):
+    return {"posture_score": score, "metrics": {
+        "head_tilt_deg": head_tilt, "shoulder_drop_px": shoulder_drop, "left_knee_angle_deg": left_knee}}
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    r = PostureRollups(str(tmp_path / "rollups.db"), flush_s=3600, max_gap_s=60, rules=RULES)
+    yield r
+    r.close()
+
+
+def test_thresholds_come_from_the_rule_table(rollups):
+    assert rollups.status()["thresholds"] == (
+        "posture_score<60,head_tilt_deg>10,torso_lean_deg>8,|shoulder_drop_px|>15,|pelvic_drop_px|>15,"
+        "left_knee_angle_deg<170,right_knee_angle_deg<170")
+
+
+def test_time_past_thresholds(rollups):
+    frames = [report(95, 5, 2, 178), report(55, 11, -20, 160), report(80, 9, 16, 175), report(50, None, 0, 169)]
+    for i, r in enumerate(frames):
+        rollups.add(r, session_id="s", t=1000.0 + 60 * i)
+    summary = rollups.summary("session", "s")
+    metrics = summary["metrics"]
+    assert summary["frames"] == 4
+    # Frames after the first last one minute each
+    assert metrics["posture_score"]["minutes_over_threshold"] == 2
+    assert metrics["head_tilt_deg"]["minutes_over_threshold"] == 1
+    assert metrics["shoulder_drop_px"]["minutes_over_threshold"] == 2
+    assert metrics["left_knee_angle_deg"]["minutes_over_threshold"] == 2
+    assert metrics["head_tilt_deg"]["count"] == 3
+
+
+def test_thresholds_follow_a_custom_table(tmp_path):
+    data = {
+        "limits": {"head_tilt": {"metric": "head_tilt_deg", "value": 20}},
+        "checks": {"head_tilt": {"limit": "head_tilt"}},
+        "grades": [{"name": "Good", "min_score": 50, "color": "green"},
+                   {"name": "Bad", "min_score": 0, "color": "red"}],
+        "profiles": {"p": {"rules": [{"check": "head_tilt"}]}},
+    }
+    r = PostureRollups(str(tmp_path / "rollups.db"), flush_s=3600, rules=RuleSet(data))
+    try:
+        assert r.status()["thresholds"] == "posture_score<50,head_tilt_deg>20"
+    finally:
+        r.close()
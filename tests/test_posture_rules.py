@@ -0,0 +1,97 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from posture_rules import METRIC_NAMES, RULES_PATH, RuleBook, RuleError, RuleSet, load_rules
+from smoothing import SessionSmoother
+
+RULES = load_rules()
+
+UPRIGHT = dict(zip(METRIC_NAMES, [3.0, 2.0, 4.0, -3.0, 178.0, 176.0]))
+SLOUCHED = dict(zip(METRIC_NAMES, [22.0, 13.0, -30.0, 18.0, 155.0, 165.0]))
+PARTIAL = dict(zip(METRIC_NAMES, [16.0, None, 4.0, None, None, 150.0]))
+
+
+def test_upright_pose_is_excellent():
+    verdict = RULES.evaluate("enhanced", UPRIGHT, body_height=150, shoulder_width=100)
+    assert (verdict.score, verdict.grade) == (100, "Excellent")
+    assert verdict.lines == {"tips": []}
+
+
+def test_penalty_and_severity_band():
+    metrics = dict(UPRIGHT, head_tilt_deg=16.0)
+    verdict = RULES.evaluate("enhanced", metrics, body_height=150, shoulder_width=100)
+    # 100 - 1.5 * 16, past the 15 band but not the 20 one
+    assert (verdict.score, verdict.grade) == (76, "Good")
+    assert len(verdict.lines["tips"]) == 1 and "moderate" in verdict.lines["tips"][0]
+
+
+def test_tall_and_shoulder_width_limits():
+    verdict = RULES.evaluate("enhanced", UPRIGHT, body_height=250, shoulder_width=300)
+    assert verdict.limits["head_tilt"] == 12
+    assert verdict.limits["shoulder_drop"] == pytest.approx(300 * 0.08)
+    assert "left_knee" not in verdict.thresholds
+
+
+def test_grade_steps():
+    assert [RULES.grade(s)[0] for s in (100, 90, 89, 75, 60, 59, 0)] == [
+        "Excellent", "Excellent", "Good", "Good", "Fair", "Needs Improvement", "Needs Improvement"]
+
+
+def test_profile_gates_cover_every_keypoint():
+    for profile in RULES.profiles.values():
+        assert len(profile.gates) == 17
+        assert list(profile.gates.values()) == profile.min_conf.tolist()
+
+
+@pytest.mark.parametrize("profile", sorted(RULES.profiles))
+def test_evaluate_batch_matches_evaluate(profile):
+    poses = [UPRIGHT, SLOUCHED, PARTIAL]
+    metrics = np.array([[np.nan if m[name] is None else m[name] for name in METRIC_NAMES] for m in poses])
+    heights = np.array([150.0, 250.0, np.nan])
+    widths = np.array([100.0, 300.0, np.nan])
+    score, grade_code, limits, flagged, bucket = RULES.evaluate_batch(profile, metrics, heights, widths)
+    prof = RULES.profiles[profile]
+    for i, m in enumerate(poses):
+        height = None if np.isnan(heights[i]) else heights[i]
+        width = None if np.isnan(widths[i]) else widths[i]
+        verdict = RULES.evaluate(profile, m, body_height=height, shoulder_width=width)
+        assert score[i] == verdict.score
+        assert RULES.grades[grade_code[i]][0] == verdict.grade
+        xs = [m[METRIC_NAMES[j]] for j in prof.metric_idx]
+        assert RULES.render(prof, xs, flagged[i], bucket[i]) == verdict.lines
+
+
+def test_smoother_hysteresis_keeps_a_flag_until_clear():
+    smoother = SessionSmoother()
+    flagged = []
+    for tilt in (11.0, 9.0, 7.5):
+        metrics = dict(UPRIGHT, head_tilt_deg=tilt)
+        verdict = RULES.evaluate("enhanced", metrics, body_height=150, shoulder_width=100, smoother=smoother)
+        flagged.append(bool(verdict.lines["tips"]))
+    # 9 is inside the limit of 10 but not back past 10 - 2
+    assert flagged == [True, True, False]
+
+
+def test_invalid_table_is_rejected():
+    with pytest.raises(RuleError):
+        RuleSet({"grades": [{"name": "Excellent", "min_score": 90, "color": "green"}],
+                 "profiles": {"app": {"rules": [{"check": "missing"}]}}})
+
+
+def test_rulebook_reloads_and_keeps_previous_on_error(tmp_path, capsys):
+    path = tmp_path / "posture_rules.toml"
+    shutil.copy(RULES_PATH, path)
+    book = RuleBook(str(path), reload_s=1e-6)
+    first = book.current()
+
+    text = path.read_text(encoding="utf-8")
+    path.write_text(text.replace("tall_px = 200", "tall_px = 180.0"), encoding="utf-8")
+    assert book.current().tall_px == 180
+    assert book.reloads == 1
+
+    path.write_text(text + "\n[broken\n", encoding="utf-8")
+    assert book.current().tall_px == 180
+    assert book.last_error and "Keeping previous posture rules" in capsys.readouterr().out
+    assert first.digest != book.current().digest
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import result_cache
+from result_cache import ResultCache
+
+
+def test_key_depends_on_bytes_namespace_and_variant():
+    cache = ResultCache("yolov8n-pose.pt|conf=0.25")
+    key = cache.key(b"jpeg")
+    assert key == cache.key(b"jpeg")
+    assert key != cache.key(b"jpeg!")
+    assert key != cache.key(b"jpeg", variant="yolov8s-pose.pt")
+    assert key != ResultCache("yolov8s-pose.pt|conf=0.25").key(b"jpeg")
+    assert len(key) == 32
+
+
+def test_key_without_xxhash(monkeypatch):
+    cache = ResultCache("ns")
+    monkeypatch.setattr(result_cache, "xxhash", None)
+    assert cache.key(b"a") == cache.key(b"a") != cache.key(b"b")
+
+
+def test_lru_eviction():
+    cache = ResultCache("ns", max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 3, 1)
+
+
+def test_ttl_expiry(monkeypatch):
+    cache = ResultCache("ns", ttl=10)
+    now = time.monotonic()
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now)
+    cache.put("a", 1)
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now + 11)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    cache = ResultCache("ns", disk_dir=str(tmp_path))
+    key = cache.key(b"jpeg")
+    cache.put(key, {"posture_score": 90})
+    deadline = time.monotonic() + 5
+    while not (tmp_path / key[:2] / f"{key}.json").exists():
+        assert time.monotonic() < deadline, "disk write never landed"
+        time.sleep(0.01)
+
+    fresh = ResultCache("ns", disk_dir=str(tmp_path))
+
+    async def run(fn, *args):
+        return fn(*args)
+
+    assert asyncio.run(fresh.lookup(key, run)) == {"posture_score": 90}
+    assert fresh.disk_hits == 1
+    # Promoted to the memory tier
+    assert fresh.get(key) == {"posture_score": 90} and fresh.hits == 1
+
+
+@pytest.mark.parametrize("disk", [False, True])
+def test_lookup_miss(tmp_path, disk):
+    cache = ResultCache("ns", disk_dir=str(tmp_path) if disk else "")
+
+    async def run(fn, *args):
+        return fn(*args)
+
+    assert asyncio.run(cache.lookup("0" * 32, run)) is None
+    assert cache.misses == 1
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from smoothing import MIN_TRACK_CONF, SessionSmoother, SmootherRegistry
+
+
+def row(x, y=100.0, conf=0.9):
+    kpts = np.zeros((17, 3), np.float32)
+    kpts[:, 0] = x
+    kpts[:, 1] = y
+    kpts[:, 2] = conf
+    return kpts
+
+
+def test_first_frame_passes_through():
+    out = SessionSmoother().filter_array(row(50.0), t=0.0)
+    np.testing.assert_array_equal(out, row(50.0))
+
+
+def test_one_euro_damps_jitter():
+    smoother = SessionSmoother()
+    smoother.filter_array(row(100.0), t=0.0)
+    out = smoother.filter_array(row(104.0), t=1 / 30)
+    assert 100.0 < out[0, 0] < 104.0
+    assert out[0, 2] == pytest.approx(0.9)
+
+
+def test_low_confidence_points_reset_the_filter():
+    smoother = SessionSmoother()
+    smoother.filter_array(row(100.0), t=0.0)
+    kpts = row(140.0)
+    kpts[3, 2] = MIN_TRACK_CONF / 2
+    out = smoother.filter_array(kpts, t=1 / 30)
+    assert out[3, 0] == 140.0
+    assert out[0, 0] < 140.0
+    # Tracked again from the raw point on the next frame
+    assert smoother.filter_array(row(140.0), t=2 / 30)[3, 0] == 140.0
+
+
+def test_metric_ema_and_reset():
+    smoother = SessionSmoother()
+    assert smoother.smooth_metrics(10.0, None, 0, 0, 0, 0)[:2] == (10.0, None)
+    head, torso = smoother.smooth_metrics(20.0, 5.0, 0, 0, 0, 0)[:2]
+    assert 10.0 < head < 20.0 and torso == 5.0
+
+
+def test_threshold_hysteresis():
+    smoother = SessionSmoother()
+    assert smoother.threshold("head_tilt", 11.0, 10.0, 2.0) == 10.0
+    # Flagged: must come back past 10 - 2 to clear
+    assert smoother.threshold("head_tilt", 9.0, 10.0, 2.0) == 8.0
+    assert smoother.threshold("head_tilt", 7.0, 10.0, 2.0) == 8.0
+    assert smoother.threshold("head_tilt", 9.0, 10.0, 2.0) == 10.0
+
+
+def test_threshold_hysteresis_below_and_missing():
+    smoother = SessionSmoother()
+    smoother.threshold("left_knee", 160.0, 170.0, 3.0, below=True)
+    assert smoother.threshold("left_knee", 171.0, 170.0, 3.0, below=True) == 173.0
+    smoother.threshold("left_knee", None, 170.0, 3.0, below=True)
+    assert smoother.threshold("left_knee", 171.0, 170.0, 3.0, below=True) == 170.0
+
+
+def test_registry_is_an_lru():
+    registry = SmootherRegistry(max_sessions=2)
+    a = registry.get("a")
+    registry.get("b")
+    assert registry.get("a") is a
+    registry.get("c")
+    assert list(registry.sessions) == ["a", "c"]
+    registry.forget("a")
+    assert registry.get("a") is not a
@@ -0,0 +1,75 @@
+"""Per-session temporal tracking so streams skip most full-frame detections.
+
+A seated worker barely moves between consecutive frames. Once a person has
+been found, the next frames run pose on a crop around their previous box at a
+reduced inference size. Full-frame detection runs every ``full_every`` frames
+and whenever tracking is lost. Session state lives in a bounded LRU.
+"""
+import os
+from collections import OrderedDict
+
+TRACK_FULL_EVERY = int(os.environ.get("ERGOWISE_TRACK_FULL_EVERY", "10"))
+TRACK_MAX_SESSIONS = int(os.environ.get("ERGOWISE_TRACK_MAX_SESSIONS", "1024"))
+# Fraction of the previous box size added on every side of the crop
+TRACK_MARGIN = float(os.environ.get("ERGOWISE_TRACK_MARGIN", "0.25"))
+# Inference size used for crops (full frames keep the model default)
+TRACK_IMGSZ = int(os.environ.get("ERGOWISE_TRACK_IMGSZ", "320"))
+
+
+class TrackState:
+    __slots__ = ("box", "since_full")
+
+    def __init__(self):
+        self.box = None
+        self.since_full = 0
+
+
+class PoseTracker:
+    """LRU of per-session person boxes used to plan crop-only inference"""
+
+    def __init__(self, full_every=TRACK_FULL_EVERY, max_sessions=TRACK_MAX_SESSIONS, margin=TRACK_MARGIN, imgsz=TRACK_IMGSZ):
+        self.full_every = max(1, int(full_every))
+        self.max_sessions = max(1, int(max_sessions))
+        self.margin = margin
+        self.imgsz = imgsz
+        self.sessions = OrderedDict()
+
+    def region(self, session_id, shape):
+        """Crop (x1, y1, x2, y2) to run pose on, or None when a full detection is due"""
+        state = self.sessions.get(session_id)
+        if state is None:
+            return None
+        self.sessions.move_to_end(session_id)
+        if state.box is None or state.since_full >= self.full_every:
+            return None
+
+        h, w = shape[:2]
+        x1, y1, x2, y2 = state.box
+        pad_x = (x2 - x1) * self.margin
+        pad_y = (y2 - y1) * self.margin
+        x1 = max(0, int(x1 - pad_x)); y1 = max(0, int(y1 - pad_y))
+        x2 = min(w, int(x2 + pad_x + 1)); y2 = min(h, int(y2 + pad_y + 1))
+        if x2 - x1 < 16 or y2 - y1 < 16:
+            return None
+        return x1, y1, x2, y2
+
+    def update(self, session_id, box, full):
+        """Record this frame's best box (None = person lost, forces a full pass)"""
+        state = self.sessions.get(session_id)
+        if state is None:
+            state = self.sessions[session_id] = TrackState()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+
+        state.box = None if box is None else tuple(float(v) for v in box)
+        state.since_full = 0 if full else state.since_full + 1
+
+    def box(self, session_id):
+        """Last known person box for the session, or None"""
+        state = self.sessions.get(session_id)
+        return None if state is None else state.box
+
+    def forget(self, session_id):
+        self.sessions.pop(session_id, None)